@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+# File holding cached Ghostwriter tokens, keyed by endpoint URL and username
+TOKEN_CACHE_PATH = Path(__file__).parent / "config/token_cache.json"
+
+# Cached tokens are not reused within this long of their expiry
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Hasura error codes returned for malformed or expired tokens
+AUTH_ERROR_CODES = ("invalid-jwt", "invalid-headers")
+
+# Class definitions
+class TokenRefresher:
+    """
+    TokenRefresher holds the Ghostwriter token used by an upload and replaces it when
+    Ghostwriter rejects it. Requests read the current token through extra_args, so a
+    refreshed token is picked up by every request sent after the refresh. Concurrent
+    requests rejected with the same token trigger a single login.
+    """
+
+    def __init__(self, token, login):
+        """
+        @param token - the Ghostwriter token to start with
+        @param login - a callable that logs in again and returns a new token
+        """
+        self.token = token
+        self.login = login
+        self.lock = threading.Lock()
+
+    def extra_args(self):
+        """
+        extra_args returns the transport arguments that authenticate a request
+
+        @return extra_args - the per-request arguments passed to the gql transport
+        """
+        return {"headers": {"Authorization": f"Bearer {self.token}"}}
+
+    def refresh(self, rejected_token):
+        """
+        refresh logs in again, unless another request already replaced the rejected token
+
+        @param rejected_token - the token Ghostwriter rejected
+        @return token - the current token
+        """
+        with self.lock:
+            if self.token == rejected_token:
+                print("Token Rejected: Logging in again")
+                self.token = self.login()
+        return self.token
+
+    async def refresh_async(self, rejected_token):
+        """
+        refresh_async runs refresh in a worker thread, so the login does not block the event loop
+
+        @param rejected_token - the token Ghostwriter rejected
+        @return token - the current token
+        """
+        return await asyncio.to_thread(self.refresh, rejected_token)
+
+# Function definitions
+def is_auth_error(error):
+    """
+    is_auth_error checks whether a transport error means Ghostwriter rejected the token
+
+    @param error - the exception raised by the gql transport
+    @return bool - True if the request should be retried with a new token
+    """
+    if isinstance(error, TransportServerError):
+        return error.code == 401
+    if isinstance(error, TransportQueryError) and error.errors:
+        return error.errors[0].get("extensions", {}).get("code") in AUTH_ERROR_CODES
+    return False
+
+def load_cached_token(url, username):
+    """
+    load_cached_token returns a cached token for a Ghostwriter user, if it does not expire
+    within TOKEN_REFRESH_MARGIN
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param username - the Ghostwriter username
+    @return token - the cached token, or None
+    """
+    cached = read_token_cache().get(token_cache_key(url, username))
+    if not cached:
+        return None
+
+    try:
+        expires = parse_expiry(cached["expires"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if expires - TOKEN_REFRESH_MARGIN <= datetime.now(timezone.utc):
+        return None
+    return cached["token"]
+
+def save_cached_token(url, username, token, expires):
+    """
+    save_cached_token stores a token for a Ghostwriter user along with its expiry
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param username - the Ghostwriter username
+    @param token - the token returned by the login mutation
+    @param expires - the expiry returned by the login mutation
+    """
+    tokens = read_token_cache()
+    tokens[token_cache_key(url, username)] = {"token": token, "expires": expires}
+    write_token_cache(tokens)
+
+def invalidate_cached_token(url, username):
+    """
+    invalidate_cached_token removes the cached token for a Ghostwriter user
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param username - the Ghostwriter username
+    """
+    tokens = read_token_cache()
+    if tokens.pop(token_cache_key(url, username), None) is not None:
+        write_token_cache(tokens)
+
+def parse_expiry(expires):
+    """
+    parse_expiry converts the expiry returned by the login mutation to an aware datetime.
+    Expiries without a timezone are treated as UTC.
+
+    @param expires - an ISO 8601 timestamp
+    @return expires - the expiry as a timezone-aware datetime
+    """
+    expires = datetime.fromisoformat(expires)
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return expires
+
+def token_cache_key(url, username):
+    """
+    token_cache_key identifies a Ghostwriter user on an endpoint, without storing the username
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param username - the Ghostwriter username
+    @return key - the cache key
+    """
+    return hashlib.sha256(f"{url}|{username}".encode("utf-8")).hexdigest()
+
+def read_token_cache():
+    """
+    read_token_cache reads every cached token
+
+    @return tokens - a dictionary of cache keys to token records
+    """
+    try:
+        with TOKEN_CACHE_PATH.open() as cache_file:
+            return json.load(cache_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_token_cache(tokens):
+    """
+    write_token_cache replaces the token cache, readable only by the current user
+
+    @param tokens - a dictionary of cache keys to token records
+    """
+    TOKEN_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = TOKEN_CACHE_PATH.with_suffix(".tmp")
+    file_descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "w") as cache_file:
+        json.dump(tokens, cache_file)
+    temporary_path.replace(TOKEN_CACHE_PATH)
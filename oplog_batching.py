@@ -0,0 +1,279 @@
+import asyncio
+import json
+import random
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import aiohttp
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+import oplog_checkpoint
+
+# Actions returned by plan_retry
+RETRY = "retry"
+SPLIT = "split"
+REJECT = "reject"
+
+# Exceptions an insert may raise that classify_failure knows how to retry
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    asyncio.TimeoutError,
+    TransportQueryError,
+    TransportServerError,
+    aiohttp.ClientError
+)
+
+# Failure classes returned by classify_failure
+SIZE_FAILURE = "size"
+TRANSIENT_FAILURE = "transient"
+ROW_FAILURE = "row"
+
+# HTTP statuses meaning the request was too large or too slow for the server or a proxy
+SIZE_FAILURE_STATUSES = (408, 413, 504)
+
+# HTTP statuses meaning the server is briefly unavailable
+TRANSIENT_FAILURE_STATUSES = (429, 500, 502, 503)
+
+# Hasura error codes raised by the data in one or more rows
+ROW_FAILURE_CODES = ("data-exception", "constraint-violation", "constraint-error")
+
+# Fraction of a payload limit learned from a 413 that later batches aim for
+PAYLOAD_HEADROOM = 0.8
+
+# Weight given to the newest observation in the per-row latency and size averages
+SMOOTHING = 0.3
+
+# Class definitions
+@dataclass
+class BatchingConfig:
+    """BatchingConfig objects represent batch sizing and retry configs"""
+    adaptive: bool = True
+    min_batch_size: int = 50
+    max_batch_size: int = 5000
+    target_latency: float = 2.0
+    max_payload_bytes: int = 0
+    max_retries: int = 5
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+
+class BatchSizer:
+    """
+    BatchSizer picks the size of the next batch read from the CSV. After every successful
+    insert, it estimates the per-row latency and payload size, and moves the batch size
+    towards the number of rows that fits within the target latency and any payload limit
+    learned from a 413 response, at most doubling it at a time. After a failure caused by
+    the size of a batch, it halves the batch size.
+
+    With adaptive sizing disabled, the batch size stays fixed, but failed batches are still
+    split and retried.
+    """
+
+    def __init__(self, batch_size, config=None):
+        """
+        @param batch_size - the size of the first batch
+        @param config - the BatchingConfig to apply, or None for the defaults
+        """
+        self.config = config or BatchingConfig()
+        self.batch_size = batch_size
+        self.payload_limit = self.config.max_payload_bytes or None
+        self.row_latency = None
+        self.row_bytes = None
+        self.failures = 0
+
+    def observe(self, entries, latency):
+        """
+        observe records a successful insert and adjusts the batch size
+
+        @param entries - the entries inserted
+        @param latency - the seconds the insert took
+        """
+        self.failures = 0
+        if not self.config.adaptive:
+            return
+
+        rows = len(entries)
+        self.row_latency = smooth(self.row_latency, latency / rows)
+        self.row_bytes = smooth(self.row_bytes, payload_size(entries) / rows)
+
+        batch_size = self.config.target_latency / max(self.row_latency, 1e-9)
+        if self.payload_limit:
+            batch_size = min(batch_size, self.payload_limit * PAYLOAD_HEADROOM / self.row_bytes)
+        batch_size = min(batch_size, self.batch_size * 2)
+
+        self.batch_size = self.clamp(int(batch_size))
+
+    def shrink(self, entries, status=None):
+        """
+        shrink records an insert that failed because of its size and halves the batch size.
+        A 413 response also lowers the payload limit to the size of the rejected request.
+
+        @param entries - the entries in the failed insert
+        @param status - the HTTP status of the failure, if there was one
+        """
+        if status == 413:
+            payload_bytes = payload_size(entries)
+            self.payload_limit = min(self.payload_limit or payload_bytes, payload_bytes)
+        if self.config.adaptive:
+            self.batch_size = self.clamp(min(self.batch_size, len(entries) // 2))
+
+    def backoff(self):
+        """
+        backoff records a failure and returns how long to wait before the next attempt.
+        The delay doubles with every consecutive failure, up to max_backoff, with jitter
+        so concurrent batches do not retry in lockstep.
+
+        @return delay - the seconds to wait
+        """
+        self.failures += 1
+        delay = min(self.config.max_backoff, self.config.backoff * 2 ** (self.failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def clamp(self, batch_size):
+        return max(self.config.min_batch_size, min(self.config.max_batch_size, batch_size))
+
+class RejectFile:
+    """
+    RejectFile collects oplog entries Ghostwriter refused to insert on their own. It is a
+    JSON Lines file stored next to the CSV, holding one record per rejected entry: its
+    batch, entry_identifier, the error, and the serialized entry.
+    """
+
+    def __init__(self, path):
+        """
+        @param path - the path of the reject file
+        """
+        self.path = Path(path)
+        self.rejected = 0
+
+    def write(self, batch, entry_identifier, entry, error):
+        """
+        write appends a rejected entry to the reject file and flushes it to disk
+
+        @param batch - the OplogBatch the entry belonged to
+        @param entry_identifier - the entry_identifier of the entry
+        @param entry - the serialized oplogEntry_insert_input dictionary, or its JSON text
+        @param error - the exception Ghostwriter's response raised
+        """
+        if isinstance(entry, str):
+            entry = json.loads(entry)
+        self.rejected += 1
+        print(f"Entry Rejected: {entry_identifier} in batch {batch.index}: {error}")
+        oplog_checkpoint.write_journal_line(self.path, {
+            "batch": batch.index,
+            "entry_identifier": entry_identifier,
+            "error": str(error),
+            "entry": entry
+        })
+
+    def clear(self):
+        """
+        clear removes the reject file left by a previous import
+        """
+        self.path.unlink(missing_ok=True)
+
+# Function definitions
+def reject_path(csv_path):
+    """
+    reject_path returns the location of the reject file for a CSV
+
+    @param csv_path - the path of the oplog CSV
+    @return path - the path of the reject file
+    """
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + ".rejects")
+
+def plan_retry(batch_sizer, error, entries, attempts):
+    """
+    plan_retry decides what to do with entries whose insert failed:
+
+    RETRY - wait, then resend the entries as they are
+    SPLIT - wait, then resend each half of the entries separately
+    REJECT - give up on a single entry Ghostwriter will not accept
+
+    Transient failures are retried up to max_retries times. Failures caused by the size
+    of a request split it until the halves succeed, and failures caused by the data in
+    a row split it until that row is isolated.
+
+    @param batch_sizer - the BatchSizer to update
+    @param error - the exception raised while sending the entries
+    @param entries - the entries that failed
+    @param attempts - the number of times these entries have failed, including this time
+    @return (action, delay) - the action and the seconds to wait, or None if the error
+                              should be raised
+    """
+    failure = classify_failure(error)
+    max_retries = batch_sizer.config.max_retries
+
+    if failure == TRANSIENT_FAILURE:
+        if attempts > max_retries:
+            return None
+        return RETRY, batch_sizer.backoff()
+
+    if failure == SIZE_FAILURE:
+        status = getattr(error, "code", None)
+        batch_sizer.shrink(entries, status)
+        if len(entries) > 1:
+            return SPLIT, batch_sizer.backoff()
+        if status == 413 or attempts > max_retries:
+            return REJECT, 0
+        return RETRY, batch_sizer.backoff()
+
+    if failure == ROW_FAILURE:
+        return (SPLIT, 0) if len(entries) > 1 else (REJECT, 0)
+
+    return None
+
+def classify_failure(error):
+    """
+    classify_failure decides how a failed insert should be retried:
+
+    SIZE_FAILURE - the request timed out or was too large; split it in half and back off
+    TRANSIENT_FAILURE - the server is briefly unavailable; back off and resend it as is
+    ROW_FAILURE - Ghostwriter refused the data in some row; split it to find the row
+
+    @param error - the exception raised while sending the insert
+    @return failure - one of the failure classes, or None if the error should not be retried
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return SIZE_FAILURE
+    if isinstance(error, TransportServerError):
+        if error.code in SIZE_FAILURE_STATUSES:
+            return SIZE_FAILURE
+        if error.code in TRANSIENT_FAILURE_STATUSES:
+            return TRANSIENT_FAILURE
+        return None
+    if isinstance(error, TransportQueryError) and error.errors:
+        first_error = error.errors[0]
+        if "statement timeout" in str(first_error.get("message", "")):
+            return SIZE_FAILURE
+        if first_error.get("extensions", {}).get("code") in ROW_FAILURE_CODES:
+            return ROW_FAILURE
+        return None
+    if isinstance(error, aiohttp.ClientError):
+        return TRANSIENT_FAILURE
+    return None
+
+def payload_size(entries):
+    """
+    payload_size measures the serialized size of a list of entries
+
+    @param entries - a list of oplogEntry_insert_input dictionaries, or of JSON object
+                     strings already encoded for a RawGraphQLSession
+    @return bytes - the length of the entries' JSON encoding
+    """
+    if entries and isinstance(entries[0], str):
+        return sum(map(len, entries)) + len(entries) + 1
+    return len(json.dumps(entries))
+
+def smooth(average, value):
+    """
+    smooth folds a new observation into an exponentially weighted moving average
+
+    @param average - the current average, or None if there is none yet
+    @param value - the new observation
+    @return average - the updated average
+    """
+    if average is None:
+        return value
+    return SMOOTHING * value + (1 - SMOOTHING) * average
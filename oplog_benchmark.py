@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from gql import Client
+from gql.transport.aiohttp import AIOHTTPTransport
+
+import oplog_batching
+import oplog_generator
+import oplog_populate
+import oplog_transport
+
+# Batch sizes are swept explicitly, so they are not tuned while populating
+FIXED_BATCHING = oplog_batching.BatchingConfig(adaptive=False)
+
+# Default sweep
+ROW_COUNTS = [10000, 100000]
+BATCH_SIZES = [500, 2000]
+CONCURRENCY_LEVELS = [1, 4]
+TRANSPORTS = [oplog_populate.TRANSPORT_GQL, oplog_populate.TRANSPORT_RAW]
+
+# Class definitions
+class StubServer:
+    """
+    StubServer is a stand-in GraphQL endpoint that answers insert_oplogEntry mutations
+    with sequential IDs, without storing anything. It runs its own event loop in a
+    background thread and counts the requests and request body bytes it receives.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        @param latency - seconds to wait before answering each request
+        """
+        self.latency = latency
+        self.requests = 0
+        self.bytes_received = 0
+        self.next_id = 1
+        self.url = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+
+    def start(self):
+        """
+        start binds the server to a free local port and starts answering requests
+
+        @return url - the GraphQL endpoint of the server
+        """
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result()
+        return self.url
+
+    def stop(self):
+        """
+        stop shuts down the server and its event loop
+        """
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def counters(self):
+        """
+        counters returns the number of requests and request body bytes received so far
+
+        @return (requests, bytes_received) - the current counters
+        """
+        return self.requests, self.bytes_received
+
+    async def serve(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/v1/graphql", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/v1/graphql"
+
+    async def handle(self, request):
+        body = await request.read()
+        self.requests += 1
+        self.bytes_received += len(body)
+
+        payload = json.loads(body)
+        objects = (payload.get("variables") or {}).get("objects", [])
+        first_id = self.next_id
+        self.next_id += len(objects)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return web.json_response({
+            "data": {
+                "insert_oplogEntry": {
+                    "returning": [{"id": first_id + index} for index in range(len(objects))]
+                }
+            }
+        })
+
+class TimedClient:
+    """
+    TimedClient wraps a gql Client and records the latency of every execute call
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.latencies = []
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.client.execute(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+class TimedSession:
+    """
+    TimedSession wraps a gql async session and records the latency of every execute call
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.latencies = []
+
+    async def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.session.execute(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+# Function definitions
+def run_benchmarks(
+    row_counts,
+    batch_sizes,
+    concurrency_levels,
+    latency=0.0,
+    seed=1,
+    transports=TRANSPORTS
+):
+    """
+    run_benchmarks generates a fixture for every row count, then sweeps every batch size,
+    concurrency level, and transport against a local StubServer. Each populate run happens
+    in a fresh process, so its peak RSS is not inflated by earlier runs, and its CPU time
+    only covers the client.
+
+    @param row_counts - the fixture sizes to benchmark
+    @param batch_sizes - the batch sizes to benchmark
+    @param concurrency_levels - the concurrency levels to benchmark
+    @param latency - seconds the stub server waits before answering each request
+    @param seed - the seed used to generate fixtures
+    @param transports - the populate transports to benchmark
+    @return report - a JSON-serializable benchmark report
+    """
+
+    server = StubServer(latency)
+    url = server.start()
+    results = []
+
+    try:
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            for rows in row_counts:
+                csv_path = Path(temporary_directory) / f"oplog_{rows}.csv"
+
+                results.append(benchmark_generate(csv_path, rows, seed))
+                results.append(benchmark_validate(csv_path, rows))
+
+                sweep = [
+                    (batch_size, concurrency, transport)
+                    for batch_size in batch_sizes
+                    for concurrency in concurrency_levels
+                    for transport in transports
+                ]
+                for batch_size, concurrency, transport in sweep:
+                    requests_before, bytes_before = server.counters()
+                    result = run_isolated(
+                        benchmark_populate,
+                        url,
+                        csv_path,
+                        rows,
+                        batch_size,
+                        concurrency,
+                        transport
+                    )
+                    requests_after, bytes_after = server.counters()
+                    result["requests"] = requests_after - requests_before
+                    result["bytes_sent"] = bytes_after - bytes_before
+                    results.append(result)
+                    print(
+                        f"populate rows={rows} batch_size={batch_size} "
+                        f"concurrency={concurrency} transport={transport}: "
+                        f"{result['rows_per_second']:,.0f} rows/sec, "
+                        f"{result['cpu_us_per_row']:.1f} CPU us/row"
+                    )
+    finally:
+        server.stop()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stub_latency": latency,
+        "results": results
+    }
+
+def benchmark_generate(csv_path, rows, seed):
+    """
+    benchmark_generate times oplog_generator.generate_oplog creating a fixture
+
+    @param csv_path - the fixture to create
+    @param rows - the number of entries to generate
+    @param seed - the seed used to generate the fixture
+    @return result - the benchmark result
+    """
+    start = time.perf_counter()
+    oplog_generator.generate_oplog(csv_path, rows, seed=seed)
+    elapsed = time.perf_counter() - start
+
+    print(f"generate rows={rows}: {rows / elapsed:,.0f} rows/sec")
+    return {
+        "benchmark": "generate_oplog",
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed,
+        "bytes_written": csv_path.stat().st_size
+    }
+
+def benchmark_validate(csv_path, rows):
+    """
+    benchmark_validate times oplog_populate.validate_oplog_entry over every row of a fixture
+
+    @param csv_path - the fixture to read
+    @param rows - the number of entries in the fixture
+    @return result - the benchmark result
+    """
+    with csv_path.open(newline="") as csv_file:
+        oplog_entries = list(csv.DictReader(csv_file))
+
+    start = time.perf_counter()
+    for oplog_entry in oplog_entries:
+        oplog_populate.validate_oplog_entry(oplog_entry)
+    elapsed = time.perf_counter() - start
+
+    print(f"validate rows={rows}: {rows / elapsed:,.0f} rows/sec")
+    return {
+        "benchmark": "validate_oplog_entry",
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed
+    }
+
+def benchmark_populate(url, csv_path, rows, batch_size, concurrency, transport):
+    """
+    benchmark_populate times populating an oplog from a fixture. With the gql transport, a
+    concurrency of 1 uses populate_oplog, and higher levels use populate_oplog_async over
+    one async session. The raw transport always uses populate_oplog_async over a
+    RawGraphQLSession.
+
+    @param url - the GraphQL endpoint to populate
+    @param csv_path - the fixture to read
+    @param rows - the number of entries in the fixture
+    @param batch_size - the number of entries per insert mutation
+    @param concurrency - the maximum number of insert mutations in flight
+    @param transport - TRANSPORT_GQL or TRANSPORT_RAW
+    @return result - the benchmark result
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if transport == oplog_populate.TRANSPORT_RAW:
+            latencies = asyncio.run(
+                populate_raw(url, csv_path, batch_size, concurrency)
+            )
+        elif concurrency > 1:
+            latencies = asyncio.run(
+                populate_async(url, csv_path, batch_size, concurrency)
+            )
+        else:
+            timed_client = TimedClient(Client(transport=AIOHTTPTransport(url)))
+            oplog_populate.populate_oplog(
+                timed_client,
+                1,
+                batch_size,
+                csv_path=csv_path,
+                batching_configs=FIXED_BATCHING
+            )
+            latencies = timed_client.latencies
+        elapsed = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+
+    synchronous = concurrency == 1 and transport == oplog_populate.TRANSPORT_GQL
+    return {
+        "benchmark": "populate_oplog" if synchronous else "populate_oplog_async",
+        "rows": rows,
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "transport": transport,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed,
+        "cpu_seconds": cpu_seconds,
+        "cpu_us_per_row": cpu_seconds / rows * 1e6,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+async def populate_async(url, csv_path, batch_size, concurrency):
+    """
+    populate_async populates an oplog from a fixture over one async session
+
+    @param url - the GraphQL endpoint to populate
+    @param csv_path - the fixture to read
+    @param batch_size - the number of entries per insert mutation
+    @param concurrency - the maximum number of insert mutations in flight
+    @return latencies - the latency of every insert mutation, in seconds
+    """
+    transport = AIOHTTPTransport(
+        url,
+        client_session_args={"connector": aiohttp.TCPConnector(limit=concurrency)}
+    )
+    async with Client(transport=transport) as session:
+        timed_session = TimedSession(session)
+        await oplog_populate.populate_oplog_async(
+            timed_session,
+            1,
+            batch_size,
+            concurrency,
+            csv_path=csv_path,
+            batching_configs=FIXED_BATCHING
+        )
+    return timed_session.latencies
+
+async def populate_raw(url, csv_path, batch_size, concurrency):
+    """
+    populate_raw populates an oplog from a fixture over a RawGraphQLSession
+
+    @param url - the GraphQL endpoint to populate
+    @param csv_path - the fixture to read
+    @param batch_size - the number of entries per insert mutation
+    @param concurrency - the maximum number of insert mutations in flight
+    @return latencies - the latency of every insert mutation, in seconds
+    """
+    async with oplog_transport.RawGraphQLSession(url, concurrency=concurrency) as session:
+        timed_session = TimedSession(session)
+        await oplog_populate.populate_oplog_async(
+            timed_session,
+            1,
+            batch_size,
+            concurrency,
+            csv_path=csv_path,
+            batching_configs=FIXED_BATCHING,
+            raw_entries=True
+        )
+    return timed_session.latencies
+
+def run_isolated(function, *args):
+    """
+    run_isolated calls a function in a freshly spawned process
+
+    @param function - a module-level function
+    @param args - the arguments to pass to the function
+    @return result - the function's return value
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+def percentile(values, percent):
+    """
+    percentile returns a percentile of a list of values
+
+    @param values - the values
+    @param percent - the percentile to return, from 1 to 99
+    @return value - the percentile, or None if there are no values
+    """
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+def peak_rss_bytes():
+    """
+    peak_rss_bytes returns the peak resident set size of the current process
+
+    @return bytes - the peak RSS, in bytes
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark oplog generation and population against a local stub server"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=ROW_COUNTS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS)
+    parser.add_argument(
+        "--transports",
+        nargs="+",
+        choices=TRANSPORTS,
+        default=TRANSPORTS,
+        help="the populate transports to compare"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the stub server waits before answering each request"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="seed used to generate fixtures")
+    parser.add_argument("--output", default="benchmark.json", help="the JSON report to write")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.rows,
+        args.batch_sizes,
+        args.concurrency,
+        args.latency,
+        args.seed,
+        args.transports
+    )
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=4)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,225 @@
+import bisect
+import json
+import os
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Class definitions
+@dataclass
+class CheckpointJournal:
+    """
+    CheckpointJournal objects track the progress of a batched oplog import.
+
+    The journal is a JSON Lines file stored next to the CSV. The first line records the
+    target oplog and the CSV it was started against. Every following line records one
+    committed batch: its index, the first and last entry_identifier it contained, and the
+    byte offsets in the CSV just before its first row and just past its last row, along
+    with the number of entries created and rejected.
+
+    Concurrent uploads commit batches out of order, so each batch is recorded as soon as
+    it commits, and the journal tracks the byte ranges committed so far. end_offset is the
+    end of the run of committed rows at the start of the file, where a resumed import
+    starts reading; rows in the committed ranges past it are skipped.
+    """
+    path: Path
+    oplog_id: int
+    csv_size: int
+    csv_mtime_ns: int
+    next_batch: int = 0
+    end_offset: int = 0
+    rows: int = 0
+    ranges: list = field(default_factory=list)
+
+    def record(self, batch, entry_count):
+        """
+        record appends a committed batch to the journal and flushes it to disk
+
+        @param batch - the OplogBatch that was committed
+        @param entry_count - the number of oplog entries Ghostwriter created for the batch; any
+                             other entries of the batch were written to the reject file
+        """
+        self.next_batch = max(self.next_batch, batch.index + 1)
+        self.rows += entry_count
+        self.add_range(batch.start_offset, batch.end_offset)
+
+        write_journal_line(self.path, {
+            "batch": batch.index,
+            "first_entry": batch.first_entry,
+            "last_entry": batch.last_entry,
+            "start_offset": batch.start_offset,
+            "end_offset": batch.end_offset,
+            "rows": entry_count,
+            "rejected": len(batch.entries) - entry_count
+        })
+
+    def add_range(self, start_offset, end_offset):
+        """
+        add_range marks the rows ending after start_offset and up to end_offset as
+        committed, merging the range with the ranges it touches
+
+        @param start_offset - the position just before the first committed row
+        @param end_offset - the position just past the last committed row
+        """
+        self.ranges = merge_range(self.ranges, start_offset, end_offset)
+        self.end_offset = self.ranges[0][1] if self.ranges[0][0] <= 0 else 0
+
+    def committed_filter(self):
+        """
+        committed_filter returns a check for the rows committed past end_offset, as they
+        stood when the import resumed. Later commits do not change it, so the reader can
+        use it while batches commit.
+
+        @return committed - a function from a row's end position to whether the row was
+                            already committed, or None if no rows past end_offset were
+        """
+        return committed_filter(self.ranges, self.end_offset)
+
+    def complete(self):
+        """
+        complete removes the journal once every batch of the CSV has been committed
+        """
+        self.path.unlink(missing_ok=True)
+
+# Function definitions
+def journal_path(csv_path):
+    """
+    journal_path returns the location of the checkpoint journal for a CSV
+
+    @param csv_path - the path of the oplog CSV
+    @return path - the path of the checkpoint journal
+    """
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + ".checkpoint")
+
+def start_checkpoint(csv_path, oplog_id):
+    """
+    start_checkpoint creates a new checkpoint journal for importing a CSV into an oplog,
+    replacing any existing journal
+
+    @param csv_path - the path of the oplog CSV
+    @param oplog_id - the ID of the oplog the CSV is imported into
+    @return journal - the new CheckpointJournal
+    """
+    csv_stat = Path(csv_path).stat()
+    journal = CheckpointJournal(
+        journal_path(csv_path),
+        oplog_id,
+        csv_stat.st_size,
+        csv_stat.st_mtime_ns
+    )
+
+    journal.path.unlink(missing_ok=True)
+    write_journal_line(journal.path, {
+        "oplog_id": journal.oplog_id,
+        "csv_size": journal.csv_size,
+        "csv_mtime_ns": journal.csv_mtime_ns
+    })
+    return journal
+
+def load_checkpoint(csv_path):
+    """
+    load_checkpoint reads the checkpoint journal of a CSV, if one exists. A journal that was
+    started against a different version of the CSV is discarded, since its byte offsets no
+    longer line up with the file.
+
+    @param csv_path - the path of the oplog CSV
+    @return journal - the CheckpointJournal to resume from, or None
+    """
+    path = journal_path(csv_path)
+    try:
+        with path.open() as journal_file:
+            lines = journal_file.read().splitlines()
+    except FileNotFoundError:
+        return None
+
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A torn final line means the process died mid-write; that batch is not committed
+            break
+
+    if not records or "oplog_id" not in records[0]:
+        print(f"Checkpoint Unreadable: Discarding {path.name}")
+        path.unlink()
+        return None
+
+    header = records[0]
+    csv_stat = Path(csv_path).stat()
+    if (header["csv_size"], header["csv_mtime_ns"]) != (csv_stat.st_size, csv_stat.st_mtime_ns):
+        print(f"Checkpoint Stale: {Path(csv_path).name} changed since {path.name} was written")
+        path.unlink()
+        return None
+
+    journal = CheckpointJournal(
+        path,
+        header["oplog_id"],
+        header["csv_size"],
+        header["csv_mtime_ns"]
+    )
+    for record in records[1:]:
+        journal.next_batch = max(journal.next_batch, record["batch"] + 1)
+        journal.rows += record["rows"]
+        # Journals written before batches were recorded out of order hold a contiguous run
+        journal.add_range(record.get("start_offset", journal.end_offset), record["end_offset"])
+
+    return journal
+
+def merge_range(ranges, start_offset, end_offset):
+    """
+    merge_range adds a committed byte range to a sorted list of ranges, merging it with
+    the ranges it touches
+
+    @param ranges - the sorted, disjoint (start_offset, end_offset) ranges committed so far
+    @param start_offset - the position just before the first committed row
+    @param end_offset - the position just past the last committed row
+    @return ranges - a new sorted list of disjoint ranges
+    """
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start_offset or range_start > end_offset:
+            merged.append((range_start, range_end))
+        else:
+            start_offset = min(start_offset, range_start)
+            end_offset = max(end_offset, range_end)
+    merged.append((start_offset, end_offset))
+    merged.sort()
+    return merged
+
+def committed_filter(ranges, end_offset):
+    """
+    committed_filter returns a check for the rows in committed ranges past end_offset. It
+    works on a copy of the ranges, so later commits do not change it.
+
+    @param ranges - the sorted, disjoint (start_offset, end_offset) ranges committed so far
+    @param end_offset - the position a reader starts from
+    @return committed - a function from a row's end position to whether the row was
+                        already committed, or None if no rows past end_offset were
+    """
+    ranges = [
+        (range_start, range_end) for range_start, range_end in ranges
+        if range_end > end_offset
+    ]
+    if not ranges:
+        return None
+    starts = [range_start for range_start, _ in ranges]
+
+    def committed(row_end):
+        index = bisect.bisect_left(starts, row_end) - 1
+        return index >= 0 and row_end <= ranges[index][1]
+
+    return committed
+
+def write_journal_line(path, record):
+    """
+    write_journal_line appends one JSON record to a journal and syncs it to disk
+
+    @param path - the path of the journal
+    @param record - the JSON-serializable record to append
+    """
+    with path.open("a") as journal_file:
+        journal_file.write(json.dumps(record) + "\n")
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
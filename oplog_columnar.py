@@ -0,0 +1,345 @@
+import json
+import mmap
+import sys
+
+from array import array
+from pathlib import Path
+
+# Marks the start and end of a columnar oplog file
+MAGIC = b"OPLOGC1\n"
+
+# Encodings of a column within a stripe
+DICTIONARY = "dictionary"
+PLAIN = "plain"
+
+# A column is stored plain once its dictionary would hold more values than this
+MAX_DICTIONARY_SIZE = 65536
+
+# A column is stored plain once a stripe adds more new values than this fraction of its rows
+MAX_NEW_VALUE_FRACTION = 0.5
+
+# Array typecodes of unsigned integers, by byte width
+WIDTH_TYPECODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+# Column sections start on multiples of this many bytes, so they can be cast in place
+ALIGNMENT = 8
+
+# Class definitions
+class ColumnarFormatError(Exception):
+    """Raised when a file is not a complete columnar oplog"""
+
+class ColumnarWriter:
+    """
+    ColumnarWriter writes rows of oplog fields to a dictionary-encoded columnar file.
+
+    Every call to writerows writes one stripe, holding each column of its rows as one
+    contiguous section. Low-cardinality columns, such as IPs, tools, and operators, are
+    stored as integer codes into a dictionary of the column's values, which is written
+    once at the end of the file. A column whose values rarely repeat, such as dates or
+    commands, is stored plain instead: the UTF-8 text of its values, and the offset just
+    past each one. Missing values are kept apart from empty strings, as a null in the
+    dictionary, or in a list of the rows of a plain section that are null, so a row with
+    a missing field still fails validation once it is read back.
+    """
+
+    def __init__(self, path, fieldnames):
+        """
+        @param path - the file to create, replacing any existing file
+        @param fieldnames - the names of the fields of every row
+        """
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.dictionaries = [[] for _ in self.fieldnames]
+        self.indexes = [{} for _ in self.fieldnames]
+        self.plain_columns = [False] * len(self.fieldnames)
+        self.stripes = []
+        self.rows = 0
+        self.stream = open(self.path, "wb")
+        self.stream.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def writerows(self, rows):
+        """
+        writerows writes rows of values, in the order of the field names, as one stripe.
+        Values are stored as strings, and None as a missing value.
+
+        @param rows - an iterable of rows
+        """
+        columns = list(zip(*rows))
+        if not columns:
+            return
+
+        stripe_rows = len(columns[0])
+        stripe_columns = []
+        for column, values in enumerate(columns):
+            values = [
+                value if type(value) is str or value is None else str(value)
+                for value in values
+            ]
+            if not self.plain_columns[column] and self.extend_dictionary(column, values):
+                stripe_columns.append(self.write_codes(column, values))
+            else:
+                self.plain_columns[column] = True
+                stripe_columns.append(self.write_plain(values))
+
+        self.stripes.append({"rows": stripe_rows, "columns": stripe_columns})
+        self.rows += stripe_rows
+
+    def extend_dictionary(self, column, values):
+        """
+        extend_dictionary adds the new values of a stripe to a column's dictionary, unless
+        there are too many of them for dictionary encoding to pay off
+
+        @param column - the index of the column
+        @param values - the column's values in the stripe
+        @return encoded - whether the column can be stored as dictionary codes
+        """
+        index = self.indexes[column]
+        dictionary = self.dictionaries[column]
+        new_values = [value for value in dict.fromkeys(values) if value not in index]
+        # Stripes of a row or two always hold mostly new values, so they are not judged
+        mostly_new = (
+            len(new_values) > len(values) * MAX_NEW_VALUE_FRACTION
+            and len(values) > 1 / MAX_NEW_VALUE_FRACTION
+        )
+        if mostly_new or len(dictionary) + len(new_values) > MAX_DICTIONARY_SIZE:
+            return False
+        for value in new_values:
+            index[value] = len(dictionary)
+            dictionary.append(value)
+        return True
+
+    def write_codes(self, column, values):
+        """
+        write_codes writes a column's values as dictionary codes of the smallest width
+        that fits its dictionary
+
+        @param column - the index of the column
+        @param values - the column's values in the stripe
+        @return section - the footer entry of the section
+        """
+        width = integer_width(len(self.dictionaries[column]) - 1)
+        codes = array(WIDTH_TYPECODES[width], map(self.indexes[column].__getitem__, values))
+        offset = self.write_section(codes)
+        return [DICTIONARY, offset, width]
+
+    def write_plain(self, values):
+        """
+        write_plain writes a column's values as UTF-8 text, preceded by the byte offset just
+        past each value within the text. Missing values are stored as empty text, and the
+        rows holding them are listed in the footer entry.
+
+        @param values - the column's values in the stripe
+        @return section - the footer entry of the section
+        """
+        encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+        ends = []
+        end = 0
+        for value in encoded:
+            end += len(value)
+            ends.append(end)
+        width = integer_width(end)
+        offset = self.write_section(array(WIDTH_TYPECODES[width], ends))
+        self.stream.write(b"".join(encoded))
+        nulls = [row for row, value in enumerate(values) if value is None]
+        return [PLAIN, offset, width, end, nulls] if nulls else [PLAIN, offset, width, end]
+
+    def write_section(self, integers):
+        """
+        write_section writes an array of integers, little-endian, at the next aligned offset
+
+        @param integers - the array to write
+        @return offset - the byte offset of the array in the file
+        """
+        padding = -self.stream.tell() % ALIGNMENT
+        self.stream.write(b"\0" * padding)
+        offset = self.stream.tell()
+        if sys.byteorder != "little":
+            integers.byteswap()
+        self.stream.write(integers.tobytes())
+        return offset
+
+    def close(self):
+        """
+        close writes the footer, holding the field names, dictionaries, and stripe layout,
+        followed by its length and the magic bytes
+        """
+        if self.stream.closed:
+            return
+        footer = json.dumps({
+            "fields": self.fieldnames,
+            "rows": self.rows,
+            "dictionaries": self.dictionaries,
+            "stripes": self.stripes
+        }, separators=(",", ":")).encode("utf-8")
+        self.stream.write(footer)
+        self.stream.write(len(footer).to_bytes(8, "little"))
+        self.stream.write(MAGIC)
+        self.stream.close()
+
+class ColumnarFile:
+    """
+    ColumnarFile is a columnar oplog opened for reading. The file is memory-mapped, and
+    rows are only built when the stripe holding them is read, with None for missing
+    values: dictionary codes are looked
+    up in the dictionaries, so repeated values are shared rather than copied, and plain
+    columns are decoded a stripe at a time. The pages of a stripe are released once it
+    has been read, so resident memory does not grow with the size of the file.
+    """
+
+    def __init__(self, path):
+        """
+        @param path - the columnar oplog to open
+        """
+        self.path = Path(path)
+        self.file = open(self.path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ColumnarFormatError(f"{self.path.name} is empty")
+
+        tail = len(MAGIC) + 8
+        if (
+            len(self.map) < len(MAGIC) + tail
+            or self.map[:len(MAGIC)] != MAGIC
+            or self.map[-len(MAGIC):] != MAGIC
+        ):
+            self.close()
+            raise ColumnarFormatError(f"{self.path.name} is not a complete columnar oplog")
+
+        footer_length = int.from_bytes(self.map[-tail:-len(MAGIC)], "little")
+        footer = json.loads(self.map[-tail - footer_length:-tail])
+        self.fieldnames = footer["fields"]
+        self.rows = footer["rows"]
+        self.dictionaries = footer["dictionaries"]
+        self.stripes = footer["stripes"]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def read_records(self, start_row=0):
+        """
+        read_records returns the field names, along with a generator of the records from
+        start_row on, as lists of strings
+
+        @param start_row - the number of the first row to read
+        @return (fieldnames, records) - the field names, and a generator of (record, end_row) pairs
+        """
+
+        def records():
+            for first_row, columns in self.read_stripes(start_row):
+                skipped = max(start_row - first_row, 0)
+                if skipped:
+                    columns = [values[skipped:] for values in columns]
+                stripe_end = first_row + skipped + len(columns[0])
+                yield from zip(
+                    map(list, zip(*columns)),
+                    range(first_row + skipped + 1, stripe_end + 1)
+                )
+
+        return list(self.fieldnames), records()
+
+    def read_stripes(self, start_row=0):
+        """
+        read_stripes decodes the stripes holding start_row and every row after it
+
+        @param start_row - the number of the first row needed
+        @yield (first_row, columns) - the number of the stripe's first row, and its columns
+                                      as lists of strings
+        """
+        first_row = 0
+        for stripe in self.stripes:
+            stripe_rows = stripe["rows"]
+            if first_row + stripe_rows > start_row:
+                yield first_row, [
+                    self.read_column(column, stripe_rows, section)
+                    for column, section in enumerate(stripe["columns"])
+                ]
+                self.release(stripe)
+            first_row += stripe_rows
+
+    def read_column(self, column, rows, section):
+        """
+        read_column decodes one column of a stripe
+
+        @param column - the index of the column
+        @param rows - the number of rows in the stripe
+        @param section - the footer entry of the column's section
+        @return values - the column's values, as a list of strings and None for missing values
+        """
+        encoding, offset, width = section[:3]
+        integers = self.read_integers(offset, rows, width)
+
+        if encoding == DICTIONARY:
+            return list(map(self.dictionaries[column].__getitem__, integers))
+
+        data_offset = offset + rows * width
+        data = self.map[data_offset:data_offset + section[3]]
+        starts = [0]
+        starts.extend(integers[:-1])
+        # Byte offsets are character offsets in ASCII text, so it is decoded once and sliced
+        if data.isascii():
+            data = data.decode("ascii")
+            values = [data[start:end] for start, end in zip(starts, integers)]
+        else:
+            values = [data[start:end].decode("utf-8") for start, end in zip(starts, integers)]
+        # Files written before missing values were kept have no list of null rows
+        for row in section[4] if len(section) > 4 else ():
+            values[row] = None
+        return values
+
+    def read_integers(self, offset, count, width):
+        """
+        read_integers reads an array of little-endian unsigned integers
+
+        @param offset - the byte offset of the array
+        @param count - the number of integers
+        @param width - the byte width of each integer
+        @return integers - the integers, as a list
+        """
+        section = memoryview(self.map)[offset:offset + count * width]
+        try:
+            if sys.byteorder == "little":
+                return section.cast(WIDTH_TYPECODES[width]).tolist()
+            integers = array(WIDTH_TYPECODES[width], section)
+            integers.byteswap()
+            return integers.tolist()
+        finally:
+            section.release()
+
+    def release(self, stripe):
+        """
+        release drops the pages of a stripe that has been read from resident memory; they
+        stay in the page cache, and are read back from it if the stripe is read again
+
+        @param stripe - the footer entry of the stripe
+        """
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        sections = stripe["columns"]
+        start = sections[0][1] - sections[0][1] % mmap.PAGESIZE
+        end = max(
+            section[1] + stripe["rows"] * section[2] + (section[3] if section[0] == PLAIN else 0)
+            for section in sections
+        )
+        self.map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+# Function definitions
+def integer_width(maximum):
+    """
+    integer_width returns the byte width of the smallest unsigned integer holding a value
+
+    @param maximum - the largest value to hold
+    @return width - 1, 2, 4, or 8
+    """
+    for width in (1, 2, 4):
+        if maximum < 1 << (8 * width):
+            return width
+    return 8
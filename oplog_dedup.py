@@ -0,0 +1,240 @@
+import hashlib
+import operator
+
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from oplog_transport import ENTRY_COLUMNS
+
+# Directory holding one dedup index per endpoint and oplog
+DEDUP_INDEX_DIR = Path(__file__).parent / "config/dedup_index"
+
+# Marks the start of a dedup index file
+MAGIC = b"OPLOGD1\n"
+
+# Columns holding timestamps, which Ghostwriter returns in a different form than they are sent
+TIMESTAMP_FIELDS = ("startDate", "endDate")
+
+# Indexes of the timestamp columns in ENTRY_COLUMNS
+TIMESTAMP_COLUMNS = tuple(
+    index for index, (field, _) in enumerate(ENTRY_COLUMNS) if field in TIMESTAMP_FIELDS
+)
+
+# Class definitions
+@dataclass
+class DedupConfig:
+    """DedupConfig objects represent the settings of the fetch seeding a dedup index"""
+    page_size: int = 1000
+    concurrency: int = 4
+
+class DedupIndex:
+    """
+    DedupIndex holds a content hash of every entry of an oplog, over the fields
+    populate_oplog sends, so rows that are already in the oplog can be skipped before
+    they are serialized.
+
+    Hashes are 64 bits, so a set of ten million entries takes a few hundred megabytes and
+    two different entries are mistaken for one another with a probability of about one in
+    a few hundred thousand. The index is saved with the highest entry ID it has seen, so
+    later runs only fetch the entries added since. Hashes of rows read during a run are
+    kept apart from the saved ones, since their inserts may still fail.
+    """
+
+    def __init__(self, path, max_id=0, digests=None):
+        """
+        @param path - the file the index is saved to
+        @param max_id - the highest ID of the oplog entries in the index
+        @param digests - the hashes of the entries in the index, or None for none
+        """
+        self.path = Path(path)
+        self.max_id = max_id
+        self.digests = digests if digests is not None else set()
+        self.pending = set()
+        self.skipped = 0
+        self.repeated = 0
+
+    def add_entries(self, entries):
+        """
+        add_entries adds entries fetched from Ghostwriter to the index
+
+        @param entries - an iterable of oplogEntry dictionaries, with their IDs
+        """
+        for entry in entries:
+            self.digests.add(entry_digest([entry.get(field) for field, _ in ENTRY_COLUMNS]))
+            self.max_id = max(self.max_id, int(entry["id"]))
+
+    def skip_duplicates(self, fieldnames, oplog_records):
+        """
+        skip_duplicates drops the records of an oplog file that are already in the oplog,
+        or that repeat an earlier record of the run
+
+        @param fieldnames - the field names of the file
+        @param oplog_records - an iterable of (record, end_offset) pairs
+        @yield (record, end_offset) - each record that is not in the index
+        """
+        digest_record = compile_record_digest(fieldnames)
+        for record, end_offset in oplog_records:
+            digest = digest_record(record)
+            if digest is not None and self.skip_digest(digest):
+                continue
+            yield record, end_offset
+
+    def skip_digest(self, digest):
+        """
+        skip_digest checks a row's hash against the index, adding it if it is new. Rows
+        already in the oplog are counted in skipped, and rows repeating an earlier row of
+        the run in repeated.
+
+        @param digest - the hash returned by entry_digest
+        @return skip - whether the row is a duplicate
+        """
+        if digest in self.digests:
+            self.skipped += 1
+            return True
+        if digest in self.pending:
+            self.repeated += 1
+            return True
+        self.pending.add(digest)
+        return False
+
+    def save(self):
+        """
+        save writes the hashes fetched from Ghostwriter, and the highest ID among them,
+        replacing the saved index atomically
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        digests = array("Q", self.digests)
+        temporary_path = self.path.with_suffix(".tmp")
+        with temporary_path.open("wb") as index_file:
+            index_file.write(MAGIC)
+            index_file.write(self.max_id.to_bytes(8, "little"))
+            index_file.write(digests.tobytes())
+        temporary_path.replace(self.path)
+
+# Function definitions
+def dedup_index_path(url, oplog_id):
+    """
+    dedup_index_path returns the dedup index file for an oplog on an endpoint
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param oplog_id - the ID of the oplog
+    @return path - the path of the index file
+    """
+    digest = hashlib.sha256(f"{url}|{oplog_id}".encode("utf-8")).hexdigest()[:16]
+    return DEDUP_INDEX_DIR / f"{digest}.idx"
+
+def load_dedup_index(url, oplog_id):
+    """
+    load_dedup_index reads the saved dedup index of an oplog, or starts an empty one if
+    there is none or it cannot be read
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param oplog_id - the ID of the oplog
+    @return index - the DedupIndex
+    """
+    path = dedup_index_path(url, oplog_id)
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return DedupIndex(path)
+
+    header = len(MAGIC) + 8
+    if data[:len(MAGIC)] != MAGIC or (len(data) - header) % 8:
+        print(f"Dedup Index Unreadable: Rebuilding {path.name}")
+        return DedupIndex(path)
+
+    digests = array("Q")
+    digests.frombytes(data[header:])
+    return DedupIndex(path, int.from_bytes(data[len(MAGIC):header], "little"), set(digests))
+
+def compile_record_digest(fieldnames):
+    """
+    compile_record_digest builds the function hashing the rows of an oplog file like
+    entry_digest
+
+    @param fieldnames - the field names of the file
+    @return digest_record - a function from a row, as a list of values, to its hash, or to
+                            None if the row is missing fields, which validation reports
+    """
+    get_values = compile_record_values(fieldnames)
+
+    def digest_record(record):
+        values = get_values(record)
+        return entry_digest(values) if values is not None else None
+
+    return digest_record
+
+def compile_record_values(fieldnames):
+    """
+    compile_record_values builds the function picking the fields populate_oplog sends
+    out of the rows of an oplog file
+
+    @param fieldnames - the field names of the file
+    @return get_values - a function from a row, as a list of values, to its values in the
+                         order of ENTRY_COLUMNS, or to None if the row is missing fields
+    """
+    columns = [column for _, column in ENTRY_COLUMNS]
+    if not set(columns).issubset(fieldnames):
+        return lambda record: None
+
+    get_values = operator.itemgetter(*map(fieldnames.index, columns))
+
+    def record_values(record):
+        try:
+            return get_values(record)
+        except IndexError:
+            return None
+
+    return record_values
+
+def entry_digest(values):
+    """
+    entry_digest hashes the fields of an oplog entry, in the order of ENTRY_COLUMNS.
+    Missing values hash like empty ones, and timestamps are hashed in UTC, so a row read
+    from a file and the same entry returned by Ghostwriter have the same hash.
+
+    @param values - the values of the entry's fields, in the order of ENTRY_COLUMNS
+    @return digest - the hash, as a 64-bit integer
+    """
+    return normalized_digest(normalize_entry(values))
+
+def normalized_digest(values):
+    """
+    normalized_digest hashes field values already converted by normalize_entry
+
+    @param values - the normalized values, in the order of ENTRY_COLUMNS
+    @return digest - the hash, as a 64-bit integer
+    """
+    text = "\x1f".join(values).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "little")
+
+def normalize_entry(values):
+    """
+    normalize_entry converts the fields of an oplog entry to the strings entry_digest
+    hashes: missing values become empty strings, and timestamps are converted to UTC
+
+    @param values - the values of the entry's fields, in the order of ENTRY_COLUMNS
+    @return values - a list of the normalized values
+    """
+    values = ["" if value is None else str(value) for value in values]
+    for index in TIMESTAMP_COLUMNS:
+        values[index] = normalize_timestamp(values[index])
+    return values
+
+def normalize_timestamp(value):
+    """
+    normalize_timestamp converts a timestamp to ISO 8601 in UTC. A timestamp without a
+    timezone is taken to be in UTC, as Ghostwriter stores it.
+
+    @param value - the timestamp, such as '2024-12-12 17:26:50' or '2024-12-12T17:26:50+00:00'
+    @return timestamp - the UTC timestamp, or the value unchanged if it does not parse
+    """
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).isoformat()
@@ -0,0 +1,908 @@
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import multiprocessing
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+from graphql import GraphQLError, OperationDefinitionNode, build_schema, execute, parse, validate
+
+# The subset of Ghostwriter's Hasura schema used by Oplog Populate
+EMULATOR_SCHEMA = build_schema(
+    """
+    scalar bigint
+    scalar date
+    scalar jsonb
+    scalar timestamptz
+
+    type LoginResponse {
+        token: String
+        expires: String
+    }
+
+    enum order_by {
+        asc
+        desc
+    }
+
+    input String_comparison_exp {
+        _eq: String
+        _neq: String
+        _in: [String!]
+        _is_null: Boolean
+    }
+
+    input bigint_comparison_exp {
+        _eq: bigint
+        _neq: bigint
+        _gt: bigint
+        _gte: bigint
+        _lt: bigint
+        _lte: bigint
+        _in: [bigint!]
+        _is_null: Boolean
+    }
+
+    type client {
+        id: bigint!
+        name: String
+        codename: String
+        timezone: String
+        projects(
+            where: project_bool_exp,
+            order_by: [project_order_by!],
+            limit: Int,
+            offset: Int
+        ): [project!]!
+    }
+
+    input client_bool_exp {
+        _and: [client_bool_exp!]
+        _or: [client_bool_exp!]
+        _not: client_bool_exp
+        id: bigint_comparison_exp
+        name: String_comparison_exp
+        codename: String_comparison_exp
+    }
+
+    input client_order_by {
+        id: order_by
+        name: order_by
+    }
+
+    input client_insert_input {
+        name: String
+        codename: String
+        timezone: String
+        projects: project_arr_rel_insert_input
+    }
+
+    type project {
+        id: bigint!
+        clientId: bigint
+        codename: String
+        startDate: date
+        endDate: date
+        projectTypeId: bigint
+        client: client
+        oplogs(
+            where: oplog_bool_exp,
+            order_by: [oplog_order_by!],
+            limit: Int,
+            offset: Int
+        ): [oplog!]!
+    }
+
+    input project_bool_exp {
+        _and: [project_bool_exp!]
+        _or: [project_bool_exp!]
+        _not: project_bool_exp
+        id: bigint_comparison_exp
+        clientId: bigint_comparison_exp
+        codename: String_comparison_exp
+        client: client_bool_exp
+    }
+
+    input project_order_by {
+        id: order_by
+        codename: order_by
+    }
+
+    input project_insert_input {
+        clientId: bigint
+        codename: String
+        startDate: date
+        endDate: date
+        projectTypeId: bigint
+        oplogs: oplog_arr_rel_insert_input
+    }
+
+    input project_arr_rel_insert_input {
+        data: [project_insert_input!]!
+    }
+
+    type oplog {
+        id: bigint!
+        projectId: bigint
+        name: String
+        project: project
+    }
+
+    input oplog_bool_exp {
+        _and: [oplog_bool_exp!]
+        _or: [oplog_bool_exp!]
+        _not: oplog_bool_exp
+        id: bigint_comparison_exp
+        projectId: bigint_comparison_exp
+        name: String_comparison_exp
+        project: project_bool_exp
+    }
+
+    input oplog_order_by {
+        id: order_by
+        name: order_by
+    }
+
+    input oplog_insert_input {
+        projectId: bigint
+        name: String
+    }
+
+    input oplog_arr_rel_insert_input {
+        data: [oplog_insert_input!]!
+    }
+
+    type oplogEntry {
+        id: bigint!
+        oplog: bigint
+        entryIdentifier: String
+        startDate: timestamptz
+        endDate: timestamptz
+        sourceIp: String
+        destIp: String
+        tool: String
+        userContext: String
+        command: String
+        description: String
+        output: String
+        comments: String
+        operatorName: String
+        extraFields: jsonb
+    }
+
+    input oplogEntry_bool_exp {
+        _and: [oplogEntry_bool_exp!]
+        _or: [oplogEntry_bool_exp!]
+        _not: oplogEntry_bool_exp
+        id: bigint_comparison_exp
+        oplog: bigint_comparison_exp
+        entryIdentifier: String_comparison_exp
+        tool: String_comparison_exp
+        operatorName: String_comparison_exp
+    }
+
+    input oplogEntry_order_by {
+        id: order_by
+        startDate: order_by
+    }
+
+    input oplogEntry_insert_input {
+        oplog: bigint
+        entryIdentifier: String
+        startDate: timestamptz
+        endDate: timestamptz
+        sourceIp: String
+        destIp: String
+        tool: String
+        userContext: String
+        command: String
+        description: String
+        output: String
+        comments: String
+        operatorName: String
+        extraFields: jsonb
+    }
+
+    type oplogEntry_mutation_response {
+        affected_rows: Int!
+        returning: [oplogEntry!]!
+    }
+
+    type Query {
+        client(
+            where: client_bool_exp,
+            order_by: [client_order_by!],
+            limit: Int,
+            offset: Int
+        ): [client!]!
+        project(
+            where: project_bool_exp,
+            order_by: [project_order_by!],
+            limit: Int,
+            offset: Int
+        ): [project!]!
+        oplog(
+            where: oplog_bool_exp,
+            order_by: [oplog_order_by!],
+            limit: Int,
+            offset: Int
+        ): [oplog!]!
+        oplog_by_pk(id: bigint!): oplog
+        oplogEntry(
+            where: oplogEntry_bool_exp,
+            order_by: [oplogEntry_order_by!],
+            limit: Int,
+            offset: Int
+        ): [oplogEntry!]!
+    }
+
+    type Mutation {
+        login(username: String!, password: String!): LoginResponse
+        insert_client_one(object: client_insert_input!): client
+        insert_project_one(object: project_insert_input!): project
+        insert_oplog_one(object: oplog_insert_input!): oplog
+        insert_oplogEntry(objects: [oplogEntry_insert_input!]!): oplogEntry_mutation_response
+    }
+    """
+)
+
+# Number of parsed and validated documents kept for reuse
+DOCUMENT_CACHE_SIZE = 64
+
+# Relationships between tables, as (related table, foreign key, kind). Object relationships
+# follow a foreign key of the row, and array relationships the foreign keys of related rows.
+OBJECT_RELATIONSHIP = "object"
+ARRAY_RELATIONSHIP = "array"
+
+RELATIONSHIPS = {
+    "client": {
+        "projects": ("project", "clientId", ARRAY_RELATIONSHIP)
+    },
+    "project": {
+        "client": ("client", "clientId", OBJECT_RELATIONSHIP),
+        "oplogs": ("oplog", "projectId", ARRAY_RELATIONSHIP)
+    },
+    "oplog": {
+        "project": ("project", "projectId", OBJECT_RELATIONSHIP)
+    },
+    "oplogEntry": {}
+}
+
+# Seconds start_emulator_process waits for the emulator to start serving
+EMULATOR_START_TIMEOUT = 30
+
+# Class definitions
+class EmulatorError(Exception):
+    """Raised when an emulator process fails to start"""
+
+@dataclass
+class EmulatorConfig:
+    """EmulatorConfig objects represent the behavior of a GhostwriterEmulator"""
+    port: int = 0
+    latency: float = 0.0
+    max_payload_bytes: int = 0
+    error_rate: float = 0.0
+    error_status: int = 503
+    max_rows_per_second: float = 0.0
+    token_lifetime: float = 3600.0
+    require_auth: bool = True
+    store_rows: bool = True
+    seed: int = None
+
+class GhostwriterEmulator:
+    """
+    GhostwriterEmulator answers the GraphQL operations Oplog Populate sends to Ghostwriter:
+    login, insert_client_one, insert_project_one, insert_oplog_one, and insert_oplogEntry,
+    including nested inserts of related rows, and queries of clients, projects, oplogs, and
+    oplog entries with Hasura's where, order_by, limit, and offset arguments and relationships.
+    Documents are parsed, validated, and executed against EMULATOR_SCHEMA with graphql-core,
+    so both inline and variable-based inserts work, and introspection is answered too.
+    Gzip-compressed request bodies are accepted.
+
+    Inserted rows are kept in memory for later checks. Latency, a request body size limit,
+    random error responses, and a cap on inserted rows per second can be configured.
+    """
+
+    def __init__(self, config=None):
+        """
+        @param config - the EmulatorConfig to apply, or None for the defaults
+        """
+        self.config = config or EmulatorConfig()
+        self.random = random.Random(self.config.seed)
+        self.tables = {"client": [], "project": [], "oplog": [], "oplogEntry": []}
+        self.next_ids = {table: 1 for table in self.tables}
+        self.tokens = {}
+        self.documents = OrderedDict()
+        self.throttled_until = 0.0
+        self.stats = {
+            "requests": 0,
+            "bytes_received": 0,
+            "rows_inserted": 0,
+            "rejected_payloads": 0,
+            "injected_errors": 0,
+            "auth_failures": 0
+        }
+
+    def application(self):
+        """
+        application builds the aiohttp application serving the emulator
+
+        @return app - the aiohttp application
+        """
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/v1/graphql", self.handle_graphql)
+        app.router.add_get("/emulator/stats", self.handle_stats)
+        app.router.add_get("/emulator/tables/{table}", self.handle_table)
+        return app
+
+    async def handle_graphql(self, request):
+        body = await request.read()
+        # Count the bytes on the wire, before any Content-Encoding is undone
+        wire_bytes = request.content_length or len(body)
+        self.stats["requests"] += 1
+        self.stats["bytes_received"] += wire_bytes
+
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+
+        if self.config.max_payload_bytes and wire_bytes > self.config.max_payload_bytes:
+            self.stats["rejected_payloads"] += 1
+            return web.Response(status=413, text="Request Entity Too Large")
+
+        if self.config.error_rate and self.random.random() < self.config.error_rate:
+            self.stats["injected_errors"] += 1
+            return web.Response(status=self.config.error_status, text="Injected error")
+
+        try:
+            payload = json.loads(body)
+            document = self.load_document(payload["query"])
+        except (ValueError, KeyError):
+            return hasura_error("invalid-json", "Request body is not a GraphQL request", 400)
+        except GraphQLError as e:
+            return hasura_error("validation-failed", e.message)
+
+        is_anonymous = self.is_anonymous(document, payload.get("operationName"))
+        if self.config.require_auth and not is_anonymous and not self.is_authorized(request):
+            self.stats["auth_failures"] += 1
+            return hasura_error("invalid-jwt", "Could not verify JWT: JWTExpired")
+
+        rows_before = self.stats["rows_inserted"]
+        result = execute(
+            EMULATOR_SCHEMA,
+            document,
+            root_value=self,
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName")
+        )
+        await self.throttle(self.stats["rows_inserted"] - rows_before)
+
+        response = {"data": result.data}
+        if result.errors:
+            response["errors"] = [
+                {
+                    "message": error.message,
+                    "extensions": {"code": (error.extensions or {}).get("code", "unexpected")}
+                }
+                for error in result.errors
+            ]
+        return web.json_response(response)
+
+    async def handle_stats(self, request):
+        return web.json_response({
+            **self.stats,
+            "rows": {table: len(rows) for table, rows in self.tables.items()}
+        })
+
+    async def handle_table(self, request):
+        table = request.match_info["table"]
+        if table not in self.tables:
+            raise web.HTTPNotFound()
+        return web.json_response(self.tables[table])
+
+    def load_document(self, query):
+        """
+        load_document parses and validates a query, reusing the result for repeated queries
+
+        @param query - the GraphQL document text
+        @return document - the parsed document
+        """
+        document = self.documents.get(query)
+        if document is not None:
+            self.documents.move_to_end(query)
+            return document
+
+        document = parse(query)
+        errors = validate(EMULATOR_SCHEMA, document)
+        if errors:
+            raise errors[0]
+
+        self.documents[query] = document
+        if len(self.documents) > DOCUMENT_CACHE_SIZE:
+            self.documents.popitem(last=False)
+        return document
+
+    def is_anonymous(self, document, operation_name):
+        """
+        is_anonymous checks whether a document only uses operations open to anonymous
+        users: logging in and introspection
+
+        @param document - the parsed document
+        @param operation_name - the name of the operation to run, or None
+        @return bool - True if the document needs no token
+        """
+        for definition in document.definitions:
+            if not isinstance(definition, OperationDefinitionNode):
+                continue
+            if operation_name and (definition.name is None or definition.name.value != operation_name):
+                continue
+            for selection in definition.selection_set.selections:
+                field_name = getattr(getattr(selection, "name", None), "value", "")
+                if field_name != "login" and not field_name.startswith("__"):
+                    return False
+        return True
+
+    def is_authorized(self, request):
+        """
+        is_authorized checks that a request carries a token issued by login that has not expired
+
+        @param request - the aiohttp request
+        @return bool - True if the token is valid
+        """
+        authorization = request.headers.get("Authorization", "")
+        token = authorization.removeprefix("Bearer ")
+        expires = self.tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    async def throttle(self, rows):
+        """
+        throttle delays a response so inserted rows never exceed max_rows_per_second
+
+        @param rows - the number of rows the request inserted
+        """
+        if not self.config.max_rows_per_second or not rows:
+            return
+        now = time.monotonic()
+        self.throttled_until = max(self.throttled_until, now) + rows / self.config.max_rows_per_second
+        await asyncio.sleep(self.throttled_until - now)
+
+    def insert(self, table, row):
+        """
+        insert assigns the next ID of a table to a row and stores it
+
+        @param table - the table to insert into
+        @param row - the row to insert
+        @return row - the row with its ID
+        """
+        row = {"id": self.next_ids[table], **row}
+        self.next_ids[table] += 1
+        if self.config.store_rows:
+            self.tables[table].append(row)
+        return row
+
+    def login(self, info, username, password):
+        token = secrets.token_hex(16)
+        expires = datetime.now(timezone.utc) + timedelta(seconds=self.config.token_lifetime)
+        self.tokens[token] = expires.timestamp()
+        return {"token": token, "expires": expires.isoformat()}
+
+    def insert_nested(self, table, row):
+        """
+        insert_nested inserts a row along with the rows of its array relationships, which
+        Hasura takes as {"data": [...]}, filling in their foreign keys
+
+        @param table - the table to insert into
+        @param row - the row to insert, with any nested rows
+        @return row - the inserted row, with its relationships
+        """
+        row = dict(row)
+        nested = {
+            name: (related_table, foreign_key, row.pop(name)["data"])
+            for name, (related_table, foreign_key, kind) in RELATIONSHIPS[table].items()
+            if kind == ARRAY_RELATIONSHIP and name in row
+        }
+        inserted = self.insert(table, row)
+        for related_table, foreign_key, related_rows in nested.values():
+            for related_row in related_rows:
+                self.insert_nested(related_table, {**related_row, foreign_key: inserted["id"]})
+        return self.with_relationships(table, inserted)
+
+    def insert_client_one(self, info, object):
+        return self.insert_nested("client", object)
+
+    def insert_project_one(self, info, object):
+        return self.insert_nested("project", object)
+
+    def insert_oplog_one(self, info, object):
+        return self.insert_nested("oplog", object)
+
+    def insert_oplogEntry(self, info, objects):
+        # Like Postgres, refuse the whole statement if any timestamp does not parse
+        for row in objects:
+            for column in ("startDate", "endDate"):
+                if row.get(column) is not None:
+                    try:
+                        datetime.fromisoformat(row[column])
+                    except (TypeError, ValueError):
+                        message = "invalid input syntax for type timestamp with time zone"
+                        raise GraphQLError(
+                            f'{message}: "{row[column]}"',
+                            extensions={"code": "data-exception"}
+                        )
+
+        returning = [self.insert("oplogEntry", row) for row in objects]
+        self.stats["rows_inserted"] += len(returning)
+        return {"affected_rows": len(returning), "returning": returning}
+
+    def oplog_by_pk(self, info, id):
+        row = next((row for row in self.tables["oplog"] if str(row["id"]) == str(id)), None)
+        return row and self.with_relationships("oplog", row)
+
+    def client(self, info, **arguments):
+        return self.select("client", **arguments)
+
+    def project(self, info, **arguments):
+        return self.select("project", **arguments)
+
+    def oplog(self, info, **arguments):
+        return self.select("oplog", **arguments)
+
+    def oplogEntry(self, info, **arguments):
+        return self.select("oplogEntry", **arguments)
+
+    def select(self, table, where=None, order_by=None, limit=None, offset=None, rows=None):
+        """
+        select filters, sorts, and pages the rows of a table like a Hasura query
+
+        @param table - the table to query
+        @param where - a Hasura boolean expression, or None for every row
+        @param order_by - a list of {column: "asc" or "desc"} objects, or None
+        @param limit - the maximum number of rows, or None
+        @param offset - the number of rows to skip, or None
+        @param rows - the rows to query, or None for every row of the table
+        @return rows - the selected rows, with their relationships
+        """
+        if rows is None:
+            table_rows = self.tables[table]
+            start, end = self.id_range(table, (where or {}).get("id", {}))
+            # Tables are kept in ID order, so a keyset page stops at its limit
+            if order_by in (None, [], [{"id": "asc"}]) and limit is not None:
+                rows = (table_rows[index] for index in range(start, end))
+                if where:
+                    rows = (row for row in rows if self.matches(table, row, where))
+                rows = list(itertools.islice(rows, offset or 0, (offset or 0) + limit))
+                return [self.with_relationships(table, row) for row in rows]
+            rows = table_rows[start:end]
+        if where:
+            rows = [row for row in rows if self.matches(table, row, where)]
+        for ordering in reversed(order_by or []):
+            for column, direction in reversed(list(ordering.items())):
+                rows = sorted(
+                    rows,
+                    key=lambda row: (row.get(column) is None, row.get(column)),
+                    reverse=direction == "desc"
+                )
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.with_relationships(table, row) for row in rows]
+
+    def id_range(self, table, condition):
+        """
+        id_range narrows a table to the rows an ID comparison can match, by bisecting
+        the table, which is kept in ID order
+
+        @param table - the table to query
+        @param condition - the comparison expression of the ID column, or {} for none
+        @return (start, end) - the range of indexes of the rows between the bounds of the
+                               comparison
+        """
+        rows = self.tables[table]
+        start, end = 0, len(rows)
+        for operator, bisect_rows in (
+            ("_gt", bisect.bisect_right),
+            ("_gte", bisect.bisect_left),
+            ("_lt", bisect.bisect_left),
+            ("_lte", bisect.bisect_right)
+        ):
+            if condition.get(operator) is not None:
+                position = bisect_rows(rows, int(condition[operator]), key=lambda row: row["id"])
+                if operator.startswith("_gt"):
+                    start = max(start, position)
+                else:
+                    end = min(end, position)
+        return start, end
+
+    def matches(self, table, row, where):
+        """
+        matches evaluates a Hasura boolean expression against a row
+
+        @param table - the table of the row
+        @param row - the row
+        @param where - the boolean expression
+        @return bool - True if the row matches
+        """
+        for key, condition in where.items():
+            if key == "_and":
+                matched = all(self.matches(table, row, part) for part in condition)
+            elif key == "_or":
+                matched = any(self.matches(table, row, part) for part in condition)
+            elif key == "_not":
+                matched = not self.matches(table, row, condition)
+            elif key in RELATIONSHIPS[table]:
+                related_table, foreign_key, kind = RELATIONSHIPS[table][key]
+                matched = any(
+                    self.matches(related_table, related_row, condition)
+                    for related_row in self.related_rows(table, row, key)
+                )
+            else:
+                matched = compare(row.get(key), condition)
+            if not matched:
+                return False
+        return True
+
+    def related_rows(self, table, row, relationship):
+        """
+        related_rows finds the rows a relationship of a row points to
+
+        @param table - the table of the row
+        @param row - the row
+        @param relationship - the name of the relationship
+        @return rows - the related rows
+        """
+        related_table, foreign_key, kind = RELATIONSHIPS[table][relationship]
+        if kind == OBJECT_RELATIONSHIP:
+            key = str(row.get(foreign_key))
+            return [related for related in self.tables[related_table] if str(related["id"]) == key]
+        key = str(row["id"])
+        return [
+            related for related in self.tables[related_table]
+            if str(related.get(foreign_key)) == key
+        ]
+
+    def with_relationships(self, table, row):
+        """
+        with_relationships adds resolvers for the relationships of a row, which graphql-core
+        calls with their arguments when a query selects them
+
+        @param table - the table of the row
+        @param row - the row
+        @return row - a copy of the row with a resolver for each relationship
+        """
+        resolved = dict(row)
+        for name, (related_table, _, kind) in RELATIONSHIPS[table].items():
+            if kind == OBJECT_RELATIONSHIP:
+                def resolve_object(info, name=name, related_table=related_table):
+                    related = self.related_rows(table, row, name)
+                    return self.with_relationships(related_table, related[0]) if related else None
+                resolved[name] = resolve_object
+            else:
+                def resolve_array(info, name=name, related_table=related_table, **arguments):
+                    return self.select(
+                        related_table,
+                        rows=self.related_rows(table, row, name),
+                        **arguments
+                    )
+                resolved[name] = resolve_array
+        return resolved
+
+class EmulatorServer:
+    """
+    EmulatorServer runs a GhostwriterEmulator on its own event loop in a background thread
+    """
+
+    def __init__(self, config=None):
+        """
+        @param config - the EmulatorConfig to apply, or None for the defaults
+        """
+        self.emulator = GhostwriterEmulator(config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+        self.url = None
+
+    def start(self):
+        """
+        start binds the emulator to its configured port and starts answering requests
+
+        @return url - the GraphQL endpoint of the emulator
+        """
+        self.thread.start()
+        self.runner, self.url = asyncio.run_coroutine_threadsafe(
+            start_site(self.emulator, self.emulator.config.port),
+            self.loop
+        ).result()
+        return self.url
+
+    def stop(self):
+        """
+        stop shuts down the emulator and its event loop
+        """
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+# Function definitions
+def hasura_error(code, message, status=200):
+    """
+    hasura_error builds an error response shaped like Hasura's
+
+    @param code - the Hasura error code
+    @param message - the error message
+    @param status - the HTTP status
+    @return response - the aiohttp response
+    """
+    return web.json_response(
+        {"errors": [{"message": message, "extensions": {"code": code, "path": "$"}}]},
+        status=status
+    )
+
+def compare(value, condition):
+    """
+    compare evaluates a Hasura comparison expression, such as {"_eq": "SpecterPops"}, against
+    a column value. IDs may arrive as strings, so operands are converted to the type of the
+    value before comparing.
+
+    @param value - the column value
+    @param condition - the comparison expression
+    @return bool - True if the value satisfies every operator
+    """
+
+    def coerce(operand):
+        if isinstance(value, int) and isinstance(operand, str) and operand.lstrip("-").isdigit():
+            return int(operand)
+        return operand
+
+    for operator, operand in condition.items():
+        if operator == "_is_null":
+            matched = (value is None) == operand
+        elif value is None:
+            matched = False
+        elif operator in ("_in", "_nin"):
+            matched = (value in [coerce(item) for item in operand]) == (operator == "_in")
+        else:
+            operand = coerce(operand)
+            matched = {
+                "_eq": lambda: value == operand,
+                "_neq": lambda: value != operand,
+                "_gt": lambda: value > operand,
+                "_gte": lambda: value >= operand,
+                "_lt": lambda: value < operand,
+                "_lte": lambda: value <= operand
+            }[operator]()
+        if not matched:
+            return False
+    return True
+
+async def start_site(emulator, port):
+    """
+    start_site serves an emulator on localhost
+
+    @param emulator - the GhostwriterEmulator to serve
+    @param port - the port to bind, or 0 for a free port
+    @return (runner, url) - the aiohttp runner and the GraphQL endpoint
+    """
+    runner = web.AppRunner(emulator.application(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/v1/graphql"
+
+def serve_emulator(config, url_queue=None):
+    """
+    serve_emulator runs an emulator until the process is stopped
+
+    @param config - the EmulatorConfig to apply
+    @param url_queue - a multiprocessing queue that receives the GraphQL endpoint once serving,
+                       or an EmulatorError if the emulator cannot start
+    """
+    async def serve():
+        emulator = GhostwriterEmulator(config)
+        try:
+            _, url = await start_site(emulator, config.port)
+        except Exception as e:
+            if url_queue is None:
+                raise
+            # Exceptions such as OSError do not always survive pickling, so send the message
+            url_queue.put(EmulatorError(f"{type(e).__name__}: {e}"))
+            return
+        if url_queue is not None:
+            url_queue.put(url)
+        else:
+            print(f"Ghostwriter emulator listening on {url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def start_emulator_process(config):
+    """
+    start_emulator_process runs an emulator in a separate process, so it does not compete
+    with the client for the interpreter. An EmulatorError is raised if the emulator fails
+    to start, exits, or is not serving within EMULATOR_START_TIMEOUT seconds.
+
+    @param config - the EmulatorConfig to apply
+    @return (process, url) - the emulator process and its GraphQL endpoint
+    """
+    context = multiprocessing.get_context("spawn")
+    url_queue = context.Queue()
+    process = context.Process(target=serve_emulator, args=(config, url_queue), daemon=True)
+    process.start()
+
+    deadline = time.monotonic() + EMULATOR_START_TIMEOUT
+    while True:
+        try:
+            url = url_queue.get(timeout=0.5)
+            break
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            raise EmulatorError(f"The emulator exited with code {process.exitcode}")
+        if time.monotonic() > deadline:
+            process.terminate()
+            process.join()
+            raise EmulatorError(f"The emulator did not start within {EMULATOR_START_TIMEOUT}s")
+
+    if isinstance(url, EmulatorError):
+        process.join()
+        raise url
+    return process, url
+
+def emulator_stats(url):
+    """
+    emulator_stats fetches the counters of a running emulator
+
+    @param url - the GraphQL endpoint of the emulator
+    @return stats - the emulator's request, byte, and row counters
+    """
+    stats_url = url.removesuffix("/v1/graphql") + "/emulator/stats"
+    with urllib.request.urlopen(stats_url) as response:
+        return json.load(response)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Ghostwriter GraphQL emulator")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument(
+        "--max-payload-bytes",
+        type=int,
+        default=0,
+        help="reject larger request bodies with 413"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests answered with --error-status"
+    )
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument(
+        "--max-rows-per-second",
+        type=float,
+        default=0.0,
+        help="cap on inserted oplog entries per second"
+    )
+    parser.add_argument("--token-lifetime", type=float, default=3600.0, help="seconds tokens last")
+    parser.add_argument("--no-auth", action="store_true", help="accept requests without a token")
+    parser.add_argument("--seed", type=int, help="seed for error injection")
+    args = parser.parse_args()
+
+    serve_emulator(EmulatorConfig(
+        port=args.port,
+        latency=args.latency,
+        max_payload_bytes=args.max_payload_bytes,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        max_rows_per_second=args.max_rows_per_second,
+        token_lifetime=args.token_lifetime,
+        require_auth=not args.no_auth,
+        seed=args.seed
+    ))
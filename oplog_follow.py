@@ -0,0 +1,333 @@
+import csv
+import hashlib
+import io
+import json
+import os
+
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+
+import oplog_checkpoint
+import oplog_formats
+
+# Bytes at the start of a followed file hashed to recognize it when it is rewritten in place
+FINGERPRINT_BYTES = 4096
+
+# Bytes read from a followed file at a time
+READ_CHUNK_BYTES = 1 << 20
+
+# Reasons a followed file is read again from its first record
+ROTATED = "rotated"
+TRUNCATED = "truncated"
+REWRITTEN = "rewritten"
+
+# Class definitions
+@dataclass
+class FollowConfig:
+    """FollowConfig objects represent follow mode configs"""
+    poll_interval: float = 2.0
+
+@dataclass
+class FollowState:
+    """
+    FollowState objects track how much of a followed oplog file has been committed to
+    one oplog: the byte offset just past the last committed record, the number of
+    entries created from the file, and the identity of the file, so a rotated, truncated,
+    or rewritten file is noticed. The states of every oplog a file is followed into are
+    stored together, in a JSON file next to it.
+
+    Concurrent uploads commit batches out of order, so each batch is recorded as soon as
+    it commits: end_offset is the end of the run of committed records a restarted
+    follower reads from, and ranges holds the committed byte ranges past it, whose
+    records are skipped.
+    """
+    path: Path
+    oplog_id: int
+    end_offset: int = 0
+    rows: int = 0
+    device: int = 0
+    inode: int = 0
+    fingerprint: str = ""
+    ranges: list = field(default_factory=list)
+
+    def commit(self, start_offset, end_offset, entry_count):
+        """
+        commit records a batch of committed records and saves the state. A batch that
+        continues the committed run at end_offset extends it, along with any committed
+        ranges it now reaches.
+
+        @param start_offset - the byte offset just before the first record of the batch
+        @param end_offset - the byte offset just past the last record of the batch
+        @param entry_count - the number of oplog entries Ghostwriter created for the batch
+        """
+        self.rows += entry_count
+        ranges = oplog_checkpoint.merge_range(self.ranges, start_offset, end_offset)
+        if ranges[0][0] <= self.end_offset:
+            self.end_offset = max(self.end_offset, ranges.pop(0)[1])
+        self.ranges = ranges
+        self.save()
+
+    def committed_filter(self):
+        """
+        committed_filter returns a check for the records committed past end_offset, as
+        they stood when it was called
+
+        @return committed - a function from a record's end offset to whether the record
+                            was already committed, or None if no records past end_offset were
+        """
+        return oplog_checkpoint.committed_filter(self.ranges, self.end_offset)
+
+    @property
+    def committed_end(self):
+        """The byte offset just past the last committed record"""
+        return self.ranges[-1][1] if self.ranges else self.end_offset
+
+    def reset(self, followed_file):
+        """
+        reset starts the state over at the first record of a new or rewritten file
+
+        @param followed_file - the FollowedFile now being followed
+        """
+        self.end_offset = followed_file.data_offset
+        self.rows = 0
+        self.ranges = []
+        self.device = followed_file.device
+        self.inode = followed_file.inode
+        self.fingerprint = ""
+        self.save()
+
+    def save(self):
+        """
+        save writes the state into the state file, keeping the states of other oplogs.
+        The file is replaced atomically, so a crash leaves either the old or the new state.
+        """
+        states = read_state_file(self.path)
+        state = asdict(self)
+        del state["path"], state["oplog_id"]
+        states[str(self.oplog_id)] = state
+
+        temporary_path = self.path.with_name(self.path.name + ".tmp")
+        with temporary_path.open("w") as state_file:
+            json.dump(states, state_file, indent=2)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temporary_path, self.path)
+
+class FollowedFile:
+    """
+    FollowedFile is an uncompressed CSV or JSON Lines file being followed as it grows.
+    The file stays open between polls, so when it is rotated, the records appended to it
+    before the rotation can still be read through the open handle.
+    """
+
+    def __init__(self, path):
+        """
+        @param path - the file to follow
+        """
+        self.path = Path(path)
+        self.format = oplog_formats.detect_format(self.path)
+        splittable = self.format.container in oplog_formats.SPLITTABLE_CONTAINERS
+        if not splittable or self.format.compression:
+            raise oplog_formats.OplogFormatError(
+                f"{self.path.name} cannot be followed: only uncompressed CSV and JSON Lines "
+                f"files can be appended to"
+            )
+        self.stream = open(self.path, "rb")
+        file_stat = os.fstat(self.stream.fileno())
+        self.device = file_stat.st_dev
+        self.inode = file_stat.st_ino
+        self.fieldnames = None
+        self.data_offset = 0
+
+    def close(self):
+        self.stream.close()
+
+    @property
+    def size(self):
+        """The current size of the open file, which keeps growing after it is rotated"""
+        return os.fstat(self.stream.fileno()).st_size
+
+    def replaced(self):
+        """
+        replaced checks whether the followed path now names a different file
+
+        @return replaced - whether the file was renamed or removed and another took its place
+        """
+        try:
+            path_stat = self.path.stat()
+        except FileNotFoundError:
+            return False
+        return (path_stat.st_dev, path_stat.st_ino) != (self.device, self.inode)
+
+    def read_header(self):
+        """
+        read_header reads the field names once the first line of the file is complete:
+        the header of a CSV, or the keys of the first object of a JSON Lines file
+
+        @return ready - whether the field names have been read
+        """
+        if self.fieldnames is not None:
+            return True
+        self.stream.seek(0)
+        first_line = self.stream.readline()
+        if not first_line.endswith(b"\n"):
+            return False
+        if self.format.container == oplog_formats.CSV:
+            self.fieldnames = next(csv.reader([first_line.decode("utf-8-sig")]))
+            self.data_offset = len(first_line)
+        else:
+            self.fieldnames = list(json.loads(first_line))
+        return True
+
+    def fingerprint(self, length):
+        """
+        fingerprint hashes the first bytes of the file
+
+        @param length - the number of bytes to hash
+        @return fingerprint - the hex digest, with the length it covers
+        """
+        self.stream.seek(0)
+        return f"{length}:{hashlib.sha256(self.stream.read(length)).hexdigest()}"
+
+    def read_records(self, start, end):
+        """
+        read_records parses the complete records between two byte offsets, about
+        READ_CHUNK_BYTES at a time
+
+        @param start - the byte offset of the first record
+        @param end - the byte offset just past the last record
+        @return records - a generator of (record, end_offset) pairs
+        """
+
+        def records():
+            position = start
+            while position < end:
+                self.stream.seek(position)
+                chunk_end = min(
+                    oplog_formats.find_record_end(
+                        self.stream,
+                        position,
+                        READ_CHUNK_BYTES,
+                        self.format.container
+                    ),
+                    end
+                )
+                self.stream.seek(position)
+                lines = io.BytesIO(self.stream.read(chunk_end - position))
+                if self.format.container == oplog_formats.CSV:
+                    yield from oplog_formats.parse_csv_records(lines, position)
+                else:
+                    yield from oplog_formats.parse_json_lines_records(
+                        lines,
+                        self.fieldnames,
+                        position
+                    )
+                position = chunk_end
+
+        return records()
+
+    def complete_end(self, start, size):
+        """
+        complete_end finds the end of the last complete record before size. A writer may
+        be partway through a record, so only records that end in a newline outside quoted
+        fields are complete, as in oplog_formats.find_record_end.
+
+        @param start - the byte offset of a record
+        @param size - the number of bytes of the file to look at
+        @return end - the byte offset just past the last complete record, or start if
+                      there is none
+        """
+        self.stream.seek(start)
+        end = start
+        position = start
+        quotes = 0
+        while position < size:
+            data = self.stream.read(min(READ_CHUNK_BYTES, size - position))
+            if not data:
+                break
+            if self.format.container != oplog_formats.CSV:
+                last_newline = data.rfind(b"\n")
+                if last_newline >= 0:
+                    end = position + last_newline + 1
+            else:
+                for line in data.splitlines(keepends=True):
+                    position += len(line)
+                    quotes += line.count(b'"')
+                    if line.endswith(b"\n") and quotes % 2 == 0:
+                        end = position
+                continue
+            position += len(data)
+        return end
+
+# Function definitions
+def state_path(input_path):
+    """
+    state_path returns the location of the follow state of an oplog file
+
+    @param input_path - the path of the followed file
+    @return path - the path of the follow state file
+    """
+    input_path = Path(input_path)
+    return input_path.with_name(input_path.name + ".follow")
+
+def read_state_file(path):
+    """
+    read_state_file reads the follow states of every oplog a file is followed into
+
+    @param path - the path of the follow state file
+    @return states - a dictionary of state dictionaries, by oplog ID
+    """
+    try:
+        with Path(path).open() as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        print(f"Follow State Unreadable: Discarding {Path(path).name}")
+        return {}
+
+def load_follow_state(input_path, oplog_id):
+    """
+    load_follow_state reads the follow state of a file for an oplog, or starts a new one
+
+    @param input_path - the path of the followed file
+    @param oplog_id - the ID of the oplog the file is followed into
+    @return state - the FollowState
+    """
+    path = state_path(input_path)
+    state = read_state_file(path).get(str(oplog_id), {})
+    return FollowState(path, oplog_id, **state)
+
+def check_followed_file(state, followed_file):
+    """
+    check_followed_file compares a followed file against its follow state. The file is
+    read again from its first record if it is not the file the state was recorded
+    against, if it is now shorter than its last committed record, or if the bytes before
+    the committed offset changed.
+
+    @param state - the FollowState of the file
+    @param followed_file - the open FollowedFile
+    @return reason - ROTATED, TRUNCATED, or REWRITTEN, or None if the file only grew
+    """
+    if (state.device, state.inode) != (followed_file.device, followed_file.inode):
+        return ROTATED
+    if followed_file.size < state.committed_end:
+        return TRUNCATED
+    if state.fingerprint:
+        length = int(state.fingerprint.split(":", 1)[0])
+        if followed_file.fingerprint(length) != state.fingerprint:
+            return REWRITTEN
+    return None
+
+def update_fingerprint(state, followed_file):
+    """
+    update_fingerprint hashes the committed start of the file once there is enough of it,
+    up to FINGERPRINT_BYTES, so later checks cover as much of the file as possible
+
+    @param state - the FollowState of the file
+    @param followed_file - the open FollowedFile
+    """
+    length = min(state.end_offset, FINGERPRINT_BYTES)
+    if not state.fingerprint or int(state.fingerprint.split(":", 1)[0]) < length:
+        state.fingerprint = followed_file.fingerprint(length)
+        state.save()
@@ -0,0 +1,566 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import shutil
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import oplog_columnar
+
+# Containers, chosen by the last suffix of a path before any compression suffix
+CSV = "csv"
+JSON_LINES = "jsonl"
+PARQUET = "parquet"
+COLUMNAR = "columnar"
+
+CONTAINER_SUFFIXES = {
+    ".csv": CSV,
+    ".jsonl": JSON_LINES,
+    ".ndjson": JSON_LINES,
+    ".parquet": PARQUET,
+    ".oplogc": COLUMNAR
+}
+
+# Containers read by row number from an uncompressed file, instead of streamed
+ROW_CONTAINERS = (PARQUET, COLUMNAR)
+
+# Compressions, chosen by the last suffix of a path
+GZIP = "gzip"
+ZSTD = "zstd"
+
+COMPRESSION_SUFFIXES = {
+    ".gz": GZIP,
+    ".zst": ZSTD,
+    ".zstd": ZSTD
+}
+
+# Compression levels used when writing; both favor speed over ratio
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Number of Parquet rows converted to Python values at a time while reading
+PARQUET_READ_ROWS = 65536
+
+# Bytes read and discarded at a time while skipping ahead in a stream that cannot seek
+SKIP_CHUNK_BYTES = 1 << 20
+
+# Containers that split_records can divide into byte ranges of whole records
+SPLITTABLE_CONTAINERS = (CSV, JSON_LINES)
+
+# Approximate size of each byte range split_records divides a file into
+SPLIT_CHUNK_BYTES = 1 << 20
+
+# Class definitions
+class OplogFormatError(Exception):
+    """Raised when an oplog file's format is unknown or needs a package that is not installed"""
+
+@dataclass
+class OplogFormat:
+    """OplogFormat objects represent the container and compression of an oplog file"""
+    container: str
+    compression: str = None
+
+class ClosingGzipFile(gzip.GzipFile):
+    """ClosingGzipFile is a GzipFile that also closes the file object it was given"""
+
+    def close(self):
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+class OplogFile:
+    """
+    OplogFile is an oplog opened for reading. CSV and JSON Lines files are decompressed as
+    they are read, and positions in them are byte offsets into the decompressed text.
+    Positions in Parquet and columnar files are row numbers.
+    """
+
+    def __init__(self, path):
+        """
+        @param path - the oplog file to open
+        """
+        self.path = Path(path)
+        self.format = detect_format(self.path)
+        self.stream = self.open()
+
+    @property
+    def splittable(self):
+        """Whether split_records can divide the file: only uncompressed text files can be split"""
+        return self.format.container in SPLITTABLE_CONTAINERS and not self.format.compression
+
+    def open(self):
+        if self.format.container == PARQUET:
+            return open_parquet(self.path)
+        if self.format.container == COLUMNAR:
+            try:
+                return oplog_columnar.ColumnarFile(self.path)
+            except oplog_columnar.ColumnarFormatError as e:
+                raise OplogFormatError(str(e))
+        return open_binary(self.path, "rb", self.format.compression)
+
+    def close(self):
+        if self.format.container != PARQUET:
+            self.stream.close()
+
+    def read_records(self, start_position=0):
+        """
+        read_records reads the field names of the oplog, and returns them along with a
+        generator of the records from start_position on, as lists of strings. Fields a
+        record does not have are None.
+
+        @param start_position - the position of the first record to read, or 0 for the first
+        @return (fieldnames, records) - the field names, and a generator of (record, end_position)
+                                        pairs holding each record and the position just past it
+        """
+        # Compressed streams cannot seek back to the start, so every read gets a new stream
+        self.close()
+        self.stream = self.open()
+        if self.format.container == CSV:
+            return read_csv_records(self.stream, start_position)
+        if self.format.container == JSON_LINES:
+            return read_json_lines_records(self.stream, start_position)
+        if self.format.container == COLUMNAR:
+            return self.stream.read_records(start_position)
+        return read_parquet_records(self.stream, start_position)
+
+    def split_records(self, start_position=0, chunk_bytes=SPLIT_CHUNK_BYTES):
+        """
+        split_records divides a splittable file, from start_position on, into byte ranges of
+        about chunk_bytes that each hold whole records, so they can be parsed independently
+        by read_record_range
+
+        @param start_position - the byte offset of the first record, or 0 for the first
+        @param chunk_bytes - the approximate size of each range
+        @yield (start, end) - the byte offsets of each range, in order
+        """
+        with open(self.path, "rb") as stream:
+            if start_position:
+                stream.seek(start_position)
+            elif self.format.container == CSV:
+                # Skip the header
+                stream.readline()
+            start = stream.tell()
+            while True:
+                end = find_record_end(stream, start, chunk_bytes, self.format.container)
+                if end == start:
+                    return
+                yield start, end
+                start = end
+
+class OplogWriter:
+    """
+    OplogWriter writes rows of oplog fields to a CSV, JSON Lines, Parquet, or columnar file,
+    compressing CSV and JSON Lines as they are written. Every call to writerows writes one
+    Parquet row group or columnar stripe, so callers should pass large blocks of rows.
+    """
+
+    def __init__(self, path, fieldnames, header=True):
+        """
+        @param path - the oplog file to create, replacing any existing file
+        @param fieldnames - the names of the fields of every row
+        @param header - whether to write the CSV header; False writes CSV rows that can be
+                        appended to another CSV of the same fields
+        """
+        self.path = Path(path)
+        self.format = detect_format(self.path)
+        self.fieldnames = list(fieldnames)
+
+        if self.format.container == PARQUET:
+            pyarrow, parquet = import_pyarrow()
+            self.schema = pyarrow.schema([(name, pyarrow.string()) for name in self.fieldnames])
+            self.stream = parquet.ParquetWriter(self.path, self.schema)
+            return
+        if self.format.container == COLUMNAR:
+            self.stream = oplog_columnar.ColumnarWriter(self.path, self.fieldnames)
+            return
+
+        self.stream = io.TextIOWrapper(
+            open_binary(self.path, "wb", self.format.compression),
+            encoding="utf-8",
+            newline=""
+        )
+        if self.format.container == CSV:
+            self.csv_writer = csv.writer(self.stream)
+            if header:
+                self.csv_writer.writerow(self.fieldnames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def writerows(self, rows):
+        """
+        writerows writes rows of values, in the order of the field names
+
+        @param rows - an iterable of rows
+        """
+        if self.format.container == CSV:
+            self.csv_writer.writerows(rows)
+        elif self.format.container == JSON_LINES:
+            fieldnames = self.fieldnames
+            self.stream.write("".join(
+                json.dumps(dict(zip(fieldnames, row))) + "\n" for row in rows
+            ))
+        elif self.format.container == COLUMNAR:
+            self.stream.writerows(rows)
+        else:
+            pyarrow, _ = import_pyarrow()
+            columns = list(zip(*rows)) or [()] * len(self.fieldnames)
+            self.stream.write_table(pyarrow.table(
+                [[stringify(value) for value in column] for column in columns],
+                schema=self.schema
+            ))
+
+    def close(self):
+        self.stream.close()
+
+# Function definitions
+def detect_format(path):
+    """
+    detect_format reads the format of an oplog file from its suffixes, such as
+    'oplog.csv', 'oplog.jsonl.gz', 'oplog.parquet', or 'oplog.oplogc'
+
+    @param path - the oplog file
+    @return format - the OplogFormat of the file
+    """
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+    compression = None
+    if suffixes and suffixes[-1] in COMPRESSION_SUFFIXES:
+        compression = COMPRESSION_SUFFIXES[suffixes.pop()]
+
+    container = CONTAINER_SUFFIXES.get(suffixes[-1] if suffixes else None)
+    if container is None:
+        raise OplogFormatError(
+            f"Unknown oplog format: {Path(path).name} "
+            f"(expected .csv, .jsonl, .parquet, or .oplogc, with .gz or .zst for CSV "
+            f"and JSON Lines)"
+        )
+    if container in ROW_CONTAINERS and compression:
+        raise OplogFormatError(
+            "Parquet and columnar files are read in place: drop the .gz or .zst suffix"
+        )
+    return OplogFormat(container, compression)
+
+def format_suffix(path):
+    """
+    format_suffix returns the suffixes of a path that detect_format reads, such as '.csv.gz'
+
+    @param path - the oplog file
+    @return suffix - the format suffixes of the path
+    """
+    oplog_format = detect_format(path)
+    return "".join(Path(path).suffixes[-2 if oplog_format.compression else -1:])
+
+def open_binary(path, mode, compression=None):
+    """
+    open_binary opens a file as a binary stream, decompressing or compressing it on the fly
+
+    @param path - the file to open
+    @param mode - "rb" or "wb"
+    @param compression - GZIP, ZSTD, or None
+    @return stream - the binary stream
+    """
+    if compression == GZIP:
+        if mode == "rb":
+            return gzip.open(path, mode)
+        # Leave the name and time out of the header, so seeded oplogs are byte-identical
+        return ClosingGzipFile(
+            filename="",
+            mode=mode,
+            fileobj=open(path, mode),
+            compresslevel=GZIP_LEVEL,
+            mtime=0
+        )
+    if compression == ZSTD:
+        zstandard = import_zstandard()
+        if mode == "rb":
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+                open(path, "rb"),
+                read_across_frames=True
+            ))
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+    return open(path, mode)
+
+def open_parquet(path):
+    """
+    open_parquet opens a Parquet file for reading
+
+    @param path - the file to open
+    @return parquet_file - the pyarrow ParquetFile
+    """
+    _, parquet = import_pyarrow()
+    return parquet.ParquetFile(path)
+
+def read_csv_records(stream, start_offset=0):
+    """
+    read_csv_records reads a CSV from a binary stream, tracking the byte offset just past
+    each record. The header is always read from the start of the stream, then reading
+    skips ahead to start_offset.
+
+    @param stream - the binary stream to read, positioned at its start
+    @param start_offset - the byte offset of the first record to read, or 0 for the first
+    @return (fieldnames, records) - the header, and a generator of (record, end_offset) pairs
+    """
+    header = stream.readline()
+    fieldnames = next(csv.reader([header.decode("utf-8-sig")]))
+    offset = skip_to(stream, len(header), start_offset)
+    return fieldnames, parse_csv_records(stream, offset)
+
+def parse_csv_records(lines, offset):
+    """
+    parse_csv_records parses CSV records from lines of bytes, tracking the byte offset just
+    past each record
+
+    @param lines - an iterable of lines of bytes, such as a binary stream
+    @param offset - the byte offset of the first line
+    @yield (record, end_offset) - each record, as a list of strings, and the offset just past it
+    """
+
+    def decoded_lines():
+        nonlocal offset
+        for line in lines:
+            offset += len(line)
+            yield line.decode("utf-8")
+
+    # csv.reader only pulls the lines of the record it is parsing, so after each
+    # record the offset sits exactly at the start of the next one
+    for record in csv.reader(decoded_lines()):
+        # csv.DictReader skipped blank lines, so keep doing so
+        if record:
+            yield record, offset
+
+def read_json_lines_records(stream, start_offset=0):
+    """
+    read_json_lines_records reads JSON Lines from a binary stream, tracking the byte offset
+    just past each line. Field names are the keys of the first object. Values that are not
+    strings are converted to strings, so every format yields the same records.
+
+    @param stream - the binary stream to read, positioned at its start
+    @param start_offset - the byte offset of the first record to read, or 0 for the first
+    @return (fieldnames, records) - the field names, and a generator of (record, end_offset) pairs
+    """
+    first_line = stream.readline()
+    fieldnames = list(json.loads(first_line)) if first_line.strip() else []
+
+    # The first line was read for its keys, so it is replayed instead of reread
+    if start_offset:
+        offset = skip_to(stream, len(first_line), start_offset)
+        return fieldnames, parse_json_lines_records(stream, fieldnames, offset)
+    lines = itertools.chain([first_line], stream)
+    return fieldnames, parse_json_lines_records(lines, fieldnames, 0)
+
+def parse_json_lines_records(lines, fieldnames, offset):
+    """
+    parse_json_lines_records parses JSON Lines records from lines of bytes, tracking the
+    byte offset just past each record
+
+    @param lines - an iterable of lines of bytes, such as a binary stream
+    @param fieldnames - the keys read from every object, in order
+    @param offset - the byte offset of the first line
+    @yield (record, end_offset) - each record, as a list of strings, and the offset just past it
+    """
+    for line in lines:
+        offset += len(line)
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        yield [stringify(entry.get(name)) for name in fieldnames], offset
+
+def read_record_range(path, container, fieldnames, start, end):
+    """
+    read_record_range parses a byte range of whole records, as found by split_records,
+    from an uncompressed CSV or JSON Lines file
+
+    @param path - the oplog file
+    @param container - CSV or JSON_LINES
+    @param fieldnames - the field names of the file
+    @param start - the byte offset of the first record
+    @param end - the byte offset just past the last record
+    @return records - a generator of (record, end_offset) pairs
+    """
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        lines = io.BytesIO(stream.read(end - start))
+    if container == CSV:
+        return parse_csv_records(lines, start)
+    return parse_json_lines_records(lines, fieldnames, start)
+
+def find_record_end(stream, start, chunk_bytes, container):
+    """
+    find_record_end reads about chunk_bytes of records from a binary stream positioned at
+    the start of a record, and returns the offset of the first record boundary after them.
+
+    A newline only ends a CSV record outside quoted fields, such as "PID 25998, Callback
+    68", which may hold commas and newlines. Every quote toggles between quoted and
+    unquoted text, and an escaped quote is a pair of quotes, so a newline ends a record
+    exactly when an even number of quotes lies between it and the start of the record.
+    JSON strings cannot hold raw newlines, so every newline ends a JSON Lines record.
+
+    @param stream - the binary stream, positioned at start
+    @param start - the byte offset of a record
+    @param chunk_bytes - the number of bytes to read before looking for a boundary
+    @param container - CSV or JSON_LINES
+    @return end - the byte offset of the next record boundary, or of the end of the file
+    """
+    data = stream.read(chunk_bytes)
+    end = start + len(data)
+    if container != CSV:
+        if data and not data.endswith(b"\n"):
+            end += len(stream.readline())
+        return end
+
+    quotes = data.count(b'"')
+    if data.endswith(b"\n") and quotes % 2 == 0:
+        return end
+    # Finish the current line, then keep reading lines until the quotes are balanced
+    for line in iter(stream.readline, b""):
+        end += len(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            break
+    return end
+
+def read_parquet_records(parquet_file, start_row=0):
+    """
+    read_parquet_records reads a Parquet file one row group at a time, skipping the row
+    groups before start_row
+
+    @param parquet_file - the pyarrow ParquetFile to read
+    @param start_row - the number of the first row to read
+    @return (fieldnames, records) - the column names, and a generator of (record, end_row) pairs
+    """
+    fieldnames = list(parquet_file.schema_arrow.names)
+
+    # Skip whole row groups, then the leading rows of the group holding start_row
+    first_group_row = 0
+    row_groups = []
+    for row_group in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(row_group).num_rows
+        if first_group_row + group_rows > start_row or row_groups:
+            row_groups.append(row_group)
+        else:
+            first_group_row += group_rows
+
+    def records():
+        if not row_groups:
+            return
+        row = first_group_row
+        batches = parquet_file.iter_batches(batch_size=PARQUET_READ_ROWS, row_groups=row_groups)
+        for batch in batches:
+            columns = [
+                [stringify(value) for value in column.to_pylist()]
+                for column in batch.columns
+            ]
+            for record in zip(*columns):
+                row += 1
+                if row > start_row:
+                    yield list(record), row
+
+    return fieldnames, records()
+
+def concatenate_oplogs(paths, file_path, fieldnames):
+    """
+    concatenate_oplogs merges oplog files written without CSV headers into one file.
+    CSV and JSON Lines files are concatenated byte for byte after a header, which also
+    works for gzip and zstd, since both decompress concatenated streams. Parquet files
+    are merged row group by row group, and columnar files stripe by stripe.
+
+    @param paths - the files to merge, in order; they are removed once merged
+    @param file_path - the file to create
+    @param fieldnames - the names of the fields of every row
+    """
+    oplog_format = detect_format(file_path)
+
+    if oplog_format.container == PARQUET:
+        _, parquet = import_pyarrow()
+        with OplogWriter(file_path, fieldnames) as writer:
+            for path in paths:
+                writer.stream.write_table(parquet.read_table(path))
+                Path(path).unlink()
+        return
+
+    if oplog_format.container == COLUMNAR:
+        with OplogWriter(file_path, fieldnames) as writer:
+            for path in paths:
+                shard_file = oplog_columnar.ColumnarFile(path)
+                try:
+                    for _, columns in shard_file.read_stripes():
+                        writer.writerows(zip(*columns))
+                finally:
+                    shard_file.close()
+                Path(path).unlink()
+        return
+
+    # Writing no rows leaves just the CSV header, compressed if the file is compressed
+    OplogWriter(file_path, fieldnames).close()
+    with open(file_path, "ab") as merged_file:
+        for path in paths:
+            with open(path, "rb") as shard_file:
+                shutil.copyfileobj(shard_file, merged_file)
+            Path(path).unlink()
+
+def skip_to(stream, offset, target_offset):
+    """
+    skip_to moves a binary stream forward to a byte offset, reading and discarding bytes
+    when the stream cannot seek
+
+    @param stream - the binary stream
+    @param offset - the current byte offset of the stream
+    @param target_offset - the byte offset to move to; offsets behind the stream are ignored
+    @return offset - the new byte offset of the stream
+    """
+    if target_offset <= offset:
+        return offset
+    if stream.seekable():
+        stream.seek(target_offset)
+        return target_offset
+    while offset < target_offset:
+        skipped = len(stream.read(min(SKIP_CHUNK_BYTES, target_offset - offset)))
+        if not skipped:
+            break
+        offset += skipped
+    return offset
+
+def stringify(value):
+    """
+    stringify converts a field value to the string form stored in a CSV
+
+    @param value - the value, or None for a missing field
+    @return value - the value as a string, or None
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+def import_zstandard():
+    """
+    import_zstandard imports the optional zstandard package
+
+    @return zstandard - the zstandard module
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise OplogFormatError(".zst oplogs need the zstandard package: pip install zstandard")
+    return zstandard
+
+def import_pyarrow():
+    """
+    import_pyarrow imports the optional pyarrow package
+
+    @return (pyarrow, parquet) - the pyarrow and pyarrow.parquet modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise OplogFormatError("Parquet oplogs need the pyarrow package: pip install pyarrow")
+    return pyarrow, parquet
@@ -1,206 +1,848 @@
-import csv
+import argparse
+import hashlib
+import json
 import random
+import string
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
 
 from faker import Faker
 
-def generate_oplog(file_path, entries):
-    """
-    generate_oplog creates a Ghostwriter-compatible CSV containing a user-specified
-    number of randomized entries, at a user-specified location.
-
-    @param file_path - the location to create the CSV
-    @param entries - the number of randomized entries to generate for the CSV
-    """
-
-    # Define the fields of the CSV
-    fields = [
-        'entry_identifier',
-        'start_date',
-        'end_date',
-        'source_ip',
-        'dest_ip',
-        'tool',
-        'user_context',
-        'command',
-        'description',
-        'output',
-        'comments',
-        'operator_name',
-        'extra_fields',
-        'oplog_id',
-        'tags'
+import oplog_formats
+
+# Define the fields of the CSV
+FIELDS = [
+    'entry_identifier',
+    'start_date',
+    'end_date',
+    'source_ip',
+    'dest_ip',
+    'tool',
+    'user_context',
+    'command',
+    'description',
+    'output',
+    'comments',
+    'operator_name',
+    'extra_fields',
+    'oplog_id',
+    'tags'
+]
+
+# Number of rows drawn and written at a time
+BLOCK_SIZE = 10000
+
+# Dates are drawn as whole seconds since this naive epoch
+EPOCH = datetime(1970, 1, 1)
+
+# Number of values precomputed for each Faker-generated template field
+FIELD_POOL_SIZE = 2048
+
+# A dict of tools and corresponding possible command/description/comment templates.
+# Each {field} is rendered for every entry from the value pools built by build_field_pools.
+TOOL_CATALOG = {
+    'Cobalt Strike': [
+        ('shinject {target_pid} x64 {bin_path}', 'PID {pid}', 'Attempting process injection'),
+        ('sleep {sleep}', 'PID {pid}', 'Sleeping a beacon'),
+        ('inject-assembly {target_pid} {exe_path}', 'PID {pid}', 'Injecting assembly into a process'),
+        ('execute-assembly {exe_path}', 'PID {pid}', 'Running a local .NET executable'),
+        ('upload {upload_path}', 'PID {pid}', 'Attempting a file upload'),
+        ('cd {directory}', 'PID {pid}', 'Navigating to a directory'),
+        ('spawnto x64 {file_path}', 'PID {pid}', 'Selecting executable for post-exploitation jobs'),
+        ('spawn x64 HTTPS', 'PID {pid}', 'Spawning a new beacon'),
+        ('pwd', 'PID {pid}', 'Obtaining current working directory')
+    ],
+    'OST': [
+        ('download {file_path}', 'PID: {pid}', 'Downloading a file'),
+        ('ls', 'PID: {pid}', 'Listing files and directories'),
+        ('sleep {sleep}', 'PID: {pid}', 'Sleeping a beacon'),
+        ('cd {directory}', 'PID: {pid}', 'Navigating to a directory'),
+        ('bbot -t {domain}-m nmap', 'PID: {pid}', 'Using BBOT port scan'),
+        ('bbot -t {domain}-f safe -ef passive', 'PID: {pid}', 'Using BBOT safe and passive modules'),
+        (
+            'python3 CloudScraper.py -u {domain} >> {output_path}',
+            'PID: {pid}',
+            'Navigating to a directory'
+        )
+    ],
+    'Poseidon': [
+        ('pty whoami', 'PID {pid}, Callback {callback}', 'Obtaining user context'),
+        ('pty kubectl get namespaces', 'PID {pid}, Callback {callback}', 'Conducting container discovery'),
+        ('pty ./kubectl can-i create pod', 'PID {pid}, Callback {callback}', 'Conducting container discovery'),
+        ('pty ./kubectl get secrets', 'PID {pid}, Callback {callback}', 'Conducting container discovery'),
+        ('pty ./kubectl get pods', 'PID {pid}, Callback {callback}', 'Conducting container discovery'),
+        (
+            'pty ./kubectl get namespaces -n cluster',
+            'PID {pid}, Callback {callback}',
+            'Conducting container discovery'
+        ),
+        ('pty curl', 'PID {pid}, Callback {callback}', 'Attempting to use cURL'),
+        (
+            'upload {{"file_id":"{file_id}","remote_path"{remote_path}","overwrite":false}}',
+            'PID {pid}, Callback {callback}',
+            'Attempting to upload a file'
+        ),
+        (
+            'socks {{"action":"start","port":{port}}}',
+            'PID {pid}, Callback {callback}',
+            'Attempting to start a SOCKS proxy'
+        ),
+        ('sleep {sleep}', 'PID {pid}, Callback {callback}', 'Sleeping a beacon'),
+        ('getenv', 'PID {pid}, Callback {callback}', 'Attempting to get environment variables')
+    ]
+}
+
+# Entries generated with a seed treat this as "now", so output does not depend on the clock
+SEEDED_NOW = datetime(2025, 1, 1)
+
+# Start date distributions: spread evenly over the project, or in bursts of activity
+UNIFORM = "uniform"
+BURSTY = "bursty"
+
+# How busy each hour of the day is, in UTC, for bursty start dates
+DEFAULT_HOUR_WEIGHTS = (
+    1, 0.5, 0.5, 0.5, 0.5, 1, 2, 4, 8, 10, 10, 9,
+    6, 9, 10, 10, 9, 7, 4, 3, 2, 2, 1.5, 1
+)
+
+# How busy each day of the week is, Monday first, for bursty start dates
+DEFAULT_WEEKDAY_WEIGHTS = (1, 1, 1, 1, 0.8, 0.1, 0.05)
+
+# EPOCH fell on a Thursday
+EPOCH_WEEKDAY = 3
+
+class CatalogError(Exception):
+    """Raised when a tool catalog file is malformed"""
+
+@dataclass
+class CommandTemplate:
+    """
+    CommandTemplate objects hold one compiled command/description/comment combination.
+    Each template is stored as a positional format string plus the field names that
+    fill its positions, so a whole column can be rendered with one map call. The weight
+    is the share of entries that use the template.
+    """
+    tool: str
+    fields: list
+    command: tuple
+    description: tuple
+    comment: tuple
+    weight: float = 1.0
+
+@dataclass
+class StartTimeConfig:
+    """
+    StartTimeConfig objects represent how start dates are spread over a project. Bursty
+    start dates come in sessions of about session_entries entries, mean_gap seconds
+    apart on average, and sessions start more often in busy hours and days.
+    """
+    distribution: str = UNIFORM
+    session_entries: float = 20.0
+    mean_gap: float = 30.0
+    hour_weights: tuple = DEFAULT_HOUR_WEIGHTS
+    weekday_weights: tuple = DEFAULT_WEEKDAY_WEIGHTS
+
+class AliasTable:
+    """
+    AliasTable draws weighted samples in constant time with Vose's alias method. The
+    weights are spread over one slot per item, each slot holding its own item and, for
+    the rest of the slot, an alias to an item with weight to spare. A single uniform
+    value picks a slot with its whole part, and its fraction picks the slot's item or
+    alias, so a draw costs the same however many items there are.
+    """
+
+    def __init__(self, items, weights):
+        """
+        @param items - the items to draw
+        @param weights - the relative weight of each item, with a positive total
+        """
+        count = len(items)
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+        small = [index for index, weight in enumerate(scaled) if weight < 1]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1]
+        aliases = list(range(count))
+
+        while small and large:
+            index = small.pop()
+            alias = large.pop()
+            aliases[index] = alias
+            scaled[alias] -= 1 - scaled[index]
+            (small if scaled[alias] < 1 else large).append(alias)
+        # Slots left over are full up to rounding error
+        for index in small + large:
+            scaled[index] = 1.0
+
+        self.items = list(items)
+        self.aliases = [self.items[alias] for alias in aliases]
+        # A draw u in [index, index + 1) keeps the slot's own item below its cutoff
+        self.cutoffs = [index + weight for index, weight in enumerate(scaled)]
+
+    def sample(self, rng, k):
+        """
+        sample draws items with replacement
+
+        @param rng - the random.Random instance used for every draw
+        @param k - the number of items to draw
+        @return items - a list of k items
+        """
+        random_values = rng.random
+        count = len(self.items)
+        items = self.items
+        aliases = self.aliases
+        cutoffs = self.cutoffs
+        draws = [random_values() * count for _ in range(k)]
+        return [
+            items[int(draw)] if draw < cutoffs[int(draw)] else aliases[int(draw)]
+            for draw in draws
+        ]
+
+@dataclass
+class OplogPools:
+    """
+    OplogPools objects hold the values an oplog's randomized entries are drawn from.
+    Every shard of a parallel run draws from the same pools.
+    """
+    commands: AliasTable
+    start_times: StartTimeConfig
+    start_hours: AliasTable
+    field_values: dict
+    src: list
+    dest: list
+    user_context: list
+    output: list
+    operators: list
+    project_start: float
+    project_end: float
+    now: float
+
+def generate_oplog(
+    file_path,
+    entries,
+    block_size=BLOCK_SIZE,
+    seed=None,
+    workers=1,
+    merge=True,
+    catalog_path=None
+):
+    """
+    generate_oplog creates a Ghostwriter-compatible oplog containing a user-specified
+    number of randomized entries, at a user-specified location. The format is chosen by
+    the file's suffixes: CSV, JSON Lines, Parquet, or dictionary-encoded columnar, with CSV
+    and JSON Lines optionally gzip or zstd compressed. An existing file is replaced.
+
+    Rows are generated in blocks of block_size: every column of a block is drawn as a
+    whole list at once, and the block is written with a single writerows call.
+
+    With more than one worker, the entries are split into contiguous shards that are
+    generated in a process pool. Each shard draws from a seed derived from seed and its
+    shard number, so the same seed and worker count always produce the same bytes.
+
+    Tools and commands are drawn from TOOL_CATALOG, each tool and then each of its
+    commands equally likely, with start dates spread evenly over the project, unless a
+    catalog file read by load_tool_catalog gives their weights and start date distribution.
+
+    @param file_path - the location to create the oplog
+    @param entries - the number of randomized entries to generate for the oplog
+    @param block_size - the number of entries drawn and written at a time
+    @param seed - the seed for every random draw, or None for a random oplog
+    @param workers - the number of processes generating shards
+    @param merge - whether to merge shards into file_path, or leave them as numbered files
+    @param catalog_path - a tool catalog file, or None for TOOL_CATALOG
+    @return paths - the files that were written
+    """
+
+    catalog, tool_weights, start_times = TOOL_CATALOG, None, StartTimeConfig()
+    if catalog_path is not None:
+        catalog, tool_weights, start_times = load_tool_catalog(catalog_path)
+
+    generator = Faker()
+    if seed is not None:
+        generator.seed_instance(seed)
+    pools = build_pools(
+        generator,
+        SEEDED_NOW if seed is not None else datetime.now(),
+        catalog,
+        tool_weights,
+        start_times
+    )
+
+    # Split entries into contiguous shards, spreading the remainder over the first shards
+    workers = max(1, min(workers, entries))
+    shard_sizes = [
+        entries // workers + (1 if shard < entries % workers else 0)
+        for shard in range(workers)
+    ]
+    shard_starts = [sum(shard_sizes[:shard]) for shard in range(workers)]
+    shard_seeds = [derive_seed(seed, shard) for shard in range(workers)]
+
+    if workers == 1:
+        generate_shard(file_path, 0, entries, shard_seeds[0], pools, block_size)
+        return [Path(file_path)]
+
+    # Shard numbers go before the format suffixes: oplog.000.csv.gz, oplog.001.csv.gz, ...
+    file_path = Path(file_path)
+    suffix = oplog_formats.format_suffix(file_path)
+    stem = file_path.name[:-len(suffix)]
+    shard_paths = [
+        file_path.with_name(f"{stem}.{shard:03d}{suffix}")
+        for shard in range(workers)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Merged shards are written without headers, so they can be concatenated
+        list(executor.map(
+            generate_shard,
+            shard_paths,
+            shard_starts,
+            shard_sizes,
+            shard_seeds,
+            [pools] * workers,
+            [block_size] * workers,
+            [not merge] * workers
+        ))
+
+    if not merge:
+        return shard_paths
+
+    oplog_formats.concatenate_oplogs(shard_paths, file_path, FIELDS)
+    return [file_path]
+
+def build_pools(generator, now, catalog=TOOL_CATALOG, tool_weights=None, start_times=None):
+    """
+    build_pools randomizes the tool catalog, IPs, user contexts, operators, and project
+    dates shared by every entry of an oplog
+
+    @param generator - the Faker instance used for every random draw
+    @param now - the latest possible project date
+    @param catalog - a dict of tool names to lists of command templates
+    @param tool_weights - a dict of tool names to their share of entries, or None for equal
+                          shares
+    @param start_times - the StartTimeConfig spreading start dates, or None for uniform
+    @return pools - an OplogPools struct
+    """
+
+    rng = generator.random
+    start_times = start_times or StartTimeConfig()
+
+    commands = compile_tool_catalog(catalog, tool_weights)
+    src = []
+    dest = []
+    user_context = []
+    operators = []
+
+    # Randomize src, dest, user_context, and operators
+    for _ in range(rng.randrange(2,10)):
+        src.append(generator.ipv4())
+    for _ in range(rng.randrange(2,10)):
+        dest.append(generator.ipv4())
+    for _ in range(rng.randrange(2,10)):
+        user_context.append(generator.ascii_company_email())
+    for _ in range(rng.randrange(2,4)):
+        operators.append(generator.name())
+
+    # Randomize project start date within the last year, and end date before now
+    now = (now - EPOCH).total_seconds()
+    project_start = now - rng.random() * 365 * 86400
+    project_end = project_start + rng.random() * (now - project_start)
+
+    field_values = build_field_pools(generator)
+    for command in commands:
+        unknown = [field for field in command.fields if field not in field_values]
+        if unknown:
+            raise CatalogError(
+                f"A {command.tool} template uses unknown fields: {', '.join(unknown)}"
+            )
+
+    start_hours = None
+    if start_times.distribution == BURSTY:
+        start_hours = build_start_hours(start_times, project_start, now)
+
+    return OplogPools(
+        AliasTable(commands, [command.weight for command in commands]),
+        start_times,
+        start_hours,
+        field_values,
+        src,
+        dest,
+        user_context,
+        ["Success", "Failed"],
+        operators,
+        project_start,
+        project_end,
+        now
+    )
+
+def derive_seed(seed, shard):
+    """
+    derive_seed derives the seed of one shard from the seed of the whole oplog
+
+    @param seed - the seed of the oplog, or None
+    @param shard - the shard number
+    @return seed - the seed of the shard, or None for an unseeded oplog
+    """
+
+    if seed is None:
+        return None
+    digest = hashlib.sha256(f"{seed}:{shard}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def generate_shard(file_path, first_entry, entries, seed, pools, block_size, header=True):
+    """
+    generate_shard writes a contiguous range of randomized entries to an oplog file
+
+    @param file_path - the location to create the oplog
+    @param first_entry - the entry_identifier of the first entry
+    @param entries - the number of entries to generate
+    @param seed - the seed for the shard's random draws, or None
+    @param pools - the OplogPools struct entries are drawn from
+    @param block_size - the number of entries drawn and written at a time
+    @param header - whether to write the CSV header
+    """
+
+    rng = random.Random(seed)
+
+    with oplog_formats.OplogWriter(file_path, FIELDS, header) as oplog_writer:
+        # Write the randomized entries to the oplog, one block at a time
+        for block_start in range(first_entry, first_entry + entries, block_size):
+            block_entries = min(block_size, first_entry + entries - block_start)
+            oplog_writer.writerows(generate_block(rng, block_start, block_entries, pools))
+
+def generate_block(rng, first_entry, entries, pools):
+    """
+    generate_block draws every column of a block of randomized entries as a list,
+    then zips the columns into CSV rows
+
+    @param rng - the random.Random instance used for every draw
+    @param first_entry - the entry_identifier of the first entry in the block
+    @param entries - the number of entries in the block
+    @param pools - the OplogPools struct entries are drawn from
+    @return rows - an iterable of CSV rows
+    """
+
+    random_values = rng.random
+    project_end = pools.project_end
+
+    # Start dates fall between the project start and now, and end dates between
+    # the start date and the project end
+    start_times = draw_start_times(rng, entries, pools)
+    end_times = [
+        int(start_time + random_values() * max(project_end - start_time, 0))
+        for start_time in start_times
     ]
 
-    with open(file_path, 'a', newline='') as csv_file:
-        oplog_writer = csv.DictWriter(csv_file, fieldnames=fields)
-        oplog_writer.writeheader()
-
-        generator = Faker()
-
-        src = []
-        dest = []
-        # A dict of tools and corresponding possible commands/description/comment combinations
-        tools = {
-            'Cobalt Strike': [
-                {
-                    'command': 'shinject ' + str(random.randrange(1,32768)) + ' x64 ' + generator.file_path(depth=0, extension="bin",absolute=True),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Attempting process injection'
-                }, {
-                    'command': 'sleep ' + str(random.randrange(0,100)),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Sleeping a beacon'
-                }, {
-                    'command': 'inject-assembly '+ str(random.randrange(0,32768)) + ' ' + generator.file_path(depth=1, extension="exe",absolute=True),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Injecting assembly into a process'
-                }, {
-                    'command': 'execute-assembly ' + generator.file_path(depth=1, extension="exe",absolute=True),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Running a local .NET executable'
-                }, {
-                    'command': 'upload ' + generator.file_path(depth=random.randrange(1,4), absolute=True),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Attempting a file upload'
-                }, {
-                    'command': 'cd ' + generator.file_path(depth=random.randrange(1,4), extension=[]),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Navigating to a directory'
-                }, {
-                    'command': 'spawnto x64 ' + generator.file_path(depth=random.randrange(1,4)),
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Selecting executable for post-exploitation jobs'
-                }, {
-                    'command': 'spawn x64 HTTPS',
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Spawning a new beacon'
-                }, {
-                    'command': 'pwd',
-                    'description': 'PID ' + str(random.randrange(1,32768)),
-                    'comment': 'Obtaining current working directory'
-                }
-            ],
-            'OST': [
-                {
-                    'command': 'download ' + generator.file_path(depth=random.randrange(1,4)),
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Downloading a file'
-                }, {
-                    'command': 'ls',
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Listing files and directories'                    
-                }, {
-                    'command': 'sleep ' + str(random.randrange(0,100)),
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Sleeping a beacon'
-                }, {
-                    'command': 'cd ' + generator.file_path(depth=random.randrange(1,4), extension=[]),
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Navigating to a directory'
-                }, {
-                    'command': 'bbot -t ' + generator.domain_name() + '-m nmap',
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Using BBOT port scan'
-                }, {
-                    'command': 'bbot -t ' + generator.domain_name() + '-f safe -ef passive',
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Using BBOT safe and passive modules'
-                }, {
-                    'command': 'python3 CloudScraper.py -u ' + generator.domain_name() + ' >> ' + generator.file_path(depth=random.randrange(1,4), extension="txt", absolute=True),
-                    'description': 'PID: ' + str(random.randrange(1,32768)),
-                    'comment': 'Navigating to a directory'
-                }
-            ],
-            'Poseidon': [ 
-                {
-                    'command': 'pty whoami',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Obtaining user context'
-                }, {
-                    'command': 'pty kubectl get namespaces',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Conducting container discovery'
-                }, {
-                    'command': 'pty ./kubectl can-i create pod',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Conducting container discovery'
-                }, {
-                    'command': 'pty ./kubectl get secrets',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Conducting container discovery'
-                }, {
-                    'command': 'pty ./kubectl get pods',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Conducting container discovery'
-                }, {
-                    'command': 'pty ./kubectl get namespaces -n cluster',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Conducting container discovery'
-                }, {
-                    'command': 'pty curl',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Attempting to use cURL'
-                }, {
-                    'command': 'upload {"file_id":"' + generator.uuid4() + '","remote_path"' + generator.file_path() + '","overwrite":false}',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Attempting to upload a file'
-                }, {
-                    'command': 'socks {"action":"start","port":' + str(generator.port_number(is_user=True)) + '}',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Attempting to start a SOCKS proxy'
-                }, {
-                    'command': 'sleep ' + str(random.randrange(0,100)),
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Sleeping a beacon'
-                }, {
-                    'command': 'getenv',
-                    'description': 'PID ' + str(random.randrange(1,32768)) + ', Callback ' + str(random.randrange(1,100)),
-                    'comment': 'Attempting to get environment variables'
-                }
-            ]
+    # Pick a command for every entry, then render the templates of each command
+    chosen_commands = pools.commands.sample(rng, entries)
+    commands, descriptions, comments = render_commands(rng, chosen_commands, pools.field_values)
+
+    return zip(
+        range(first_entry, first_entry + entries),
+        format_timestamps(start_times),
+        format_timestamps(end_times),
+        rng.choices(pools.src, k=entries),
+        rng.choices(pools.dest, k=entries),
+        [command.tool for command in chosen_commands],
+        rng.choices(pools.user_context, k=entries),
+        commands,
+        descriptions,
+        rng.choices(pools.output, k=entries),
+        comments,
+        rng.choices(pools.operators, k=entries),
+        [""] * entries,
+        [""] * entries,
+        [""] * entries
+    )
+
+def draw_start_times(rng, entries, pools):
+    """
+    draw_start_times draws the start dates of a block of entries between the project
+    start and now. Bursty start dates are drawn a session at a time: each session starts
+    in an hour drawn from pools.start_hours, runs for a geometrically distributed number
+    of entries, and spaces them by exponentially distributed gaps. A session that runs
+    past now ends there, and its remaining entries are drawn from later sessions, so no
+    start date is clamped onto the bounds of the project.
+
+    @param rng - the random.Random instance used for every draw
+    @param entries - the number of entries in the block
+    @param pools - the OplogPools struct entries are drawn from
+    @return start_times - a list of whole seconds since EPOCH
+    """
+
+    random_values = rng.random
+    project_start = pools.project_start
+    now = pools.now
+
+    if pools.start_hours is None:
+        start_span = now - project_start
+        return [int(project_start + random_values() * start_span) for _ in range(entries)]
+
+    config = pools.start_times
+    expovariate = rng.expovariate
+    gap_rate = 1 / max(config.mean_gap, 1e-3)
+    # Sessions run for one entry plus an exponential number more, which rounds down to a
+    # geometric distribution with the configured mean
+    extra_rate = 1 / max(config.session_entries - 1, 1e-3)
+
+    start_times = []
+    while len(start_times) < entries:
+        remaining = entries - len(start_times)
+        session_hours = pools.start_hours.sample(
+            rng,
+            max(1, int(remaining / max(config.session_entries, 1)))
+        )
+        for hour in session_hours:
+            # Sessions start in the part of the hour inside the project, which
+            # build_start_hours weights the hour by
+            first_second = max(hour, project_start)
+            start_time = first_second + random_values() * (min(hour + 3600, now) - first_second)
+            session_entries = min(1 + int(expovariate(extra_rate)), entries - len(start_times))
+            for _ in range(session_entries):
+                start_times.append(int(start_time))
+                start_time += expovariate(gap_rate)
+                if start_time >= now:
+                    break
+            if len(start_times) >= entries:
+                break
+    return start_times
+
+def build_start_hours(start_times, project_start, now):
+    """
+    build_start_hours builds the alias table sessions of bursty start dates draw their
+    hour from, covering every hour between the project start and now. The first and last
+    hours are weighted by the share of them inside the project.
+
+    @param start_times - the StartTimeConfig with the weight of each hour and weekday
+    @param project_start - the project start, in seconds since EPOCH
+    @param now - the latest possible start date, in seconds since EPOCH
+    @return start_hours - an AliasTable of the first second of each hour
+    """
+
+    hours = range(int(project_start // 3600), int(now // 3600) + 1)
+    shares = [
+        (min(hour * 3600 + 3600, now) - max(hour * 3600, project_start)) / 3600
+        for hour in hours
+    ]
+    weights = [
+        share
+        * start_times.hour_weights[hour % 24]
+        * start_times.weekday_weights[(hour // 24 + EPOCH_WEEKDAY) % 7]
+        for hour, share in zip(hours, shares)
+    ]
+    if not any(weights):
+        # Every busy hour falls outside the project, so fall back to an even spread
+        weights = shares
+    return AliasTable([hour * 3600 for hour in hours], weights)
+
+def format_timestamps(timestamps):
+    """
+    format_timestamps converts whole seconds since EPOCH to the CSV's date format
+
+    @param timestamps - a list of whole seconds since EPOCH
+    @return dates - a list of formatted dates
+    """
+
+    times_of_day = format_times_of_day()
+    return [
+        format_day(timestamp // 86400) + times_of_day[timestamp % 86400]
+        for timestamp in timestamps
+    ]
+
+@lru_cache(maxsize=None)
+def format_day(day):
+    """
+    format_day formats a day since EPOCH as a date. Generated entries span at most a
+    year or so, so every distinct day is formatted once and then reused.
+
+    @param day - the number of days since EPOCH
+    @return date - the formatted date, followed by a space
+    """
+
+    return (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d ")
+
+@lru_cache(maxsize=None)
+def format_times_of_day():
+    """
+    format_times_of_day formats every second of a day once, so dates can be built
+    with a lookup instead of per-entry formatting
+
+    @return times - a list of 86400 'HH:MM:SS' strings, indexed by second of the day
+    """
+
+    return [
+        f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        for hours in range(24)
+        for minutes in range(60)
+        for seconds in range(60)
+    ]
+
+def render_commands(rng, chosen_commands, field_values):
+    """
+    render_commands renders the command, description, and comment of every entry in a
+    block. Entries are grouped by command, every field of a group is drawn as one column,
+    and each template is rendered over those columns at once.
+
+    @param rng - the random.Random instance used for every draw
+    @param chosen_commands - the CommandTemplate chosen for each entry
+    @param field_values - a dict of field names to pools of values
+    @return (commands, descriptions, comments) - the rendered columns, in entry order
+    """
+
+    positions = {}
+    for position, command in enumerate(chosen_commands):
+        positions.setdefault(id(command), (command, []))[1].append(position)
+
+    columns = ([None] * len(chosen_commands), [None] * len(chosen_commands), [None] * len(chosen_commands))
+    for command, command_positions in positions.values():
+        count = len(command_positions)
+        drawn = {
+            field: rng.choices(field_values[field], k=count) for field in command.fields
         }
-        user_context = []
-        output = ["Success", "Failed"]
-        operators = []
-
-        # Randomize src, dest, user_context, and operators
-        for _ in range(random.randrange(2,10)):
-            src.append(generator.ipv4())
-        for _ in range(random.randrange(2,10)):
-            dest.append(generator.ipv4())
-        for _ in range(random.randrange(2,10)):
-            user_context.append(generator.ascii_company_email())
-        for _ in range(random.randrange(2,4)):
-            operators.append(generator.name())
-
-        # Randomize project start date and end date
-        project_start_datetime = generator.date_time_between(start_date='-1y')
-        project_end_datetime = generator.date_time_between(start_date=project_start_datetime)
-
-        # Write the randomized entries to the CSV
-        for entry_index in range(entries):
-            start_date = generator.date_time_between(start_date=project_start_datetime)
-            source_ip = random.choice(src)
-            dest_ip = random.choice(dest)
-            tool = random.choice(list(tools.keys()))
-            command_dict = random.choice(tools[tool])
-            oplog_writer.writerow({
-                'entry_identifier': entry_index,
-                'start_date': start_date,
-                'end_date': generator.date_time_between(
-                    start_date=start_date,
-                    end_date=project_end_datetime
-                ),
-                'source_ip': source_ip,
-                'dest_ip': dest_ip,
-                'tool': tool,
-                'user_context': random.choice(user_context),
-                'command': command_dict['command'],
-                'description': command_dict['description'],
-                'output': random.choice(output),
-                'comments': command_dict['comment'],
-                'operator_name': random.choice(operators),
-                'extra_fields': "",
-                'oplog_id': "",
-                'tags': ""
-            })
+        for column, (template, template_fields) in zip(
+            columns,
+            (command.command, command.description, command.comment)
+        ):
+            if template_fields:
+                rendered = map(template.format, *(drawn[field] for field in template_fields))
+            else:
+                rendered = [template] * count
+            for position, value in zip(command_positions, rendered):
+                column[position] = value
+
+    return columns
+
+def compile_tool_catalog(catalog, tool_weights=None):
+    """
+    compile_tool_catalog compiles every command/description/comment combination of a
+    tool catalog into a CommandTemplate, weighted by the tool's share of entries and
+    the command's share of the tool's entries
+
+    @param catalog - a dict of tool names to lists of (command, description, comment)
+                     templates, each optionally followed by the command's relative weight
+    @param tool_weights - a dict of tool names to relative weights, or None for equal weights
+    @return commands - a list of CommandTemplate objects
+    """
+
+    tool_weights = tool_weights or dict.fromkeys(catalog, 1)
+    tools_total = sum(tool_weights[tool] for tool in catalog)
+
+    commands = []
+    for tool, templates in catalog.items():
+        command_weights = [template[3] if len(template) > 3 else 1 for template in templates]
+        commands_total = sum(command_weights)
+        for (command, description, comment, *_), command_weight in zip(
+            templates,
+            command_weights
+        ):
+            compiled = [compile_template(template) for template in (command, description, comment)]
+            fields = []
+            for _, template_fields in compiled:
+                fields.extend(field for field in template_fields if field not in fields)
+            weight = 0.0
+            if tools_total and commands_total:
+                weight = tool_weights[tool] / tools_total * command_weight / commands_total
+            commands.append(CommandTemplate(tool, fields, *compiled, weight))
+    return commands
+
+def load_tool_catalog(catalog_path):
+    """
+    load_tool_catalog reads a tool catalog from a JSON file of the form
+
+    {
+        "tools": [
+            {
+                "name": "Cobalt Strike",
+                "weight": 70,
+                "commands": [
+                    {"command": "sleep {sleep}", "description": "PID {pid}",
+                     "comment": "Sleeping a beacon", "weight": 5}
+                ]
+            }
+        ],
+        "start_times": {"distribution": "bursty", "session_entries": 20, "mean_gap": 30}
+    }
+
+    Weights are relative and default to 1. Templates may use any field of
+    build_field_pools. start_times is optional, and may also set hour_weights, 24 weights
+    by UTC hour, and weekday_weights, 7 weights from Monday.
+
+    @param catalog_path - the catalog file
+    @return (catalog, tool_weights, start_times) - the templates of each tool, in the form
+                                                   of TOOL_CATALOG, the weight of each tool,
+                                                   and the StartTimeConfig
+    """
+
+    with Path(catalog_path).open() as catalog_file:
+        try:
+            document = json.load(catalog_file)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"{catalog_path} is not valid JSON: {e}")
+
+    catalog = {}
+    tool_weights = {}
+    try:
+        for tool in document["tools"]:
+            templates = []
+            for entry in tool["commands"]:
+                template = (
+                    entry["command"],
+                    entry.get("description", ""),
+                    entry.get("comment", ""),
+                    float(entry.get("weight", 1))
+                )
+                templates.append(template)
+            catalog.setdefault(tool["name"], []).extend(templates)
+            tool_weights[tool["name"]] = float(tool.get("weight", 1))
+        start_times = StartTimeConfig(**document.get("start_times", {}))
+    except (KeyError, TypeError, ValueError) as e:
+        raise CatalogError(f"{catalog_path} is not a valid tool catalog: {e!r}")
+
+    weights = [
+        *tool_weights.values(),
+        *(template[3] for templates in catalog.values() for template in templates),
+        *start_times.hour_weights,
+        *start_times.weekday_weights
+    ]
+    if any(weight < 0 for weight in weights):
+        raise CatalogError(f"{catalog_path} has negative weights")
+    if not any(
+        tool_weights[tool] and any(template[3] for template in templates)
+        for tool, templates in catalog.items()
+    ):
+        raise CatalogError(f"{catalog_path} needs a tool and command with positive weights")
+    if start_times.distribution not in (UNIFORM, BURSTY):
+        raise CatalogError(f"Unknown start time distribution '{start_times.distribution}'")
+    if len(start_times.hour_weights) != 24 or len(start_times.weekday_weights) != 7:
+        raise CatalogError("hour_weights needs 24 weights and weekday_weights needs 7")
+    return catalog, tool_weights, start_times
+
+def compile_template(template):
+    """
+    compile_template converts a template with named fields into a positional format string
+
+    @param template - a str.format template, such as 'sleep {sleep}'
+    @return (format_string, fields) - the positional template and the field at each position
+    """
+
+    format_string = []
+    fields = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        format_string.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is not None:
+            format_string.append(f"{{{len(fields)}}}")
+            fields.append(field)
+    return "".join(format_string), fields
+
+def build_field_pools(generator):
+    """
+    build_field_pools precomputes the values each template field is drawn from. Numeric
+    fields cover their whole range; Faker-generated fields hold FIELD_POOL_SIZE values.
+
+    @param generator - the Faker instance used to generate values
+    @return field_values - a dict of field names to lists of values
+    """
+
+    rng = generator.random
+
+    def sample(draw):
+        return [draw() for _ in range(FIELD_POOL_SIZE)]
+
+    pids = [str(pid) for pid in range(1, 32768)]
+    return {
+        'pid': pids,
+        'target_pid': pids,
+        'sleep': [str(sleep) for sleep in range(0, 100)],
+        'callback': [str(callback) for callback in range(1, 100)],
+        'port': [str(port) for port in range(1024, 49152)],
+        'bin_path': sample(lambda: generator.file_path(depth=0, extension="bin", absolute=True)),
+        'exe_path': sample(lambda: generator.file_path(depth=1, extension="exe", absolute=True)),
+        'upload_path': sample(lambda: generator.file_path(depth=rng.randrange(1,4), absolute=True)),
+        'directory': sample(lambda: generator.file_path(depth=rng.randrange(1,4), extension=[])),
+        'file_path': sample(lambda: generator.file_path(depth=rng.randrange(1,4))),
+        'output_path': sample(
+            lambda: generator.file_path(depth=rng.randrange(1,4), extension="txt", absolute=True)
+        ),
+        'remote_path': sample(generator.file_path),
+        'domain': sample(generator.domain_name),
+        'file_id': sample(generator.uuid4)
+    }
+
+def benchmark_generate_oplog(
+    entries,
+    block_size=BLOCK_SIZE,
+    seed=None,
+    workers=1,
+    catalog_path=None
+):
+    """
+    benchmark_generate_oplog times generate_oplog writing a temporary CSV
+
+    @param entries - the number of randomized entries to generate
+    @param block_size - the number of entries drawn and written at a time
+    @param seed - the seed for every random draw, or None
+    @param workers - the number of processes generating shards
+    @param catalog_path - a tool catalog file, or None for TOOL_CATALOG
+    @return rows_per_second - the generation throughput
+    """
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        csv_path = Path(temporary_directory) / "oplog.csv"
+        start = time.perf_counter()
+        generate_oplog(csv_path, entries, block_size, seed, workers, catalog_path=catalog_path)
+        elapsed = time.perf_counter() - start
+
+    return entries / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a randomized Ghostwriter oplog")
+    parser.add_argument("entries", type=int, help="the number of entries to generate")
+    parser.add_argument(
+        "--output",
+        default="config/oplog.csv",
+        help="the oplog to create: .csv, .jsonl, .parquet, or .oplogc (columnar), with .gz "
+             "or .zst for CSV and JSON Lines"
+    )
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="entries per block")
+    parser.add_argument("--seed", type=int, help="seed for reproducible output")
+    parser.add_argument("--workers", type=int, default=1, help="processes generating shards")
+    parser.add_argument(
+        "--catalog",
+        help="a JSON tool catalog weighting tools and commands and setting the start date "
+             "distribution, such as config/tool_catalog.json (default: the built-in catalog)"
+    )
+    parser.add_argument(
+        "--no-merge",
+        action="store_true",
+        help="leave each worker's shard as a numbered file instead of merging them"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="generate into a temporary file and report rows/sec"
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        rows_per_second = benchmark_generate_oplog(
+            args.entries,
+            args.block_size,
+            args.seed,
+            args.workers,
+            args.catalog
+        )
+        print(f"{args.entries} entries: {rows_per_second:,.0f} rows/sec")
+    else:
+        generate_oplog(
+            args.output,
+            args.entries,
+            args.block_size,
+            args.seed,
+            args.workers,
+            not args.no_merge,
+            args.catalog
+        )
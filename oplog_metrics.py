@@ -0,0 +1,424 @@
+import cProfile
+import json
+import os
+import platform
+import pstats
+import statistics
+import threading
+import time
+import tracemalloc
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import oplog_batching
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Percentiles of each histogram included in the JSON report
+PERCENTILES = (50, 90, 99)
+
+# Allocation sites listed in the report when memory is traced
+TRACEMALLOC_TOP = 20
+
+# Metric name prefix of the Prometheus textfile
+PROMETHEUS_PREFIX = "oplog_populate"
+
+# Suffixes of metrics paths written as Prometheus textfiles rather than JSON
+PROMETHEUS_SUFFIXES = (".prom", ".txt")
+
+# Class definitions
+class Histogram:
+    """
+    Histogram counts observations into LATENCY_BUCKETS, and keeps every observation for
+    exact percentiles; imports send at most tens of thousands of requests
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        @param buckets - the upper bounds of the buckets, in increasing order
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.values = []
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.values.append(value)
+
+    def summary(self):
+        """
+        summary reports the count, sum, percentiles, and buckets of the histogram
+
+        @return summary - a dictionary of the histogram's statistics
+        """
+        values = self.values
+        summary = {"count": len(values), "sum": sum(values)}
+        if len(values) > 1:
+            cuts = statistics.quantiles(values, n=100, method="inclusive")
+            summary.update({f"p{percent}": cuts[percent - 1] for percent in PERCENTILES})
+        elif values:
+            summary.update({f"p{percent}": values[0] for percent in PERCENTILES})
+        summary["max"] = max(values, default=None)
+        cumulative = 0
+        summary["buckets"] = {}
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            summary["buckets"][bound] = cumulative
+        return summary
+
+class Metrics:
+    """
+    Metrics collects the instrumentation of one run: the time spent in each phase, counters
+    of rows, bytes, requests, and retries, a histogram of request latencies, and a span for
+    every batch. Collection is off until enable is called, and every method returns at
+    once while it is off, so an uninstrumented run pays almost nothing.
+
+    Phases nest, and each one is credited only with its own time: while the reader is
+    serializing a row, the time spent parsing the row inside it counts as parsing.
+    Nesting is tracked per thread, so the reader thread and the event loop each keep their
+    own phases, and phase times can add up to more than the run's wall time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.start_clock = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+        self.batches = []
+        self.errors = []
+        self.profilers = []
+        self.profiling = False
+        self.trace_memory = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self, profiling=False, trace_memory=False):
+        """
+        enable starts collecting metrics, and optionally profiles and memory traces
+
+        @param profiling - whether blocks run under profiled() are profiled with cProfile
+        @param trace_memory - whether allocations are traced with tracemalloc
+        """
+        self.enabled = True
+        self.started = time.time()
+        self.start_clock = time.perf_counter()
+        self.profiling = profiling
+        self.trace_memory = trace_memory
+        if trace_memory:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        phase times a block of code as a phase of the run
+
+        @param name - the name of the phase, such as 'login'
+        """
+        if not self.enabled:
+            yield
+            return
+        started = self.enter()
+        try:
+            yield
+        finally:
+            self.exit(name, started)
+
+    def timed_iter(self, name, iterable):
+        """
+        timed_iter times a stage of a generator pipeline as a phase: the time spent
+        producing each item of the iterable, less the time spent in the stages it reads from
+
+        @param name - the name of the phase, such as 'validate'
+        @param iterable - the stage to time
+        @return iterable - the iterable, timed while metrics are enabled
+        """
+        if not self.enabled:
+            return iterable
+
+        def timed():
+            iterator = iter(iterable)
+            while True:
+                started = self.enter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.exit(name, started)
+                yield item
+
+        return timed()
+
+    def enter(self):
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        return time.perf_counter()
+
+    def exit(self, name, started):
+        elapsed = time.perf_counter() - started
+        stack = self.local.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self.lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += elapsed - nested
+            phase[1] += 1
+
+    def count(self, name, value=1, **labels):
+        """
+        count adds to a counter
+
+        @param name - the name of the counter, such as 'rows'
+        @param value - the amount to add
+        @param labels - labels distinguishing series of the counter, such as state='inserted'
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        """
+        observe adds a latency to a histogram
+
+        @param name - the name of the histogram, such as 'request_seconds'
+        @param seconds - the latency
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def observe_request(self, entries, seconds, outcome):
+        """
+        observe_request records one insert request: its latency, its outcome, and the
+        size of the entries it carried
+
+        @param entries - the entries sent
+        @param seconds - the seconds the request took
+        @param outcome - 'ok', or the failure class returned by oplog_batching.classify_failure
+        """
+        if not self.enabled:
+            return
+        self.observe("request_seconds", seconds)
+        self.count("requests", outcome=outcome)
+        self.count("request_bytes", oplog_batching.payload_size(entries))
+
+    def record_batch(self, batch, entry_ids, seconds, requests):
+        """
+        record_batch records the span of a sent batch
+
+        @param batch - the OplogBatch
+        @param entry_ids - the IDs of the entries it created
+        @param seconds - the seconds from its first request to its last response
+        @param requests - the number of requests it took, including retries and splits
+        """
+        if not self.enabled:
+            return
+        self.observe("batch_seconds", seconds)
+        self.count("rows", len(entry_ids), state="inserted")
+        self.count("rows", len(batch.entries) - len(entry_ids), state="rejected")
+        with self.lock:
+            self.batches.append({
+                "batch": batch.index,
+                "started": time.perf_counter() - self.start_clock - seconds,
+                "seconds": seconds,
+                "entries": len(batch.entries),
+                "inserted": len(entry_ids),
+                "requests": requests
+            })
+
+    def record_error(self, error):
+        """
+        record_error records the exception that ended the run
+
+        @param error - the exception
+        """
+        if self.enabled:
+            self.errors.append({"type": type(error).__name__, "message": str(error)})
+
+    @contextmanager
+    def profiled(self):
+        """
+        profiled runs a block under cProfile, when profiling is on. cProfile only sees the
+        thread that enables it, so every thread keeps its own profiler, resumed each time
+        the thread runs a profiled block, and the results are merged.
+        """
+        if not self.profiling or getattr(self.local, "profiling", False):
+            yield
+            return
+        profiler = getattr(self.local, "profiler", None)
+        if profiler is None:
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers.append(profiler)
+        self.local.profiling = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.local.profiling = False
+
+    def report(self):
+        """
+        report summarizes everything collected so far
+
+        @return report - a JSON-serializable dictionary
+        """
+        with self.lock:
+            report = {
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "elapsed": time.perf_counter() - self.start_clock,
+                "python": platform.python_version(),
+                "pid": os.getpid(),
+                "phases": {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in sorted(
+                        self.phases.items(), key=lambda item: -item[1][0]
+                    )
+                },
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": {
+                    name: histogram.summary() for name, histogram in self.histograms.items()
+                },
+                "batches": list(self.batches),
+                "errors": list(self.errors)
+            }
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            report["memory"] = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {
+                        "site": str(statistic.traceback),
+                        "bytes": statistic.size,
+                        "blocks": statistic.count
+                    }
+                    for statistic in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+                ]
+            }
+        return report
+
+    def write_profile(self, path):
+        """
+        write_profile merges the profiles of every profiled thread into one pstats file
+
+        @param path - the file to write, readable with 'python -m pstats'
+        @return written - whether there was a profile to write
+        """
+        with self.lock:
+            profilers = list(self.profilers)
+        if not profilers:
+            return False
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(str(path))
+        return True
+
+# The metrics of this process, and shortcuts to its methods
+METRICS = Metrics()
+phase = METRICS.phase
+timed_iter = METRICS.timed_iter
+count = METRICS.count
+observe = METRICS.observe
+observe_request = METRICS.observe_request
+record_batch = METRICS.record_batch
+record_error = METRICS.record_error
+profiled = METRICS.profiled
+
+# Function definitions
+def write_report(path, report):
+    """
+    write_report writes a metrics report as JSON or, for a .prom or .txt path, as a
+    Prometheus textfile for node_exporter's textfile collector. The file is replaced
+    atomically, so a collector never reads half of it.
+
+    @param path - the file to write
+    @param report - the dictionary returned by Metrics.report
+    """
+    path = Path(path)
+    if path.suffix in PROMETHEUS_SUFFIXES:
+        text = prometheus_text(report)
+    else:
+        text = json.dumps(report, indent=2) + "\n"
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(path.name + ".tmp")
+    temporary_path.write_text(text)
+    temporary_path.replace(path)
+
+def prometheus_text(report):
+    """
+    prometheus_text formats a metrics report in the Prometheus text exposition format.
+    Batch spans and allocation sites are left out, since they are not time series.
+
+    @param report - the dictionary returned by Metrics.report
+    @return text - the textfile contents
+    """
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+
+    def sample(name, value, **labels):
+        label_text = ",".join(
+            f'{key}="{escape_label(str(label))}"' for key, label in labels.items()
+        )
+        label_text = "{" + label_text + "}" if label_text else ""
+        lines.append(f"{PROMETHEUS_PREFIX}_{name}{label_text} {value}")
+
+    metric("elapsed_seconds", "gauge", "Wall time of the run")
+    sample("elapsed_seconds", report["elapsed"])
+    metric("phase_seconds_total", "counter", "Time spent in each phase, excluding nested phases")
+    for name, phase in report["phases"].items():
+        sample("phase_seconds_total", phase["seconds"], phase=name)
+    metric("phase_calls_total", "counter", "Number of times each phase ran")
+    for name, phase in report["phases"].items():
+        sample("phase_calls_total", phase["calls"], phase=name)
+
+    counter_names = sorted({counter["name"] for counter in report["counters"]})
+    for name in counter_names:
+        metric(f"{name}_total", "counter", f"Total {name.replace('_', ' ')}")
+        for counter in report["counters"]:
+            if counter["name"] == name:
+                sample(f"{name}_total", counter["value"], **counter["labels"])
+
+    for name, histogram in report["histograms"].items():
+        metric(name, "histogram", f"Distribution of {name.replace('_', ' ')}")
+        for bound, count in histogram["buckets"].items():
+            sample(f"{name}_bucket", count, le=bound)
+        sample(f"{name}_sum", histogram["sum"])
+        sample(f"{name}_count", histogram["count"])
+
+    metric("errors", "gauge", "Number of errors that ended the run")
+    sample("errors", len(report["errors"]))
+    if "memory" in report:
+        metric("memory_peak_bytes", "gauge", "Peak memory traced by tracemalloc")
+        sample("memory_peak_bytes", report["memory"]["peak_bytes"])
+
+    return "\n".join(lines) + "\n"
+
+def escape_label(value):
+    """
+    escape_label escapes a Prometheus label value
+
+    @param value - the label value
+    @return value - the value with backslashes, quotes, and newlines escaped
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
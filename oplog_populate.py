@@ -1,22 +1,49 @@
 import json
-import csv
-from dataclasses import dataclass
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import partial
 
 from pathlib import Path
 
 from asyncio.exceptions import TimeoutError
 
-from gql import Client, gql
+import aiohttp
+from gql import gql
 from gql.transport.aiohttp import AIOHTTPTransport
-from gql.transport.exceptions import TransportQueryError
+from gql.transport.exceptions import TransportQueryError, TransportServerError
 from graphql.error.graphql_error import GraphQLError
 
+import oplog_auth
+import oplog_batching
+import oplog_checkpoint
+import oplog_dedup
+import oplog_emulator
+import oplog_follow
+import oplog_formats
 import oplog_generator
+import oplog_metrics
+import oplog_replay
+import oplog_schema
+import oplog_transport
+import oplog_verify
 
 # Class definitions
 class JSONFileError(Exception):
     """Raised when the JSON config file could not be read"""
 
+class OplogEntryError(Exception):
+    """Raised when an oplog CSV row is missing required fields"""
+
+class OplogNotFoundError(Exception):
+    """Raised when there is no oplog to verify"""
+
 @dataclass
 class Credential:
     """Credentail objects represent credential configs"""
@@ -24,6 +51,58 @@ class Credential:
     password: str
     username: str
 
+@dataclass
+class PopulateConfig:
+    """PopulateConfig objects represent oplog population configs"""
+    batch_size: int
+    concurrency: int
+    prefetch_batches: int
+    schema_mode: str
+    transport: str = "raw"
+    compress_requests: bool = False
+    parse_workers: int = 1
+
+@dataclass
+class OplogBatch:
+    """
+    OplogBatch objects hold one batch of serialized oplog entries, along with the
+    entry_identifier range and CSV byte offsets needed to checkpoint it, and the
+    entry_identifier of every entry, used to report rejected entries
+    """
+    index: int
+    entries: list
+    first_entry: str
+    last_entry: str
+    end_offset: int
+    entry_identifiers: list = field(default_factory=list)
+    start_offset: int = 0
+
+# Transports accepted by upload_oplog_async
+TRANSPORT_GQL = "gql"
+TRANSPORT_RAW = "raw"
+
+# Location of the oplog CSV read by populate_oplog
+OPLOG_CSV_PATH = Path(__file__).parent / "config/oplog.csv"
+
+# Byte ranges queued per parse worker, ahead of the batches being sent
+PARSE_TASKS_PER_WORKER = 2
+
+# When oplog_populate verifies the oplog against the input: after importing, or instead
+VERIFY_AFTER = "after"
+VERIFY_ONLY = "only"
+
+# ID ranges scanned per fetch connection, so a slow range does not hold up the others
+FETCH_RANGES_PER_CONNECTION = 4
+
+# The sample client, project, and oplog entries are imported into
+SAMPLE_CLIENT_NAME = "SpecterPops"
+SAMPLE_CLIENT_CODENAME = "SAMPLE CLIENT"
+SAMPLE_CLIENT_TIMEZONE = "America/Los_Angeles"
+SAMPLE_PROJECT_CODENAME = "SAMPLE PROJECT"
+SAMPLE_PROJECT_START_DATE = "2024-04-23"
+SAMPLE_PROJECT_END_DATE = "2025-04-23"
+SAMPLE_OPLOG_NAME = "SpecterPops Sample Oplog"
+
 # Main function definition
 def main():
     """
@@ -32,44 +111,304 @@ def main():
     and a sample oplog "SpecterPops Sample Oplog". It attempts to read sample oplog entries from
     the file '/auto_populate_oplog/config/oplog.csv". If this file is missing, oplog_generator
     is called to create a sample oplog. This sample oplog has 5000 entries by default.
+
+    The sample client, project, and oplog are reused if earlier runs created them, so
+    repeated runs import into the same oplog; pass '--new-oplog' to create a new oplog
+    in the sample project instead.
+
+    With '--replay', entries are streamed into the oplog in start date order, paced like
+    a live operation, instead of uploaded as fast as possible.
+
+    With '--follow', the oplog file is watched as it grows, and new rows are uploaded
+    as they are appended until the process is interrupted.
+
+    With '--dedup', rows whose fields match an entry already in the oplog, or an earlier
+    row of the file, are skipped.
+
+    With '--verify', the oplog is read back once the import is done and compared against
+    the input, reporting missing and unexpected entries; '--verify only' skips the import
+    and checks the oplog given by '--oplog-id', or else the oplog of an interrupted import
+    or the sample oplog, without creating anything.
+
+    With '--metrics', the time spent in each phase of the run, counters of rows, bytes,
+    requests, and retries, and request latencies are written to a JSON file or a
+    Prometheus textfile. '--profile' and '--trace-memory' add cProfile and tracemalloc.
+
+    With '--target emulator', requests go to a local Ghostwriter emulator started in a
+    separate process instead of the configured Ghostwriter URL.
     """
+    arguments = parse_arguments()
     config = read_json_config()
 
     # Load configs
     credentials = load_credential_configs(config)
+    populate_configs = load_populate_configs(config)
+    batching_configs = load_batching_configs(config)
+
+    if arguments.metrics or arguments.profile or arguments.trace_memory:
+        oplog_metrics.METRICS.enable(bool(arguments.profile), arguments.trace_memory)
+
+    emulator_process = None
+    dedup_index = None
+    profiler = contextlib.ExitStack()
+    if arguments.target == "emulator":
+        try:
+            emulator_process, credentials.url = oplog_emulator.start_emulator_process(
+                load_emulator_configs(config)
+            )
+        except oplog_emulator.EmulatorError as e:
+            print("EmulatorError: " + str(e))
+            return
+        print(f"Using Ghostwriter emulator at {credentials.url}")
 
     try:
+        profiler.enter_context(oplog_metrics.profiled())
+
         # Use credential configs to get a Ghostwriter token
-        gw_auth_token = get_logon_token(credentials)
+        # An emulator issues new tokens every time it starts, so cached tokens are never valid
+        with oplog_metrics.phase("login"):
+            gw_auth_token = get_logon_token(
+                credentials,
+                populate_configs.schema_mode,
+                use_cache=emulator_process is None
+            )
+
+        # Log in again if Ghostwriter rejects the token partway through the upload
+        token_refresher = oplog_auth.TokenRefresher(
+            gw_auth_token,
+            lambda: get_logon_token(credentials, populate_configs.schema_mode, use_cache=False)
+        )
 
         # Set up token-based authentication
         headers = {"Authorization": f"Bearer {gw_auth_token}"}
         transport = AIOHTTPTransport(credentials.url, headers=headers)
-        authenticated_client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        client_operation = create_sample_client(authenticated_client)
-
-        project_operation = create_sample_project(
-            authenticated_client,
-            client_operation["insert_client_one"]["id"]
+        with oplog_metrics.phase("schema"):
+            authenticated_client = oplog_schema.create_client(
+                transport,
+                credentials.url,
+                populate_configs.schema_mode,
+                credentials.username,
+                headers
+            )
+
+        # Resume an interrupted batched import into its original oplog
+        journal = None
+        resumable = not (arguments.replay or arguments.follow)
+        if populate_configs.batch_size > 0 and resumable:
+            journal = oplog_checkpoint.load_checkpoint(arguments.input)
+
+        if arguments.verify == VERIFY_ONLY:
+            # Verifying must never create the client, project, or oplog it looks for
+            oplog_id = arguments.oplog_id or (journal and journal.oplog_id)
+            if not oplog_id:
+                existing = find_sample_oplog(authenticated_client)
+                if not existing["oplog"]:
+                    raise OplogNotFoundError(
+                        "There is no sample oplog to verify; pass --oplog-id to verify another"
+                    )
+                oplog_id = existing["oplog"][0]["id"]
+        elif journal:
+            print(
+                f"Resuming import into oplog {journal.oplog_id} "
+                f"at position {journal.end_offset} ({journal.rows} entries already committed)"
+            )
+            oplog_id = journal.oplog_id
+        else:
+            with oplog_metrics.phase("bootstrap"):
+                oplog_id = bootstrap_sample_oplog(authenticated_client, arguments.new_oplog)
+
+        if arguments.dedup and arguments.verify != VERIFY_ONLY:
+            with oplog_metrics.phase("dedup_index"):
+                dedup_index = asyncio.run(
+                    seed_dedup_index_async(
+                        credentials,
+                        token_refresher,
+                        oplog_id,
+                        populate_configs,
+                        load_dedup_configs(config),
+                        batching_configs
+                    )
+                )
+
+        # The raw transport is async, so it is used even when batches are sent one at a time
+        use_async = (
+            populate_configs.concurrency > 1 or populate_configs.transport == TRANSPORT_RAW
         )
-
-        oplog_operation = create_sample_oplog(
-            authenticated_client,
-            project_operation["insert_project_one"]["id"]
-        )
-
-        populate_oplog(
-            authenticated_client,
-            oplog_operation["insert_oplog_one"]["id"]
-        )
-
-    except TimeoutError:
+        if arguments.verify == VERIFY_ONLY:
+            print(f"Skipping the import of {arguments.input.name}")
+        elif not resumable or (populate_configs.batch_size > 0 and use_async):
+            asyncio.run(
+                upload_oplog_async(
+                    credentials,
+                    token_refresher,
+                    oplog_id,
+                    populate_configs,
+                    journal,
+                    batching_configs,
+                    arguments.input,
+                    load_replay_configs(config) if arguments.replay else None,
+                    load_follow_configs(config) if arguments.follow else None,
+                    dedup_index
+                )
+            )
+        else:
+            populate_oplog(
+                authenticated_client,
+                oplog_id,
+                populate_configs.batch_size,
+                journal,
+                token_refresher,
+                arguments.input,
+                batching_configs,
+                dedup_index
+            )
+
+        if dedup_index:
+            print(f"Skipped {dedup_index.skipped} entries already in oplog {oplog_id}")
+            if dedup_index.repeated:
+                print(
+                    f"Skipped {dedup_index.repeated} rows repeating an earlier row "
+                    f"of {arguments.input.name}"
+                )
+
+        if arguments.verify:
+            with oplog_metrics.phase("verify"):
+                asyncio.run(
+                    verify_oplog_async(
+                        credentials,
+                        token_refresher,
+                        oplog_id,
+                        populate_configs,
+                        load_verify_configs(config),
+                        arguments.input,
+                        arguments.dedup,
+                        batching_configs
+                    )
+                )
+
+    except TimeoutError as e:
+        oplog_metrics.record_error(e)
         print("TimeoutError")
     except TransportQueryError as e:
+        oplog_metrics.record_error(e)
+        # The server rejected a document the cached schema accepted, so the cache is stale
+        if e.errors and e.errors[0].get("extensions", {}).get("code") == "validation-failed":
+            oplog_schema.invalidate_schema_cache(credentials.url, credentials.username)
+        # The server rejected the cached token, so log in again next run
+        if oplog_auth.is_auth_error(e):
+            oplog_auth.invalidate_cached_token(credentials.url, credentials.username)
         print("TransportQueryError" + str(e))
+    except TransportServerError as e:
+        oplog_metrics.record_error(e)
+        # Ghostwriter rejected the cached token outright, so log in again next run
+        if e.code == 401:
+            oplog_auth.invalidate_cached_token(credentials.url, credentials.username)
+        print("TransportServerError: " + str(e))
     except GraphQLError as e:
+        oplog_metrics.record_error(e)
         print("GraphQLError: " + str(e))
+    except OplogEntryError as e:
+        oplog_metrics.record_error(e)
+        print("OplogEntryError: " + str(e))
+    except OplogNotFoundError as e:
+        oplog_metrics.record_error(e)
+        print("OplogNotFoundError: " + str(e))
+    except oplog_formats.OplogFormatError as e:
+        oplog_metrics.record_error(e)
+        print("OplogFormatError: " + str(e))
+    except KeyboardInterrupt:
+        print("Interrupted")
+    finally:
+        profiler.close()
+        if dedup_index:
+            oplog_metrics.count("rows", dedup_index.skipped, state="duplicate")
+            oplog_metrics.count("rows", dedup_index.repeated, state="repeated")
+        write_metrics(arguments)
+        if emulator_process:
+            print("Emulator stats: " + json.dumps(oplog_emulator.emulator_stats(credentials.url)))
+            emulator_process.terminate()
+            emulator_process.join()
+
+def parse_arguments():
+    """
+    parse_arguments reads oplog_populate's command line options
+
+    @return arguments - the parsed command line options
+    """
+    parser = argparse.ArgumentParser(
+        description="Populate a Ghostwriter oplog with sample entries"
+    )
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=OPLOG_CSV_PATH,
+        help="the oplog to import: .csv, .jsonl, .parquet, or .oplogc, with .gz or .zst for "
+             "CSV and JSON Lines (default: config/oplog.csv)"
+    )
+    parser.add_argument(
+        "--new-oplog",
+        action="store_true",
+        help="create a new oplog instead of importing into the sample oplog of earlier runs"
+    )
+    # A replay sorts the whole file up front, so it cannot follow the file as it grows
+    upload_mode = parser.add_mutually_exclusive_group()
+    upload_mode.add_argument(
+        "--replay",
+        action="store_true",
+        help="stream entries in start date order at the pace set in the 'replay' config"
+    )
+    upload_mode.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep watching the oplog file and upload rows as they are appended"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="skip rows whose fields match an entry already in the oplog"
+    )
+    parser.add_argument(
+        "--verify",
+        nargs="?",
+        const=VERIFY_AFTER,
+        choices=[VERIFY_AFTER, VERIFY_ONLY],
+        help="read the oplog back and compare it against the input once the import is "
+             "done, or with 'only', instead of importing"
+    )
+    parser.add_argument(
+        "--oplog-id",
+        type=int,
+        help="the oplog to check with '--verify only' (default: the sample oplog)"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="write phase timings, counters, and latencies to this file: a Prometheus "
+             "textfile if it ends in .prom or .txt, JSON otherwise"
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="profile the run with cProfile and write the stats to this file"
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="trace allocations with tracemalloc and report the largest allocation sites"
+    )
+    parser.add_argument(
+        "--target",
+        choices=["ghostwriter", "emulator"],
+        default="ghostwriter",
+        help="send requests to the configured Ghostwriter, or to a local emulator"
+    )
+    arguments = parser.parse_args()
+    if arguments.oplog_id is not None and arguments.verify != VERIFY_ONLY:
+        parser.error("--oplog-id requires --verify only")
+    # A follower runs until it is interrupted, so there is never a finished import to verify
+    if arguments.verify and arguments.follow:
+        parser.error("--verify cannot be used with --follow")
+    return arguments
 
 def load_credential_configs(config):
     """
@@ -95,18 +434,251 @@ def load_credential_configs(config):
         config[CREDENTIALS][GHOSTWRITER_USER]
     )
 
+def load_populate_configs(config):
+    """
+    load_populate_configs loads oplog population settings from an optional 'populate' JSON object.
+
+    This JSON object may have the following properties:
+
+    batch_size - the number of oplog entries sent per insert mutation. A value of 0 sends
+                 every entry in a single inline mutation.
+    concurrency - the maximum number of batches in flight at once. A value of 1 sends
+                  batches one after another.
+    prefetch_batches - the maximum number of batches read from the CSV ahead of the
+                       batches being sent
+    schema_mode - how requests are validated against the GraphQL schema: "cache" to use an
+                  introspection result cached on disk, "fetch" to introspect the server on
+                  every run, or "skip" to send requests without client-side validation
+    transport - how batches are sent: "raw" to encode rows straight to JSON request bodies
+                and validate the insert mutation only once, or "gql" to send every batch
+                through gql
+    compress_requests - whether "raw" request bodies are gzip compressed
+    parse_workers - the number of processes parsing, validating, and serializing an
+                    uncompressed CSV or JSON Lines oplog for concurrent uploads. A value
+                    of 1 parses in a single thread, and 0 uses one process per CPU.
+
+    @param config - the JSON object to read configurations from
+    @return PopulateConfig - a populate struct containing the population settings
+    """
+    POPULATE = "populate"
+    BATCH_SIZE = "batch_size"
+    CONCURRENCY = "concurrency"
+    PREFETCH_BATCHES = "prefetch_batches"
+    SCHEMA_MODE = "schema_mode"
+    TRANSPORT = "transport"
+    COMPRESS_REQUESTS = "compress_requests"
+    PARSE_WORKERS = "parse_workers"
+
+    DEFAULT_BATCH_SIZE = 1000
+    DEFAULT_CONCURRENCY = 4
+    DEFAULT_PREFETCH_BATCHES = 2
+    DEFAULT_SCHEMA_MODE = oplog_schema.SCHEMA_CACHE
+    DEFAULT_TRANSPORT = TRANSPORT_RAW
+
+    populate = config.get(POPULATE, {})
+
+    parse_workers = int(populate.get(PARSE_WORKERS, 1))
+    if parse_workers <= 0:
+        parse_workers = os.cpu_count() or 1
+
+    return PopulateConfig(
+        int(populate.get(BATCH_SIZE, DEFAULT_BATCH_SIZE)),
+        max(1, int(populate.get(CONCURRENCY, DEFAULT_CONCURRENCY))),
+        max(1, int(populate.get(PREFETCH_BATCHES, DEFAULT_PREFETCH_BATCHES))),
+        populate.get(SCHEMA_MODE, DEFAULT_SCHEMA_MODE),
+        populate.get(TRANSPORT, DEFAULT_TRANSPORT),
+        bool(populate.get(COMPRESS_REQUESTS, False)),
+        parse_workers
+    )
+
+def load_batching_configs(config):
+    """
+    load_batching_configs loads batch sizing and retry settings from an optional 'batching'
+    JSON object. The populate batch_size sets the size of the first batch.
+
+    This JSON object may have the following properties:
+
+    adaptive - whether batch sizes are tuned from the latency and size of earlier batches
+    min_batch_size - the smallest batch size adaptive sizing picks
+    max_batch_size - the largest batch size adaptive sizing picks
+    target_latency - the seconds adaptive sizing aims for each insert mutation to take
+    max_payload_bytes - a known request body limit, or 0 to learn it from 413 responses
+    max_retries - the number of times a request failing with a transient error is resent
+    backoff - the seconds waited after the first failure, doubling with each further one
+    max_backoff - the longest wait between attempts, in seconds
+
+    @param config - the JSON object to read configurations from
+    @return BatchingConfig - a batching struct containing the batching settings
+    """
+    BATCHING = "batching"
+
+    defaults = oplog_batching.BatchingConfig()
+    batching = config.get(BATCHING, {})
+
+    return oplog_batching.BatchingConfig(
+        adaptive=bool(batching.get("adaptive", defaults.adaptive)),
+        min_batch_size=max(1, int(batching.get("min_batch_size", defaults.min_batch_size))),
+        max_batch_size=max(1, int(batching.get("max_batch_size", defaults.max_batch_size))),
+        target_latency=float(batching.get("target_latency", defaults.target_latency)),
+        max_payload_bytes=int(batching.get("max_payload_bytes", defaults.max_payload_bytes)),
+        max_retries=max(0, int(batching.get("max_retries", defaults.max_retries))),
+        backoff=float(batching.get("backoff", defaults.backoff)),
+        max_backoff=float(batching.get("max_backoff", defaults.max_backoff))
+    )
+
+def load_replay_configs(config):
+    """
+    load_replay_configs loads live replay settings from an optional 'replay' JSON object.
+
+    This JSON object may have the following properties:
+
+    speedup - how many times faster than real time entries are replayed, following the
+              gaps between their start dates, or 0 to send them as fast as rate allows
+    rate - the most entries sent per second, or 0 for no cap
+    burst - the most entries sent at once after a pause, before rate applies
+    max_batch_size - the most entries that are due together coalesced into one insert
+
+    @param config - the JSON object to read configurations from
+    @return ReplayConfig - a replay struct containing the replay settings
+    """
+    REPLAY = "replay"
+
+    defaults = oplog_replay.ReplayConfig()
+    replay = config.get(REPLAY, {})
+
+    return oplog_replay.ReplayConfig(
+        speedup=max(0.0, float(replay.get("speedup", defaults.speedup))),
+        rate=max(0.0, float(replay.get("rate", defaults.rate))),
+        burst=max(1, int(replay.get("burst", defaults.burst))),
+        max_batch_size=max(1, int(replay.get("max_batch_size", defaults.max_batch_size)))
+    )
+
+def load_follow_configs(config):
+    """
+    load_follow_configs loads follow mode settings from an optional 'follow' JSON object.
+
+    This JSON object may have the following properties:
+
+    poll_interval - the seconds between checks of the followed file for new rows
+
+    @param config - the JSON object to read configurations from
+    @return FollowConfig - a follow struct containing the follow settings
+    """
+    FOLLOW = "follow"
+
+    defaults = oplog_follow.FollowConfig()
+    follow = config.get(FOLLOW, {})
+
+    return oplog_follow.FollowConfig(
+        poll_interval=max(0.1, float(follow.get("poll_interval", defaults.poll_interval)))
+    )
+
+def load_dedup_configs(config):
+    """
+    load_dedup_configs loads dedup index settings from an optional 'dedup' JSON object.
+
+    This JSON object may have the following properties:
+
+    page_size - the number of oplog entries fetched per query while seeding the index
+    concurrency - the maximum number of fetch queries in flight at once
+
+    @param config - the JSON object to read configurations from
+    @return DedupConfig - a dedup struct containing the fetch settings
+    """
+    DEDUP = "dedup"
+
+    defaults = oplog_dedup.DedupConfig()
+    dedup = config.get(DEDUP, {})
+
+    return oplog_dedup.DedupConfig(
+        page_size=max(1, int(dedup.get("page_size", defaults.page_size))),
+        concurrency=max(1, int(dedup.get("concurrency", defaults.concurrency)))
+    )
+
+def load_emulator_configs(config):
+    """
+    load_emulator_configs loads local emulator settings from an optional 'emulator' JSON object.
+
+    This JSON object may have the following properties:
+
+    port - the local port the emulator listens on
+    latency - seconds added to every request
+    max_payload_bytes - request bodies larger than this are rejected with 413, or 0 for no limit
+    error_rate - the fraction of requests answered with error_status
+    error_status - the HTTP status of injected errors
+    max_rows_per_second - a cap on inserted oplog entries per second, or 0 for no cap
+    token_lifetime - seconds before tokens issued by the emulator expire
+
+    @param config - the JSON object to read configurations from
+    @return EmulatorConfig - an emulator struct containing the emulator settings
+    """
+    EMULATOR = "emulator"
+
+    DEFAULT_PORT = 18080
+
+    emulator = config.get(EMULATOR, {})
+
+    return oplog_emulator.EmulatorConfig(
+        port=int(emulator.get("port", DEFAULT_PORT)),
+        latency=float(emulator.get("latency", 0.0)),
+        max_payload_bytes=int(emulator.get("max_payload_bytes", 0)),
+        error_rate=float(emulator.get("error_rate", 0.0)),
+        error_status=int(emulator.get("error_status", 503)),
+        max_rows_per_second=float(emulator.get("max_rows_per_second", 0.0)),
+        token_lifetime=float(emulator.get("token_lifetime", 3600.0))
+    )
+
+def load_verify_configs(config):
+    """
+    load_verify_configs loads read-back verification settings from an optional 'verify'
+    JSON object.
+
+    This JSON object may have the following properties:
+
+    page_size - the number of oplog entries fetched per query
+    concurrency - the maximum number of fetch queries in flight at once
+    max_reported - the most missing rows and unexpected entries printed as examples
+
+    @param config - the JSON object to read configurations from
+    @return VerifyConfig - a verify struct containing the verification settings
+    """
+    VERIFY = "verify"
+
+    defaults = oplog_verify.VerifyConfig()
+    verify = config.get(VERIFY, {})
+
+    return oplog_verify.VerifyConfig(
+        page_size=max(1, int(verify.get("page_size", defaults.page_size))),
+        concurrency=max(1, int(verify.get("concurrency", defaults.concurrency))),
+        max_reported=max(0, int(verify.get("max_reported", defaults.max_reported)))
+    )
+
 # Function definitions
-def get_logon_token(credentials):
+def get_logon_token(credentials, schema_mode=oplog_schema.SCHEMA_FETCH, use_cache=True):
     """
-    get_logon_token obtains an authentication token from ghostwriter
+    get_logon_token obtains an authentication token from ghostwriter. Tokens are cached
+    with the expiry returned by the login mutation, and a cached token is reused until
+    shortly before it expires.
     
     # @param credentials an object containing the ghostwriter URL, username, and password
+    # @param schema_mode how the login request is validated against the GraphQL schema
+    # @param use_cache whether a cached token may be returned instead of logging in
     # @return the ghostwriter authentication token
     """
 
+    if use_cache:
+        cached_token = oplog_auth.load_cached_token(credentials.url, credentials.username)
+        if cached_token:
+            return cached_token
+
     # Prepare our initial unauthenticated GraphQL client
     transport = AIOHTTPTransport(credentials.url)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    client = oplog_schema.create_client(
+        transport,
+        credentials.url,
+        schema_mode,
+        "anonymous"
+    )
 
     # Define our gql query
     get_logon_token_query = gql(
@@ -128,46 +700,134 @@ def get_logon_token(credentials):
         get_logon_token_query,
         variable_values=get_logon_token_query_params
     )
+
+    oplog_auth.save_cached_token(
+        credentials.url,
+        credentials.username,
+        login_result["login"]["token"],
+        login_result["login"]["expires"]
+    )
     return login_result["login"]["token"]
 
-def create_sample_client(gql_client):
+def bootstrap_sample_oplog(gql_client, new_oplog=False):
     """
-    create_sample_project issues Ghostwriter GraphQL API requests
-    to generate a sample client: 'SpecterPops'
+    bootstrap_sample_oplog returns the ID of the sample oplog 'SpecterPops Sample Oplog',
+    reusing the sample client, project, and oplog left by earlier runs. All three are
+    looked up in a single query by find_sample_oplog; whatever is missing is created with
+    a single nested insert. Repeated runs therefore land in the same oplog after one round
+    trip, and the first run takes two.
 
     @param gql_client - the GraphQL API client to use when issuing API requests
-    @return result - the ID of the new 'SpecterPops' client
+    @param new_oplog - whether to create a new oplog even if the sample oplog exists
+    @return oplog_id - the ID of the sample oplog
     """
 
-    CLIENT_NAME = "SpecterPops"
-    CLIENT_CODENAME = "SAMPLE CLIENT"
-    TIMEZONE = "America/Los_Angeles"
+    existing = find_sample_oplog(gql_client)
 
-    # Define our gql query
-    sample_client = gql(
+    if existing["oplog"] and not new_oplog:
+        print(f"Reusing oplog {existing['oplog'][0]['id']}")
+        return existing["oplog"][0]["id"]
+
+    if not existing["client"]:
+        result = create_sample_client(gql_client)
+        return result["insert_client_one"]["projects"][0]["oplogs"][0]["id"]
+
+    client = existing["client"][0]
+    if not client["projects"]:
+        result = create_sample_project(gql_client, client["id"])
+        return result["insert_project_one"]["oplogs"][0]["id"]
+
+    result = create_sample_oplog(gql_client, client["projects"][0]["id"])
+    return result["insert_oplog_one"]["id"]
+
+def find_sample_oplog(gql_client):
+    """
+    find_sample_oplog looks up the oldest sample oplog, and the oldest sample client with
+    its oldest sample project, in a single query
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @return result - the matching "oplog" and "client" lists, each with at most one item
+    """
+
+    find_sample = gql(
         """
-        mutation create_sample_client(
+        query find_sample_oplog(
             $client_name: String!,
-            $code_name: String!,
-            $timezone: String!
+            $project_codename: String!,
+            $oplog_name: String!
         ) {
-            insert_client_one(
-                object: {
-                    name: $client_name, 
-                    codename: $code_name, 
-                    timezone: $timezone
-                }
+            oplog(
+                where: {
+                    name: {_eq: $oplog_name},
+                    project: {
+                        codename: {_eq: $project_codename},
+                        client: {name: {_eq: $client_name}}
+                    }
+                },
+                order_by: {id: asc},
+                limit: 1
             ) {
                 id
             }
+            client(
+                where: {name: {_eq: $client_name}},
+                order_by: {id: asc},
+                limit: 1
+            ) {
+                id
+                projects(
+                    where: {codename: {_eq: $project_codename}},
+                    order_by: {id: asc},
+                    limit: 1
+                ) {
+                    id
+                }
+            }
+        }
+        """
+    )
+
+    find_sample_param = {
+        "client_name": SAMPLE_CLIENT_NAME,
+        "project_codename": SAMPLE_PROJECT_CODENAME,
+        "oplog_name": SAMPLE_OPLOG_NAME
+    }
+
+    result = gql_client.execute(find_sample, variable_values=find_sample_param)
+    return result
+
+def create_sample_client(gql_client):
+    """
+    create_sample_client issues a Ghostwriter GraphQL API request to generate a sample
+    client 'SpecterPops', with its sample project and oplog nested in the same insert
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @return result - the IDs of the new client, its project, and the project's oplog
+    """
+
+    sample_client = gql(
+        """
+        mutation create_sample_client($client: client_insert_input!) {
+            insert_client_one(object: $client) {
+                id
+                projects {
+                    id
+                    oplogs {
+                        id
+                    }
+                }
+            }
         }
         """
     )
 
     create_sample_client_param = {
-        "client_name": CLIENT_NAME,
-        "code_name": CLIENT_CODENAME,
-        "timezone": TIMEZONE
+        "client": {
+            "name": SAMPLE_CLIENT_NAME,
+            "codename": SAMPLE_CLIENT_CODENAME,
+            "timezone": SAMPLE_CLIENT_TIMEZONE,
+            "projects": {"data": [sample_project_object()]}
+        }
     }
 
     result = gql_client.execute(sample_client, variable_values=create_sample_client_param)
@@ -175,46 +835,29 @@ def create_sample_client(gql_client):
 
 def create_sample_project(gql_client, client_id):
     """
-    create_sample_project issues Ghostwriter GraphQL API requests
-    to generate a sample project: 'SAMPLE PROJECT'
+    create_sample_project issues a Ghostwriter GraphQL API request to generate a sample
+    project 'SAMPLE PROJECT', with its sample oplog nested in the same insert
 
     @param gql_client - the GraphQL API client to use when issuing API requests
     @param client_id - the ID of the owner client of the sample project
-    @return result - the ID of the new 'SAMPLE PROJECT' project
+    @return result - the IDs of the new project and its oplog
     """
 
-    SAMPLE_PROJECT_CODENAME = "SAMPLE PROJECT"
-    START_DATE = "2024-04-23"
-    END_DATE = "2025-04-23"
-
     sample_project = gql(
         """
-        mutation create_sample_project(
-            $client_id: bigint!, 
-            $code_name: String!,
-            $start_date: date!, 
-            $end_date: date!
-        ) {
-            insert_project_one(
-                object: {
-                    clientId: $client_id,
-                    codename: $code_name,
-                    startDate: $start_date,
-                    endDate: $end_date,
-                    projectTypeId: "1"
-                }
-            ) {
+        mutation create_sample_project($project: project_insert_input!) {
+            insert_project_one(object: $project) {
                 id
+                oplogs {
+                    id
+                }
             }
         }
         """
     )
 
     create_sample_project_param = {
-        "client_id": client_id,
-        "code_name": SAMPLE_PROJECT_CODENAME,
-        "start_date": START_DATE,
-        "end_date": END_DATE
+        "project": {"clientId": client_id, **sample_project_object()}
     }
 
     result = gql_client.execute(sample_project, variable_values=create_sample_project_param)
@@ -230,8 +873,6 @@ def create_sample_oplog(gql_client, project_id):
     @return result - the ID of the new 'SpecterPops Sample Oplog' oplog
     """
 
-    SAMPLE_OPLOG_NAME = "SpecterPops Sample Oplog"
-
     sample_oplog = gql(
         """
         mutation create_sample_oplog(
@@ -258,35 +899,170 @@ def create_sample_oplog(gql_client, project_id):
     result = gql_client.execute(sample_oplog, variable_values=create_sample_oplog_param)
     return result
 
-def populate_oplog(gql_client, oplog_id):
+def sample_project_object():
+    """
+    sample_project_object builds the project_insert_input of the sample project, with its
+    sample oplog nested inside
+
+    @return project - the project_insert_input dictionary, without a clientId
+    """
+
+    return {
+        "codename": SAMPLE_PROJECT_CODENAME,
+        "startDate": SAMPLE_PROJECT_START_DATE,
+        "endDate": SAMPLE_PROJECT_END_DATE,
+        "projectTypeId": "1",
+        "oplogs": {"data": [{"name": SAMPLE_OPLOG_NAME}]}
+    }
+
+def populate_oplog(
+    gql_client,
+    oplog_id,
+    batch_size=0,
+    journal=None,
+    token_refresher=None,
+    csv_path=OPLOG_CSV_PATH,
+    batching_configs=None,
+    dedup_index=None
+):
     """
     populate_oplog issues Ghostwriter GraphQL API requests
     to fill an oplog with entries. This function attempts to read these entries
     from 'config/oplog.csv'. If this file does not exist, this function calls 
     oplog_generator to try to generate randomized 5000 entries.
 
+    When batch_size is greater than 0, entries stream through read_oplog_batches and
+    are sent in chunks as GraphQL variables, so only one chunk is held in memory at a
+    time. The first chunk holds batch_size entries; later chunks are sized by a
+    BatchSizer from the latency and payload size of earlier ones. Failed chunks are
+    split and retried, and entries Ghostwriter will not accept on their own are written
+    to a reject file next to the CSV. Each committed batch is recorded in a checkpoint
+    journal, so an interrupted import resumes at the first uncommitted batch. Otherwise,
+    every entry is sent in a single inline mutation.
+
     @param gql_client - the GraphQL API client to use when issuing API requests
     @param oplog_id - the ID of the oplog the function populates
-    @return result - the IDs of the new oplog entries 
+    @param batch_size - the number of entries to send per insert mutation
+    @param journal - the CheckpointJournal to resume from, or None to start a new import
+    @param token_refresher - the TokenRefresher authenticating batches, or None to use
+                             the client's own headers
+    @param csv_path - the oplog file to read entries from
+    @param batching_configs - the BatchingConfig sizing and retrying batches, or None for
+                              the defaults
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @return result - the number of new oplog entries
+    """
+
+    oplog_file = open_oplog_file(csv_path)
+
+    result = 0
+    try:
+        if batch_size > 0:
+            batch_sizer = oplog_batching.BatchSizer(batch_size, batching_configs)
+            reject_file = oplog_batching.RejectFile(oplog_batching.reject_path(csv_path))
+            if journal is None:
+                journal = oplog_checkpoint.start_checkpoint(csv_path, oplog_id)
+                reject_file.clear()
+            batches = read_oplog_batches(
+                oplog_file,
+                oplog_id,
+                batch_sizer,
+                journal.end_offset,
+                journal.next_batch,
+                dedup_index,
+                journal.committed_filter()
+            )
+            inserted = insert_oplog_batches(
+                gql_client,
+                batches,
+                token_refresher,
+                batch_sizer,
+                reject_file
+            )
+            for batch, entry_ids in inserted:
+                with oplog_metrics.phase("checkpoint"):
+                    journal.record(batch, len(entry_ids))
+                print_oplog_batch(batch, entry_ids)
+                result += len(entry_ids)
+            journal.complete()
+            print_rejected_entries(reject_file)
+        else:
+            oplog_entries = (
+                oplog_entry for oplog_entry, _ in read_oplog_rows(oplog_file, 0, dedup_index)
+            )
+            entry_ids = insert_oplog_inline(gql_client, oplog_id, oplog_entries)
+            result = len(entry_ids)
+    finally:
+        oplog_file.close()
+
+    return result
+
+def print_oplog_batch(batch, entry_ids):
+    """
+    print_oplog_batch reports the entries a committed batch created and rejected. The
+    range of IDs is only printed when it has no gaps: the chunks of a split batch are
+    inserted separately, so other batches' entries may be interleaved with them.
+
+    @param batch - the OplogBatch that was committed
+    @param entry_ids - the IDs of the oplog entries it created
+    """
+
+    message = f"Batch {batch.index}: inserted {len(entry_ids)} entries"
+    ids = [int(entry_id) for entry_id in entry_ids]
+    if ids and all(next_id == entry_id + 1 for entry_id, next_id in zip(ids, ids[1:])):
+        message += f" (IDs {ids[0]}-{ids[-1]})"
+    rejected = len(batch.entries) - len(entry_ids)
+    if rejected:
+        message += f", rejected {rejected}"
+    print(message)
+
+def print_rejected_entries(reject_file):
+    """
+    print_rejected_entries points to the reject file if any entries were rejected
+
+    @param reject_file - the RejectFile of the import
+    """
+
+    if reject_file.rejected:
+        print(f"Rejected {reject_file.rejected} entries: see {reject_file.path}")
+
+def open_oplog_file(csv_path=OPLOG_CSV_PATH):
+    """
+    open_oplog_file opens an oplog, 'config/oplog.csv' by default, for reading. The format
+    is chosen by the file's suffixes: CSV, JSON Lines, Parquet, or columnar, with CSV and
+    JSON Lines optionally gzip or zstd compressed. If this file does not exist, oplog_generator
+    is called to create it with 5000 randomized entries in that format.
+
+    @param csv_path - the oplog file to open
+    @return oplog_file - the open OplogFile
     """
 
-    CSV_FILE_NAME = "config/oplog.csv"
     NUM_ENTRIES = 5000
-    csv_path = Path(__file__).parent / CSV_FILE_NAME
-    csv_file = None
-    ghostwriter_csv = None
+    csv_path = Path(csv_path)
+
     try:
-        csv_file = csv_path.open()
-        ghostwriter_csv = csv.DictReader(csv_file)
+        oplog_file = oplog_formats.OplogFile(csv_path)
     except FileNotFoundError:
         print("Oplog Not Found: Generating an oplog")
 
         # Generate NUM_ENTRIES entries
-        oplog_generator.generate_oplog(CSV_FILE_NAME, NUM_ENTRIES)
+        oplog_generator.generate_oplog(csv_path, NUM_ENTRIES)
 
-        # Open the CSV containing the newly generated entries
-        csv_file = csv_path.open()
-        ghostwriter_csv = csv.DictReader(csv_file)
+        # Open the file containing the newly generated entries
+        oplog_file = oplog_formats.OplogFile(csv_path)
+
+    return oplog_file
+
+def insert_oplog_inline(gql_client, oplog_id, oplog_entries):
+    """
+    insert_oplog_inline sends every oplog entry in a single mutation, with
+    the entries written inline as GraphQL object literals
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param oplog_entries - an iterable of oplog entry dictionaries read from the CSV
+    @return entry_ids - the IDs of the new oplog entries
+    """
 
     gql_prefix = (
         """
@@ -307,12 +1083,11 @@ def populate_oplog(gql_client, oplog_id):
         """
     )
 
-    index = 0
-
-    # For every entry, validate the entry, and append to the GQL query
-    for oplog_entry in ghostwriter_csv:
+    # For every entry, validate the entry, and collect its GQL object literal
+    gql_objects = []
+    for oplog_entry in oplog_entries:
         oplog_entry = validate_oplog_entry(oplog_entry)
-        append_string = (
+        gql_objects.append(
             f'\n{{'
             f'oplog: "{oplog_id}", '
             f'startDate: "{oplog_entry["start_date"]}", '
@@ -325,23 +1100,1711 @@ def populate_oplog(gql_client, oplog_id):
             f'description: "{oplog_entry["description"]}", '
             f'comments: "{oplog_entry["comments"]}", '
             f'operatorName: "{oplog_entry["operator_name"]}"'
-            f'}},'
+            f'}}'
         )
-        index = index + 1
-        gql_prefix += append_string
-
-    # Removes the externeous ','
-    gql_prefix = gql_prefix[:-1]
 
-    # Concatenate prefix and postfix for the full GQL query
-    gql_query = gql_prefix + gql_postfix
+    # Join prefix, comma-separated objects, and postfix for the full GQL query
+    gql_query = gql_prefix + ",".join(gql_objects) + gql_postfix
 
     result = gql_client.execute(gql(gql_query))
+    return [entry["id"] for entry in result["insert_oplogEntry"]["returning"]]
+
+# CSV fields sent to Ghostwriter for every oplog entry
+OPLOG_ENTRY_FIELDS = (
+    "start_date",
+    "end_date",
+    "source_ip",
+    "dest_ip",
+    "tool",
+    "user_context",
+    "command",
+    "description",
+    "comments",
+    "operator_name"
+)
+
+# Parsed once and reused for every batch sent by insert_oplog_batches
+POPULATE_OPLOG_BATCH = gql(
+    """
+    mutation populate_oplog_batch($objects: [oplogEntry_insert_input!]!) {
+        insert_oplogEntry(objects: $objects) {
+            returning {
+                id
+            }
+        }
+    }
+    """
+)
 
-    csv_file.close()
+# The newest entry of an oplog, which bounds the ID ranges fetched by fetch_oplog_entries_async
+LAST_OPLOG_ENTRY = gql(
+    """
+    query last_oplog_entry($oplog: bigint!) {
+        oplogEntry(where: {oplog: {_eq: $oplog}}, order_by: {id: desc}, limit: 1) {
+            id
+        }
+    }
+    """
+)
+
+# One keyset page of an oplog's entries, with the fields populate_oplog sends
+OPLOG_ENTRY_PAGE = gql(
+    """
+    query oplog_entry_page($oplog: bigint!, $after: bigint!, $last: bigint!, $limit: Int!) {
+        oplogEntry(
+            where: {oplog: {_eq: $oplog}, id: {_gt: $after, _lte: $last}},
+            order_by: {id: asc},
+            limit: $limit
+        ) {
+            id
+            startDate
+            endDate
+            sourceIp
+            destIp
+            tool
+            userContext
+            command
+            description
+            comments
+            operatorName
+        }
+    }
+    """
+)
+
+def insert_oplog_batches(
+    gql_client,
+    batches,
+    token_refresher=None,
+    batch_sizer=None,
+    reject_file=None
+):
+    """
+    insert_oplog_batches sends batches of serialized oplog entries one after another
+    with insert_oplog_batch. Only the current batch is held in memory.
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @param batches - an iterable of OplogBatch objects
+    @param token_refresher - the TokenRefresher authenticating batches, or None
+    @param batch_sizer - the BatchSizer to report insert latencies and failures to, or None
+    @param reject_file - the RejectFile receiving entries Ghostwriter will not accept, or
+                         None to raise the error instead
+    @yield (batch, entry_ids) - each sent batch and the IDs it created
+    """
+
+    for batch in batches:
+        yield batch, insert_oplog_batch(
+            gql_client,
+            batch,
+            token_refresher,
+            batch_sizer,
+            reject_file
+        )
+
+def insert_oplog_batch(gql_client, batch, token_refresher=None, batch_sizer=None, reject_file=None):
+    """
+    insert_oplog_batch sends one batch of serialized oplog entries. When an insert times out,
+    is too large, or is refused because of the data in a row, oplog_batching.plan_retry
+    decides whether to resend it, split it in half, or write a single entry to the reject
+    file, waiting with exponential backoff between attempts. The IDs of the inserted
+    entries are returned in CSV order.
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @param batch - the OplogBatch to send
+    @param token_refresher - the TokenRefresher authenticating the batch, or None
+    @param batch_sizer - the BatchSizer to report insert latencies and failures to, or None
+    @param reject_file - the RejectFile receiving entries Ghostwriter will not accept, or
+                         None to raise the error instead
+    @return entry_ids - the IDs of the new oplog entries
+    """
+
+    batch_sizer = batch_sizer or oplog_batching.BatchSizer(len(batch.entries))
+
+    entry_ids = []
+    chunks = deque([(0, len(batch.entries), 0)])
+    batch_started = time.perf_counter()
+    requests = 0
+    while chunks:
+        start, end, attempts = chunks.popleft()
+        entries = batch.entries[start:end]
+        started = time.perf_counter()
+        requests += 1
+        try:
+            with oplog_metrics.phase("insert"):
+                entry_ids.extend(execute_oplog_insert(gql_client, entries, token_refresher))
+        except oplog_batching.RETRYABLE_ERRORS as e:
+            oplog_metrics.observe_request(
+                entries,
+                time.perf_counter() - started,
+                oplog_batching.classify_failure(e) or "error"
+            )
+            delay = requeue_oplog_chunk(
+                chunks,
+                batch,
+                (start, end, attempts),
+                e,
+                batch_sizer,
+                reject_file
+            )
+            time.sleep(delay)
+            continue
+        batch_sizer.observe(entries, time.perf_counter() - started)
+        oplog_metrics.observe_request(entries, time.perf_counter() - started, "ok")
+
+    oplog_metrics.record_batch(batch, entry_ids, time.perf_counter() - batch_started, requests)
+    return entry_ids
+
+def execute_oplog_insert(gql_client, entries, token_refresher=None):
+    """
+    execute_oplog_insert sends serialized oplog entries as the $objects variable of
+    one pre-parsed insert mutation. If Ghostwriter rejects the token, the
+    token_refresher logs in again and the entries are resent.
+
+    @param gql_client - the GraphQL API client to use when issuing API requests
+    @param entries - a list of oplogEntry_insert_input dictionaries
+    @param token_refresher - the TokenRefresher authenticating the insert, or None
+    @return entry_ids - the IDs of the new oplog entries
+    """
+
+    refreshed = False
+    while True:
+        token = token_refresher.token if token_refresher else None
+        try:
+            result = gql_client.execute(
+                POPULATE_OPLOG_BATCH,
+                variable_values={"objects": entries},
+                extra_args=token_refresher.extra_args() if token_refresher else None
+            )
+            break
+        except (TransportQueryError, TransportServerError) as e:
+            # Resend once with a new token; a second rejection is not an expiry
+            if refreshed or not token_refresher or not oplog_auth.is_auth_error(e):
+                raise
+            token_refresher.refresh(token)
+            oplog_metrics.count("token_refreshes")
+            refreshed = True
+    return [entry["id"] for entry in result["insert_oplogEntry"]["returning"]]
+
+def requeue_oplog_chunk(chunks, batch, chunk, error, batch_sizer, reject_file):
+    """
+    requeue_oplog_chunk puts a failed chunk of a batch back at the front of the queue of
+    chunks to send, as planned by oplog_batching.plan_retry, or writes it to the reject
+    file. The halves of a split chunk start with a fresh attempt count.
+
+    @param chunks - the deque of (start, end, attempts) chunks still to send
+    @param batch - the OplogBatch the chunk belongs to
+    @param chunk - the (start, end, attempts) chunk that failed
+    @param error - the exception raised while sending the chunk
+    @param batch_sizer - the BatchSizer to report the failure to
+    @param reject_file - the RejectFile receiving entries Ghostwriter will not accept, or None
+    @return delay - the seconds to wait before sending the next chunk
+    """
+
+    start, end, attempts = chunk
+    plan = oplog_batching.plan_retry(batch_sizer, error, batch.entries[start:end], attempts + 1)
+    if plan is None or (plan[0] == oplog_batching.REJECT and reject_file is None):
+        raise error
+
+    action, delay = plan
+    oplog_metrics.count("retries", action=action)
+    if action == oplog_batching.REJECT:
+        reject_file.write(batch, batch.entry_identifiers[start], batch.entries[start], error)
+    elif action == oplog_batching.SPLIT:
+        middle = (start + end) // 2
+        chunks.appendleft((middle, end, 0))
+        chunks.appendleft((start, middle, 0))
+    else:
+        chunks.appendleft((start, end, attempts + 1))
+    return delay
+
+async def seed_dedup_index_async(
+    credentials,
+    token_refresher,
+    oplog_id,
+    populate_configs,
+    dedup_configs=None,
+    batching_configs=None
+):
+    """
+    seed_dedup_index_async loads the dedup index saved for an oplog by earlier runs, adds
+    the entries created since, fetched with fetch_oplog_entries_async, and saves it again.
+    The first run for an oplog fetches every entry.
+
+    @param credentials - an object containing the ghostwriter URL
+    @param token_refresher - the TokenRefresher holding the ghostwriter authentication token
+    @param oplog_id - the ID of the oplog to index
+    @param populate_configs - a populate struct containing the schema mode
+    @param dedup_configs - the DedupConfig of the fetch, or None for the defaults
+    @param batching_configs - the BatchingConfig retrying page queries, or None for the
+                              defaults
+    @return dedup_index - the up-to-date DedupIndex
+    """
+
+    dedup_configs = dedup_configs or oplog_dedup.DedupConfig()
+    dedup_index = oplog_dedup.load_dedup_index(credentials.url, oplog_id)
+    indexed = len(dedup_index.digests)
+
+    gql_client = await create_fetch_client_async(
+        credentials,
+        token_refresher,
+        populate_configs,
+        dedup_configs.concurrency
+    )
+
+    fetched = 0
+    async with gql_client as session:
+        pages = fetch_oplog_entries_async(
+            session,
+            oplog_id,
+            dedup_index.max_id,
+            dedup_configs.page_size,
+            dedup_configs.concurrency,
+            token_refresher=token_refresher,
+            batching_configs=batching_configs
+        )
+        async for page in pages:
+            dedup_index.add_entries(page)
+            fetched += len(page)
+
+    if fetched or not dedup_index.path.exists():
+        dedup_index.save()
+    print(
+        f"Dedup index of oplog {oplog_id}: {indexed} entries saved, {fetched} fetched, "
+        f"{len(dedup_index.digests)} distinct"
+    )
+    return dedup_index
+
+async def verify_oplog_async(
+    credentials,
+    token_refresher,
+    oplog_id,
+    populate_configs,
+    verify_configs=None,
+    csv_path=OPLOG_CSV_PATH,
+    distinct=False,
+    batching_configs=None
+):
+    """
+    verify_oplog_async reads an oplog back from Ghostwriter and compares it against the
+    file it was imported from. The file is hashed row by row with an OplogVerifier, then
+    the oplog's entries are fetched with fetch_oplog_entries_async and matched against
+    the file page by page. Missing and unexpected entries are reported, with examples,
+    along with the throughput and page latencies of the fetch.
+
+    @param credentials - an object containing the ghostwriter URL
+    @param token_refresher - the TokenRefresher holding the ghostwriter authentication token
+    @param oplog_id - the ID of the oplog to verify
+    @param populate_configs - a populate struct containing the schema mode
+    @param verify_configs - the VerifyConfig of the fetch, or None for the defaults
+    @param csv_path - the oplog file the entries were imported from
+    @param distinct - whether the file was imported with --dedup, so rows repeating an
+                      earlier row of the file are expected once
+    @param batching_configs - the BatchingConfig retrying page queries, or None for the
+                              defaults
+    @return verified - whether the oplog holds every row of the file and nothing else
+    """
+
+    verify_configs = verify_configs or oplog_verify.VerifyConfig()
+    verifier = oplog_verify.OplogVerifier(verify_configs.max_reported, distinct)
+
+    oplog_file = open_oplog_file(csv_path)
+    try:
+        with oplog_metrics.phase("verify_file"):
+            verifier.add_source_records(*read_oplog_records(oplog_file))
+
+        gql_client = await create_fetch_client_async(
+            credentials,
+            token_refresher,
+            populate_configs,
+            verify_configs.concurrency
+        )
+        started = time.perf_counter()
+        async with gql_client as session:
+            pages = fetch_oplog_entries_async(
+                session,
+                oplog_id,
+                page_size=verify_configs.page_size,
+                concurrency=verify_configs.concurrency,
+                latencies=verifier.page_latencies,
+                token_refresher=token_refresher,
+                batching_configs=batching_configs
+            )
+            async for page in pages:
+                verifier.add_entries(page)
+        verifier.fetch_seconds = time.perf_counter() - started
+
+        missing = []
+        if verifier.missing:
+            missing = verifier.find_missing_records(*read_oplog_records(oplog_file))
+    finally:
+        oplog_file.close()
+
+    print(f"Verifying oplog {oplog_id} against {Path(csv_path).name}")
+    oplog_verify.print_verify_report(verifier, missing)
+    return verifier.verified
+
+async def create_fetch_client_async(
+    credentials,
+    token_refresher,
+    populate_configs,
+    concurrency
+):
+    """
+    create_fetch_client_async builds the async GraphQL client of a fetch of oplog entries,
+    with a connection pool sized to the number of queries in flight. The schema is loaded,
+    and the fetch queries validated, without blocking the event loop.
+
+    @param credentials - an object containing the ghostwriter URL
+    @param token_refresher - the TokenRefresher holding the ghostwriter authentication token
+    @param populate_configs - a populate struct containing the schema mode
+    @param concurrency - the maximum number of queries in flight
+    @return gql_client - the unconnected gql Client
+    """
+
+    headers = {"Authorization": f"Bearer {token_refresher.token}"}
+    transport = AIOHTTPTransport(
+        credentials.url,
+        headers=headers,
+        client_session_args={
+            "connector": aiohttp.TCPConnector(limit=concurrency)
+        }
+    )
+    gql_client = await oplog_schema.create_client_async(
+        transport,
+        credentials.url,
+        populate_configs.schema_mode,
+        credentials.username,
+        headers
+    )
+    for document in (LAST_OPLOG_ENTRY, OPLOG_ENTRY_PAGE):
+        await oplog_schema.validate_async(gql_client, document)
+    return gql_client
+
+async def fetch_oplog_entries_async(
+    gql_session,
+    oplog_id,
+    after_id=0,
+    page_size=1000,
+    concurrency=4,
+    latencies=None,
+    token_refresher=None,
+    batching_configs=None
+):
+    """
+    fetch_oplog_entries_async reads every entry of an oplog with an ID above after_id.
+    The IDs up to the oplog's newest entry are split into FETCH_RANGES_PER_CONNECTION
+    ranges per connection, and each range is read in keyset pages of up to page_size
+    entries, ordered by ID, so no query has to skip past rows with an offset. Up to
+    concurrency ranges are read at once, so pages arrive in no particular order.
+    Every query is sent with execute_page_query_async, which retries and logs in again
+    like an insert.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param oplog_id - the ID of the oplog to read
+    @param after_id - the ID after which to start reading, or 0 for every entry
+    @param page_size - the maximum number of entries per query
+    @param concurrency - the maximum number of queries in flight
+    @param latencies - a list the seconds each page query took are appended to, or None
+    @param token_refresher - the TokenRefresher authenticating queries, or None to use
+                             the session's own headers
+    @param batching_configs - the BatchingConfig retrying queries, or None for the defaults
+    @yield page - each page of entries, as a list of oplogEntry dictionaries
+    """
+
+    # Pages have a fixed size, so only the retry settings apply
+    batch_sizer = oplog_batching.BatchSizer(
+        page_size,
+        replace(batching_configs or oplog_batching.BatchingConfig(), adaptive=False)
+    )
+    result = await execute_page_query_async(
+        gql_session,
+        LAST_OPLOG_ENTRY,
+        {"oplog": oplog_id},
+        token_refresher,
+        batch_sizer
+    )
+    if not result["oplogEntry"]:
+        return
+    last_id = int(result["oplogEntry"][0]["id"])
+    if last_id <= after_id:
+        return
+
+    range_count = concurrency * FETCH_RANGES_PER_CONNECTION
+    step = max(page_size, -(-(last_id - after_id) // range_count))
+    semaphore = asyncio.Semaphore(concurrency)
+    pages = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def scan(first_id, range_last_id):
+        async with semaphore:
+            cursor = first_id
+            while True:
+                started = time.perf_counter()
+                result = await execute_page_query_async(
+                    gql_session,
+                    OPLOG_ENTRY_PAGE,
+                    {
+                        "oplog": oplog_id,
+                        "after": cursor,
+                        "last": range_last_id,
+                        "limit": page_size
+                    },
+                    token_refresher,
+                    batch_sizer
+                )
+                elapsed = time.perf_counter() - started
+                oplog_metrics.observe("fetch_seconds", elapsed)
+                if latencies is not None:
+                    latencies.append(elapsed)
+                page = result["oplogEntry"]
+                if page:
+                    await pages.put(page)
+                if len(page) < page_size:
+                    return
+                cursor = int(page[-1]["id"])
+
+    scans = asyncio.gather(*(
+        scan(first_id, min(first_id + step, last_id))
+        for first_id in range(after_id, last_id, step)
+    ))
+    try:
+        while True:
+            next_page = asyncio.ensure_future(pages.get())
+            await asyncio.wait({next_page, scans}, return_when=asyncio.FIRST_COMPLETED)
+            if next_page.done():
+                yield next_page.result()
+                continue
+            next_page.cancel()
+            # Raise the error of a failed scan, or hand over the last pages
+            scans.result()
+            while not pages.empty():
+                yield pages.get_nowait()
+            return
+    finally:
+        scans.cancel()
+        await asyncio.gather(scans, return_exceptions=True)
+
+async def execute_page_query_async(
+    gql_session,
+    document,
+    variable_values,
+    token_refresher=None,
+    batch_sizer=None
+):
+    """
+    execute_page_query_async sends a query of fetch_oplog_entries_async. Failures are
+    classified and retried with backoff by oplog_batching.plan_retry, like inserts, and
+    Ghostwriter rejecting the token logs in again once, like execute_oplog_insert_async.
+    A query has no entries to split, so a failure plan_retry would split or reject is
+    raised.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param document - the query to send
+    @param variable_values - the variables of the query
+    @param token_refresher - the TokenRefresher authenticating the query, or None
+    @param batch_sizer - the BatchSizer holding the retry settings, or None for the defaults
+    @return result - the data of the response
+    """
+
+    batch_sizer = batch_sizer or oplog_batching.BatchSizer(0)
+
+    refreshed = False
+    attempts = 0
+    while True:
+        token = token_refresher.token if token_refresher else None
+        try:
+            result = await gql_session.execute(
+                document,
+                variable_values=variable_values,
+                extra_args=token_refresher.extra_args() if token_refresher else None
+            )
+            # The backoff doubles over consecutive failures, so a success starts it over
+            batch_sizer.failures = 0
+            return result
+        except oplog_batching.RETRYABLE_ERRORS as e:
+            if token_refresher and not refreshed and oplog_auth.is_auth_error(e):
+                await token_refresher.refresh_async(token)
+                oplog_metrics.count("token_refreshes")
+                refreshed = True
+                continue
+            attempts += 1
+            plan = oplog_batching.plan_retry(batch_sizer, e, [], attempts)
+            if plan is None or plan[0] != oplog_batching.RETRY:
+                raise
+            oplog_metrics.count("retries", action=oplog_batching.RETRY)
+            await asyncio.sleep(plan[1])
+
+async def upload_oplog_async(
+    credentials,
+    token_refresher,
+    oplog_id,
+    populate_configs,
+    journal=None,
+    batching_configs=None,
+    csv_path=OPLOG_CSV_PATH,
+    replay_configs=None,
+    follow_configs=None,
+    dedup_index=None
+):
+    """
+    upload_oplog_async opens a single long-lived async GraphQL session, backed by one
+    aiohttp connection pool sized to the configured concurrency, and populates the oplog
+    through it with populate_oplog_async, replays entries with replay_oplog_async, or
+    follows a growing file with follow_oplog_async.
+
+    The insert mutation is validated once against the schema. With the raw transport,
+    batches are then sent through a RawGraphQLSession instead of the gql session.
+
+    @param credentials - an object containing the ghostwriter URL
+    @param token_refresher - the TokenRefresher holding the ghostwriter authentication token
+    @param oplog_id - the ID of the oplog to populate
+    @param populate_configs - a populate struct containing the batch size, concurrency,
+                              transport, and parse workers
+    @param journal - the CheckpointJournal to resume from, or None to start a new import
+    @param batching_configs - the BatchingConfig sizing and retrying batches, or None for
+                              the defaults
+    @param csv_path - the oplog file to read entries from
+    @param replay_configs - the ReplayConfig pacing a live replay, or None to upload the
+                            entries as fast as possible
+    @param follow_configs - the FollowConfig of follow mode, or None to upload the file once
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @return result - the number of new oplog entries
+    """
+
+    headers = {"Authorization": f"Bearer {token_refresher.token}"}
+    transport = AIOHTTPTransport(
+        credentials.url,
+        headers=headers,
+        client_session_args={
+            "connector": aiohttp.TCPConnector(limit=populate_configs.concurrency)
+        }
+    )
+
+    # Introspection and schema refreshes are blocking requests, so keep them off the loop
+    gql_client = await oplog_schema.create_client_async(
+        transport,
+        credentials.url,
+        populate_configs.schema_mode,
+        credentials.username,
+        headers
+    )
+    async with gql_client as session:
+        # Validate the insert mutation once, instead of once per batch, and only once
+        # connected, since a schema fetched from the transport only exists then
+        await oplog_schema.validate_async(gql_client, POPULATE_OPLOG_BATCH)
+        if populate_configs.transport != TRANSPORT_RAW and replay_configs:
+            return await replay_oplog_async(
+                session,
+                oplog_id,
+                replay_configs,
+                populate_configs.concurrency,
+                token_refresher,
+                csv_path,
+                batching_configs
+            )
+        if populate_configs.transport != TRANSPORT_RAW and follow_configs:
+            return await follow_oplog_async(
+                session,
+                oplog_id,
+                follow_configs,
+                populate_configs.batch_size,
+                populate_configs.concurrency,
+                populate_configs.prefetch_batches,
+                token_refresher,
+                csv_path,
+                batching_configs,
+                dedup_index=dedup_index
+            )
+        if populate_configs.transport != TRANSPORT_RAW:
+            return await populate_oplog_async(
+                session,
+                oplog_id,
+                populate_configs.batch_size,
+                populate_configs.concurrency,
+                populate_configs.prefetch_batches,
+                journal,
+                token_refresher,
+                csv_path,
+                batching_configs,
+                parse_workers=populate_configs.parse_workers,
+                dedup_index=dedup_index
+            )
+
+    raw_session = oplog_transport.RawGraphQLSession(
+        credentials.url,
+        headers,
+        populate_configs.concurrency,
+        populate_configs.compress_requests
+    )
+    async with raw_session:
+        if replay_configs:
+            return await replay_oplog_async(
+                raw_session,
+                oplog_id,
+                replay_configs,
+                populate_configs.concurrency,
+                token_refresher,
+                csv_path,
+                batching_configs,
+                raw_entries=True
+            )
+        if follow_configs:
+            return await follow_oplog_async(
+                raw_session,
+                oplog_id,
+                follow_configs,
+                populate_configs.batch_size,
+                populate_configs.concurrency,
+                populate_configs.prefetch_batches,
+                token_refresher,
+                csv_path,
+                batching_configs,
+                raw_entries=True,
+                dedup_index=dedup_index
+            )
+        return await populate_oplog_async(
+            raw_session,
+            oplog_id,
+            populate_configs.batch_size,
+            populate_configs.concurrency,
+            populate_configs.prefetch_batches,
+            journal,
+            token_refresher,
+            csv_path,
+            batching_configs,
+            raw_entries=True,
+            parse_workers=populate_configs.parse_workers,
+            dedup_index=dedup_index
+        )
+
+async def populate_oplog_async(
+    gql_session,
+    oplog_id,
+    batch_size,
+    concurrency,
+    prefetch_batches=2,
+    journal=None,
+    token_refresher=None,
+    csv_path=OPLOG_CSV_PATH,
+    batching_configs=None,
+    raw_entries=False,
+    parse_workers=1,
+    dedup_index=None
+):
+    """
+    populate_oplog_async fills an oplog with entries from 'config/oplog.csv' like
+    populate_oplog, sizing, retrying, and rejecting batches the same way, but keeps up
+    to concurrency batches in flight at once.
+    The CSV is read in a worker thread by prefetch_oplog_batches, so parsing
+    overlaps with sending while staying at most prefetch_batches ahead of it.
+    With more than one parse worker, an uncompressed CSV or JSON Lines file is
+    parsed by read_parallel_oplog_batches in a process pool instead.
+    Each batch is recorded in the checkpoint journal as soon as it commits, even while
+    earlier batches are still in flight, and a resumed import skips every committed
+    batch, not only those before the first uncommitted one.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param oplog_id - the ID of the oplog the function populates
+    @param batch_size - the number of entries to send per insert mutation
+    @param concurrency - the maximum number of insert mutations in flight
+    @param prefetch_batches - the maximum number of batches read ahead of the network
+    @param journal - the CheckpointJournal to resume from, or None to start a new import
+    @param token_refresher - the TokenRefresher authenticating batches, or None to use
+                             the session's own headers
+    @param csv_path - the oplog file to read entries from
+    @param batching_configs - the BatchingConfig sizing and retrying batches, or None for
+                              the defaults
+    @param raw_entries - whether entries are encoded straight to JSON text for a
+                         RawGraphQLSession, instead of serialized to dictionaries
+    @param parse_workers - the number of processes parsing the oplog file
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @return result - the number of new oplog entries
+    """
+
+    oplog_file = open_oplog_file(csv_path)
+    read_batches = read_encoded_oplog_batches if raw_entries else read_oplog_batches
+    if parse_workers > 1 and oplog_file.splittable:
+        read_batches = partial(
+            read_parallel_oplog_batches,
+            parse_workers=parse_workers,
+            raw_entries=raw_entries
+        )
+
+    result = 0
+    try:
+        batch_sizer = oplog_batching.BatchSizer(batch_size, batching_configs)
+        reject_file = oplog_batching.RejectFile(oplog_batching.reject_path(csv_path))
+        if journal is None:
+            journal = oplog_checkpoint.start_checkpoint(csv_path, oplog_id)
+            reject_file.clear()
+        batches = prefetch_oplog_batches(
+            read_batches(
+                oplog_file,
+                oplog_id,
+                batch_sizer,
+                journal.end_offset,
+                journal.next_batch,
+                dedup_index=dedup_index,
+                committed=journal.committed_filter()
+            ),
+            prefetch_batches
+        )
+
+        def record_batch(batch, entry_ids):
+            with oplog_metrics.phase("checkpoint"):
+                journal.record(batch, len(entry_ids))
+
+        inserted = insert_oplog_batches_async(
+            gql_session,
+            batches,
+            concurrency,
+            token_refresher,
+            batch_sizer,
+            reject_file,
+            record_batch
+        )
+        async for batch, entry_ids in inserted:
+            print_oplog_batch(batch, entry_ids)
+            result += len(entry_ids)
+        journal.complete()
+        print_rejected_entries(reject_file)
+    finally:
+        oplog_file.close()
 
     return result
 
+async def replay_oplog_async(
+    gql_session,
+    oplog_id,
+    replay_configs,
+    concurrency=1,
+    token_refresher=None,
+    csv_path=OPLOG_CSV_PATH,
+    batching_configs=None,
+    raw_entries=False
+):
+    """
+    replay_oplog_async streams the entries of an oplog file into an oplog as if they were
+    being logged live, to load test Ghostwriter's oplog views and subscriptions. Entries
+    are read and sorted by start date, then sent by oplog_replay.replay_entries in small
+    batches, paced by the replay_configs. Failed batches are retried, split, and rejected
+    like populate_oplog_async's, but batch sizes are not tuned and there is no checkpoint
+    journal: a replay always starts from the first entry. Latency percentiles are printed
+    once the replay finishes.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param oplog_id - the ID of the oplog the function populates
+    @param replay_configs - the ReplayConfig pacing the replay
+    @param concurrency - the maximum number of insert mutations in flight
+    @param token_refresher - the TokenRefresher authenticating batches, or None to use
+                             the session's own headers
+    @param csv_path - the oplog file to read entries from
+    @param batching_configs - the BatchingConfig retrying batches, or None for the defaults
+    @param raw_entries - whether entries are encoded straight to JSON text for a
+                         RawGraphQLSession, instead of serialized to dictionaries
+    @return result - the number of new oplog entries
+    """
+
+    oplog_file = open_oplog_file(csv_path)
+    try:
+        entries = read_replay_entries(oplog_file, oplog_id, raw_entries)
+    finally:
+        oplog_file.close()
+
+    # Replay batches are sized by the schedule, so only the retry settings apply
+    batch_sizer = oplog_batching.BatchSizer(
+        replay_configs.max_batch_size,
+        replace(batching_configs or oplog_batching.BatchingConfig(), adaptive=False)
+    )
+    reject_file = oplog_batching.RejectFile(oplog_batching.reject_path(csv_path))
+    reject_file.clear()
+
+    result = 0
+    batch_index = 0
+
+    async def send_batch(replay_batch):
+        nonlocal result, batch_index
+        entry_identifiers = [entry.entry_identifier for entry in replay_batch]
+        batch = OplogBatch(
+            batch_index,
+            [entry.entry for entry in replay_batch],
+            entry_identifiers[0],
+            entry_identifiers[-1],
+            0,
+            entry_identifiers
+        )
+        batch_index += 1
+        entry_ids = await insert_oplog_batch_async(
+            gql_session,
+            batch,
+            token_refresher,
+            batch_sizer,
+            reject_file
+        )
+        result += len(entry_ids)
+
+    print(f"Replaying {len(entries)} entries")
+    stats = await oplog_replay.replay_entries(entries, send_batch, replay_configs, concurrency)
+    oplog_replay.print_replay_summary(stats)
+    print_rejected_entries(reject_file)
+
+    return result
+
+async def follow_oplog_async(
+    gql_session,
+    oplog_id,
+    follow_configs,
+    batch_size,
+    concurrency,
+    prefetch_batches=2,
+    token_refresher=None,
+    csv_path=OPLOG_CSV_PATH,
+    batching_configs=None,
+    raw_entries=False,
+    dedup_index=None
+):
+    """
+    follow_oplog_async keeps an oplog in sync with an uncompressed CSV or JSON Lines file
+    that another tool appends to, until the task is cancelled or the process interrupted.
+    The file is polled every follow_configs.poll_interval seconds, and the complete rows
+    appended since the last poll are uploaded in batches, like populate_oplog_async's.
+    Each batch is saved in a follow state next to the file as soon as it commits, for
+    each oplog the file is followed into, so a restarted follower only uploads rows it
+    has not committed, even when later batches committed before an earlier one failed.
+
+    The file is read again from its first row when it is replaced by a new file, when it
+    shrinks below the committed offset, or when the rows before that offset change.
+    A replaced file stays open until every row appended to it before it was replaced
+    has been uploaded.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param oplog_id - the ID of the oplog the function populates
+    @param follow_configs - the FollowConfig holding the poll interval
+    @param batch_size - the number of entries to send per insert mutation
+    @param concurrency - the maximum number of insert mutations in flight
+    @param prefetch_batches - the maximum number of batches read ahead of the network
+    @param token_refresher - the TokenRefresher authenticating batches, or None to use
+                             the session's own headers
+    @param csv_path - the oplog file to follow
+    @param batching_configs - the BatchingConfig sizing and retrying batches, or None for
+                              the defaults
+    @param raw_entries - whether entries are encoded straight to JSON text for a
+                         RawGraphQLSession, instead of serialized to dictionaries
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @return result - the number of new oplog entries
+    """
+
+    state = oplog_follow.load_follow_state(csv_path, oplog_id)
+    batch_sizer = oplog_batching.BatchSizer(max(batch_size, 1), batching_configs)
+    reject_file = oplog_batching.RejectFile(oplog_batching.reject_path(csv_path))
+    print(
+        f"Following {Path(csv_path).name} into oplog {oplog_id} "
+        f"({state.rows} entries already committed)"
+    )
+
+    def record_batch(batch, entry_ids):
+        with oplog_metrics.phase("checkpoint"):
+            state.commit(batch.start_offset, batch.end_offset, len(entry_ids))
+
+    result = 0
+    next_batch = 0
+    followed_file = None
+    try:
+        while True:
+            if followed_file is None:
+                try:
+                    followed_file = oplog_follow.FollowedFile(csv_path)
+                except FileNotFoundError:
+                    # The file is briefly missing while it is rotated
+                    pass
+
+            if followed_file is not None and followed_file.read_header():
+                reason = oplog_follow.check_followed_file(state, followed_file)
+                if reason:
+                    if state.inode:
+                        print(
+                            f"Oplog File {reason.capitalize()}: reading {followed_file.path.name} "
+                            f"again from the first row"
+                        )
+                    state.reset(followed_file)
+
+                # Check before reading, so every row written before the switch is read
+                replaced = followed_file.replaced()
+                end = followed_file.complete_end(state.end_offset, followed_file.size)
+                if end > state.end_offset:
+                    batches = prefetch_oplog_batches(
+                        read_followed_batches(
+                            followed_file,
+                            oplog_id,
+                            batch_sizer,
+                            state.end_offset,
+                            end,
+                            next_batch,
+                            raw_entries,
+                            dedup_index,
+                            state.committed_filter()
+                        ),
+                        prefetch_batches
+                    )
+                    inserted = insert_oplog_batches_async(
+                        gql_session,
+                        batches,
+                        concurrency,
+                        token_refresher,
+                        batch_sizer,
+                        reject_file,
+                        record_batch
+                    )
+                    async for batch, entry_ids in inserted:
+                        print_oplog_batch(batch, entry_ids)
+                        result += len(entry_ids)
+                        next_batch = batch.index + 1
+                    oplog_follow.update_fingerprint(state, followed_file)
+
+                if replaced:
+                    followed_file.close()
+                    followed_file = None
+                    continue
+
+            await asyncio.sleep(follow_configs.poll_interval)
+    finally:
+        if followed_file is not None:
+            followed_file.close()
+        print(f"Followed {Path(csv_path).name}: inserted {result} entries")
+        print_rejected_entries(reject_file)
+
+    return result
+
+def read_followed_batches(
+    followed_file,
+    oplog_id,
+    batch_sizer,
+    start_offset,
+    end_offset,
+    first_batch=0,
+    raw_entries=False,
+    dedup_index=None,
+    committed=None
+):
+    """
+    read_followed_batches reads, serializes, and batches the rows of a followed file
+    between two record boundaries, like read_oplog_batches
+
+    @param followed_file - the open FollowedFile, with its header read
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param batch_sizer - the BatchSizer holding the maximum number of entries per batch
+    @param start_offset - the byte offset of the first row to read
+    @param end_offset - the byte offset just past the last complete row
+    @param first_batch - the index given to the first batch
+    @param raw_entries - whether entries are encoded straight to JSON text
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @param committed - a function from a row's end_offset to whether a restarted follower
+                       already committed the row, or None
+    @return batches - a generator of OplogBatch objects
+    """
+
+    fieldnames = followed_file.fieldnames
+    oplog_records = oplog_metrics.timed_iter(
+        "parse",
+        followed_file.read_records(start_offset, end_offset)
+    )
+    if dedup_index:
+        oplog_records = oplog_metrics.timed_iter(
+            "dedup",
+            dedup_index.skip_duplicates(fieldnames, oplog_records)
+        )
+    if raw_entries:
+        serialized_rows = encode_oplog_records(oplog_id, fieldnames, oplog_records)
+    else:
+        oplog_rows = (
+            (dict(zip(fieldnames, record)), end_offset) for record, end_offset in oplog_records
+        )
+        serialized_rows = serialize_oplog_rows(
+            oplog_id,
+            oplog_metrics.timed_iter("validate", validate_oplog_entries(oplog_rows))
+        )
+    serialized_rows = oplog_metrics.timed_iter("serialize", serialized_rows)
+    return oplog_metrics.timed_iter(
+        "batch",
+        batch_oplog_entries(serialized_rows, batch_sizer, first_batch, start_offset, committed)
+    )
+
+def read_replay_entries(oplog_file, oplog_id, raw_entries=False):
+    """
+    read_replay_entries reads and serializes every entry of an oplog file, sorted by
+    start date. The whole file is held in memory, since it has to be sorted.
+
+    @param oplog_file - the open OplogFile
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param raw_entries - whether entries are encoded straight to JSON text for a
+                         RawGraphQLSession, instead of serialized to dictionaries
+    @return entries - a list of ReplayEntry objects, in start date order
+    """
+
+    fieldnames, oplog_records = read_oplog_records(oplog_file)
+    if "start_date" not in fieldnames:
+        raise OplogEntryError("The oplog has no 'start_date' field")
+    start_index = fieldnames.index("start_date")
+    oplog_records = list(oplog_records)
+
+    if raw_entries:
+        serialized_rows = encode_oplog_records(oplog_id, fieldnames, oplog_records)
+    else:
+        oplog_rows = (
+            (dict(zip(fieldnames, record)), end_offset) for record, end_offset in oplog_records
+        )
+        serialized_rows = serialize_oplog_rows(oplog_id, validate_oplog_entries(oplog_rows))
+
+    entries = []
+    for (record, end_offset), (entry, entry_identifier, _) in zip(oplog_records, serialized_rows):
+        try:
+            start_time = oplog_replay.parse_start_time(record[start_index])
+        except (IndexError, TypeError, ValueError):
+            raise OplogEntryError(
+                f"Entry {entry_identifier} (ending at position {end_offset}) "
+                f"has no valid start date"
+            )
+        entries.append(oplog_replay.ReplayEntry(start_time, entry, entry_identifier))
+
+    # sort is stable, so entries logged in the same second keep their file order
+    entries.sort(key=lambda entry: entry.start_time)
+    return entries
+
+async def insert_oplog_batches_async(
+    gql_session,
+    batches,
+    concurrency,
+    token_refresher=None,
+    batch_sizer=None,
+    reject_file=None,
+    on_commit=None
+):
+    """
+    insert_oplog_batches_async sends batches of serialized oplog entries with
+    insert_oplog_batch_async, with at most concurrency batches in flight at once.
+    Results are yielded in batch order, but on_commit is called as soon as each batch
+    commits, so a batch that commits behind a slower one is recorded even if the
+    import is interrupted before it is yielded. If Ghostwriter rejects the token, the
+    token_refresher logs in once and every rejected batch is resent with the new token.
+    If any batch fails for good, every outstanding batch is cancelled as soon as it
+    fails, even while earlier batches are still in flight, and no further batch is sent
+    before the error is raised.
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param batches - an async iterable of OplogBatch objects
+    @param concurrency - the maximum number of insert mutations in flight
+    @param token_refresher - the TokenRefresher authenticating batches, or None
+    @param batch_sizer - the BatchSizer to report insert latencies and failures to, or None
+    @param reject_file - the RejectFile receiving entries Ghostwriter will not accept, or
+                         None to raise the error instead
+    @param on_commit - a function called with each batch and the IDs it created as soon
+                       as the batch commits, or None
+    @yield (batch, entry_ids) - each sent batch and the IDs it created
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = []
+
+    async def send_batch(batch):
+        async with semaphore:
+            entry_ids = await insert_oplog_batch_async(
+                gql_session,
+                batch,
+                token_refresher,
+                batch_sizer,
+                reject_file
+            )
+        if on_commit is not None:
+            on_commit(batch, entry_ids)
+        return entry_ids
+
+    def cancel_on_failure(task):
+        # Runs as soon as any batch finishes, so a failure behind a slow batch is not
+        # left waiting until the batches ahead of it are yielded
+        if task.cancelled() or task.exception() is None or failures:
+            return
+        failures.append(task.exception())
+        for _, pending_task in pending:
+            pending_task.cancel()
+
+    # Batches are sent in order, but may complete out of order. Keep a bounded window of
+    # pending sends so results can be yielded in order without reading the whole CSV ahead.
+    pending = deque()
+
+    async def next_result():
+        head_batch, head_task = pending[0]
+        await asyncio.wait({head_task})
+        if failures:
+            raise failures[0]
+        pending.popleft()
+        return head_batch, head_task.result()
+
+    try:
+        async for batch in batches:
+            if failures:
+                raise failures[0]
+            if len(pending) >= concurrency * 2:
+                yield await next_result()
+            task = asyncio.create_task(send_batch(batch))
+            task.add_done_callback(cancel_on_failure)
+            pending.append((batch, task))
+
+        while pending:
+            yield await next_result()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+async def insert_oplog_batch_async(
+    gql_session,
+    batch,
+    token_refresher=None,
+    batch_sizer=None,
+    reject_file=None
+):
+    """
+    insert_oplog_batch_async sends one batch of serialized oplog entries over an async
+    session, retrying, splitting, and rejecting entries like insert_oplog_batch
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param batch - the OplogBatch to send
+    @param token_refresher - the TokenRefresher authenticating the batch, or None
+    @param batch_sizer - the BatchSizer to report insert latencies and failures to, or None
+    @param reject_file - the RejectFile receiving entries Ghostwriter will not accept, or
+                         None to raise the error instead
+    @return entry_ids - the IDs of the new oplog entries
+    """
+
+    batch_sizer = batch_sizer or oplog_batching.BatchSizer(len(batch.entries))
+
+    entry_ids = []
+    chunks = deque([(0, len(batch.entries), 0)])
+    batch_started = time.perf_counter()
+    requests = 0
+    while chunks:
+        start, end, attempts = chunks.popleft()
+        entries = batch.entries[start:end]
+        started = time.perf_counter()
+        requests += 1
+        try:
+            entry_ids.extend(
+                await execute_oplog_insert_async(gql_session, entries, token_refresher)
+            )
+        except oplog_batching.RETRYABLE_ERRORS as e:
+            oplog_metrics.observe_request(
+                entries,
+                time.perf_counter() - started,
+                oplog_batching.classify_failure(e) or "error"
+            )
+            delay = requeue_oplog_chunk(
+                chunks,
+                batch,
+                (start, end, attempts),
+                e,
+                batch_sizer,
+                reject_file
+            )
+            await asyncio.sleep(delay)
+            continue
+        batch_sizer.observe(entries, time.perf_counter() - started)
+        oplog_metrics.observe_request(entries, time.perf_counter() - started, "ok")
+
+    oplog_metrics.record_batch(batch, entry_ids, time.perf_counter() - batch_started, requests)
+    return entry_ids
+
+async def execute_oplog_insert_async(gql_session, entries, token_refresher=None):
+    """
+    execute_oplog_insert_async sends serialized oplog entries over an async session,
+    logging in again like execute_oplog_insert if Ghostwriter rejects the token
+
+    @param gql_session - the async GraphQL session to use when issuing API requests
+    @param entries - a list of oplogEntry_insert_input dictionaries
+    @param token_refresher - the TokenRefresher authenticating the insert, or None
+    @return entry_ids - the IDs of the new oplog entries
+    """
+
+    refreshed = False
+    while True:
+        token = token_refresher.token if token_refresher else None
+        try:
+            result = await gql_session.execute(
+                POPULATE_OPLOG_BATCH,
+                variable_values={"objects": entries},
+                extra_args=token_refresher.extra_args() if token_refresher else None
+            )
+            break
+        except (TransportQueryError, TransportServerError) as e:
+            # Resend once with a new token; a second rejection is not an expiry
+            if refreshed or not token_refresher or not oplog_auth.is_auth_error(e):
+                raise
+            await token_refresher.refresh_async(token)
+            oplog_metrics.count("token_refreshes")
+            refreshed = True
+    return [entry["id"] for entry in result["insert_oplogEntry"]["returning"]]
+
+async def prefetch_oplog_batches(batches, prefetch_batches):
+    """
+    prefetch_oplog_batches pulls batches from a blocking iterable in a worker thread
+    and hands them to the event loop through a bounded queue. Once prefetch_batches
+    batches are waiting, the reader stops until the uploader takes one.
+
+    @param batches - a blocking iterable of batches, such as read_oplog_batches
+    @param prefetch_batches - the maximum number of batches waiting to be sent
+    @yield batch - each batch, in order
+    """
+
+    end_of_batches = object()
+    queue = asyncio.Queue(maxsize=prefetch_batches)
+
+    def read_batch(iterator):
+        with oplog_metrics.profiled():
+            return next(iterator, end_of_batches)
+
+    async def read_batches():
+        iterator = iter(batches)
+        try:
+            while True:
+                batch = await asyncio.to_thread(read_batch, iterator)
+                await queue.put(batch)
+                if batch is end_of_batches:
+                    return
+        except Exception as e:
+            await queue.put(e)
+
+    reader = asyncio.create_task(read_batches())
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is end_of_batches:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+
+def read_oplog_batches(
+    oplog_file,
+    oplog_id,
+    batch_sizer,
+    start_offset=0,
+    first_batch=0,
+    dedup_index=None,
+    committed=None
+):
+    """
+    read_oplog_batches streams an oplog file through each stage of the upload pipeline:
+    read rows, validate them, serialize them, and group them into batches. Every stage
+    is a generator, so only the batch being built is held in memory.
+
+    @param oplog_file - the open OplogFile
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param batch_sizer - the BatchSizer holding the maximum number of entries per batch
+    @param start_offset - the position of the first row to read, or 0 for the first row
+    @param first_batch - the index given to the first batch
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @param committed - a function from a row's end_offset to whether a resumed import
+                       already committed the row, or None
+    @return batches - a generator of OplogBatch objects
+    """
+
+    oplog_rows = oplog_metrics.timed_iter(
+        "validate",
+        validate_oplog_entries(read_oplog_rows(oplog_file, start_offset, dedup_index))
+    )
+    serialized_rows = oplog_metrics.timed_iter(
+        "serialize",
+        serialize_oplog_rows(oplog_id, oplog_rows)
+    )
+    return oplog_metrics.timed_iter(
+        "batch",
+        batch_oplog_entries(serialized_rows, batch_sizer, first_batch, start_offset, committed)
+    )
+
+def read_encoded_oplog_batches(
+    oplog_file,
+    oplog_id,
+    batch_sizer,
+    start_offset=0,
+    first_batch=0,
+    dedup_index=None,
+    committed=None
+):
+    """
+    read_encoded_oplog_batches is the fast path of read_oplog_batches for a
+    RawGraphQLSession. Rows are read as plain lists and encoded straight to the JSON
+    text of oplogEntry_insert_input objects in one pass, without building a dictionary
+    per row.
+
+    @param oplog_file - the open OplogFile
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param batch_sizer - the BatchSizer holding the maximum number of entries per batch
+    @param start_offset - the position of the first row to read, or 0 for the first row
+    @param first_batch - the index given to the first batch
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @param committed - a function from a row's end_offset to whether a resumed import
+                       already committed the row, or None
+    @return batches - a generator of OplogBatch objects holding JSON object strings
+    """
+
+    fieldnames, oplog_records = read_oplog_records(oplog_file, start_offset)
+    oplog_records = oplog_metrics.timed_iter("parse", oplog_records)
+    if dedup_index:
+        oplog_records = oplog_metrics.timed_iter(
+            "dedup",
+            dedup_index.skip_duplicates(fieldnames, oplog_records)
+        )
+    encoded_rows = oplog_metrics.timed_iter(
+        "serialize",
+        encode_oplog_records(oplog_id, fieldnames, oplog_records)
+    )
+    return oplog_metrics.timed_iter(
+        "batch",
+        batch_oplog_entries(encoded_rows, batch_sizer, first_batch, start_offset, committed)
+    )
+
+def read_parallel_oplog_batches(
+    oplog_file,
+    oplog_id,
+    batch_sizer,
+    start_offset=0,
+    first_batch=0,
+    parse_workers=2,
+    raw_entries=False,
+    dedup_index=None,
+    committed=None
+):
+    """
+    read_parallel_oplog_batches spreads the work of read_oplog_batches, or of
+    read_encoded_oplog_batches with raw_entries, over a pool of parse_workers processes.
+    An uncompressed CSV or JSON Lines file is split into byte ranges of whole records,
+    each range is parsed, validated, and serialized by serialize_oplog_range in a worker,
+    and the serialized entries are batched in file order. At most PARSE_TASKS_PER_WORKER
+    ranges per worker are parsed ahead of the batches being sent. With a dedup index,
+    workers also hash every row, and rows already in the index are dropped as the
+    results are batched.
+
+    @param oplog_file - the open OplogFile, which must be splittable
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param batch_sizer - the BatchSizer holding the maximum number of entries per batch
+    @param start_offset - the position of the first row to read, or 0 for the first row
+    @param first_batch - the index given to the first batch
+    @param parse_workers - the number of processes parsing the file
+    @param raw_entries - whether entries are encoded straight to JSON text for a
+                         RawGraphQLSession, instead of serialized to dictionaries
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @param committed - a function from a row's end_offset to whether a resumed import
+                       already committed the row, or None
+    @return batches - a generator of OplogBatch objects
+    """
+
+    fieldnames, _ = read_oplog_records(oplog_file, start_offset)
+    if raw_entries:
+        # Report missing columns before any worker starts
+        compile_oplog_encoder(oplog_id, fieldnames)
+
+    def serialized_rows():
+        # Workers are spawned rather than forked, since the uploader runs other threads
+        executor = ProcessPoolExecutor(
+            max_workers=parse_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        pending = deque()
+        try:
+            for start, end in oplog_file.split_records(start_offset):
+                pending.append(executor.submit(
+                    serialize_oplog_range,
+                    oplog_file.path,
+                    oplog_file.format.container,
+                    fieldnames,
+                    start,
+                    end,
+                    oplog_id,
+                    raw_entries,
+                    dedup_index is not None
+                ))
+                if len(pending) >= parse_workers * PARSE_TASKS_PER_WORKER:
+                    yield from skip_duplicate_rows(pending.popleft().result(), dedup_index)
+            while pending:
+                yield from skip_duplicate_rows(pending.popleft().result(), dedup_index)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    # Parsing happens in the workers, so the reader only sees the time spent waiting on them
+    return oplog_metrics.timed_iter(
+        "batch",
+        batch_oplog_entries(
+            oplog_metrics.timed_iter("parse_wait", serialized_rows()),
+            batch_sizer,
+            first_batch,
+            start_offset,
+            committed
+        )
+    )
+
+def serialize_oplog_range(
+    path,
+    container,
+    fieldnames,
+    start,
+    end,
+    oplog_id,
+    raw_entries,
+    digests=False
+):
+    """
+    serialize_oplog_range runs in a parse worker of read_parallel_oplog_batches. It parses,
+    validates, and serializes a byte range of whole records, and hashes them for a dedup
+    index if asked to.
+
+    @param path - the oplog file
+    @param container - the container of the file, CSV or JSON_LINES
+    @param fieldnames - the field names of the file
+    @param start - the byte offset of the first record
+    @param end - the byte offset just past the last record
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param raw_entries - whether entries are encoded straight to JSON text
+    @param digests - whether each row is hashed with oplog_dedup.entry_digest
+    @return serialized_rows - a list of (serialized_entry, entry_identifier, end_offset)
+                              tuples, or with digests, a pair of that list and a list of
+                              the hash of each row
+    """
+
+    records = oplog_formats.read_record_range(path, container, fieldnames, start, end)
+    if digests:
+        records = list(records)
+        digest_record = oplog_dedup.compile_record_digest(fieldnames)
+        row_digests = [digest_record(record) for record, _ in records]
+
+    if raw_entries:
+        serialized_rows = list(encode_oplog_records(oplog_id, fieldnames, records))
+    else:
+        oplog_rows = (
+            (dict(zip(fieldnames, record)), end_offset) for record, end_offset in records
+        )
+        serialized_rows = list(serialize_oplog_rows(oplog_id, validate_oplog_entries(oplog_rows)))
+
+    return (serialized_rows, row_digests) if digests else serialized_rows
+
+def skip_duplicate_rows(serialized_rows, dedup_index=None):
+    """
+    skip_duplicate_rows drops the rows of a parse worker's results that are already in
+    a dedup index
+
+    @param serialized_rows - the result of serialize_oplog_range
+    @param dedup_index - the DedupIndex the rows were hashed for, or None
+    @return serialized_rows - the serialized rows that are not in the index
+    """
+
+    if dedup_index is None:
+        return serialized_rows
+    return [
+        serialized_row for serialized_row, digest in zip(*serialized_rows)
+        if digest is None or not dedup_index.skip_digest(digest)
+    ]
+
+def compile_oplog_encoder(oplog_id, fieldnames):
+    """
+    compile_oplog_encoder builds the function encoding rows of an oplog file to JSON text
+
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param fieldnames - the field names of the file
+    @return encode - a function from a row, as a list of values, to a JSON object string
+    """
+
+    try:
+        return oplog_transport.compile_entry_encoder(oplog_id, fieldnames)
+    except KeyError as e:
+        raise OplogEntryError(f"The oplog has no '{e.args[0]}' field")
+
+def encode_oplog_records(oplog_id, fieldnames, oplog_records):
+    """
+    encode_oplog_records encodes rows read as plain lists straight to the JSON text of
+    oplogEntry_insert_input objects
+
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param fieldnames - the field names of the file
+    @param oplog_records - an iterable of (record, end_offset) pairs
+    @return encoded_rows - a generator of (entry, entry_identifier, end_offset) tuples
+    """
+
+    encode = compile_oplog_encoder(oplog_id, fieldnames)
+    identifier_index = (
+        fieldnames.index("entry_identifier") if "entry_identifier" in fieldnames else None
+    )
+
+    def encoded_rows():
+        for record, end_offset in oplog_records:
+            try:
+                entry = encode(record)
+            except (IndexError, TypeError):
+                raise OplogEntryError(
+                    f"The row ending at position {end_offset} is missing fields"
+                )
+            entry_identifier = None
+            if identifier_index is not None and identifier_index < len(record):
+                entry_identifier = record[identifier_index]
+            yield entry, entry_identifier, end_offset
+
+    return encoded_rows()
+
+def serialize_oplog_rows(oplog_id, oplog_rows):
+    """
+    serialize_oplog_rows serializes validated oplog entry dictionaries
+
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param oplog_rows - an iterable of (oplog_entry, end_offset) pairs
+    @yield (serialized_entry, entry_identifier, end_offset) - each serialized entry
+    """
+
+    for oplog_entry, end_offset in oplog_rows:
+        yield (
+            serialize_oplog_entry(oplog_id, oplog_entry),
+            oplog_entry.get("entry_identifier"),
+            end_offset
+        )
+
+def read_oplog_rows(oplog_file, start_offset=0, dedup_index=None):
+    """
+    read_oplog_rows reads oplog entries as dictionaries, tracking the position just
+    past each row: a byte offset into the decompressed text of a CSV or JSON Lines
+    file, or a row number in a Parquet or columnar file
+
+    @param oplog_file - the open OplogFile
+    @param start_offset - the position of the first row to read, or 0 for the first row
+    @param dedup_index - the DedupIndex of the oplog, to skip rows already in it, or None
+    @yield (oplog_entry, end_offset) - each row and the position just past it
+    """
+
+    fieldnames, oplog_records = read_oplog_records(oplog_file, start_offset)
+    oplog_records = oplog_metrics.timed_iter("parse", oplog_records)
+    if dedup_index:
+        oplog_records = oplog_metrics.timed_iter(
+            "dedup",
+            dedup_index.skip_duplicates(fieldnames, oplog_records)
+        )
+    for record, end_offset in oplog_records:
+        # Like csv.DictReader, fields missing from a short row are left out
+        yield dict(zip(fieldnames, record)), end_offset
+
+def read_oplog_records(oplog_file, start_offset=0):
+    """
+    read_oplog_records reads the field names of an oplog file, and returns them along
+    with a generator of the rows from start_offset on, as lists of values
+
+    @param oplog_file - the open OplogFile
+    @param start_offset - the position of the first row to read, or 0 for the first row
+    @return (fieldnames, records) - the field names, and a generator of (record, end_offset)
+                                    pairs holding each row and the position just past it
+    """
+
+    return oplog_file.read_records(start_offset)
+
+def validate_oplog_entries(oplog_rows):
+    """
+    validate_oplog_entries checks that every row of an oplog CSV has the fields
+    serialize_oplog_entry reads
+
+    @param oplog_rows - an iterable of (oplog_entry, end_offset) pairs
+    @yield (oplog_entry, end_offset) - each row that passed validation
+    """
+
+    for oplog_entry, end_offset in oplog_rows:
+        for field in OPLOG_ENTRY_FIELDS:
+            if oplog_entry.get(field) is None:
+                raise OplogEntryError(
+                    f"Entry {oplog_entry.get('entry_identifier')} "
+                    f"(ending at byte {end_offset}) is missing the '{field}' field"
+                )
+        yield oplog_entry, end_offset
+
+def batch_oplog_entries(
+    serialized_rows,
+    batch_sizer,
+    first_batch=0,
+    start_offset=0,
+    committed=None
+):
+    """
+    batch_oplog_entries groups serialized oplog entries into batches. The size of each
+    batch is read from the batch_sizer when the batch is started, so it follows the
+    adjustments made as earlier batches are sent. Each batch spans the file from the end
+    of the row before it to the end of its last row, so the batches of a file cover it
+    without gaps.
+
+    @param serialized_rows - an iterable of (serialized_entry, entry_identifier, end_offset) tuples
+    @param batch_sizer - the BatchSizer holding the maximum number of entries per batch
+    @param first_batch - the index given to the first batch
+    @param start_offset - the position of the first row, where the first batch starts
+    @param committed - a function from a row's end_offset to whether a resumed import
+                       already committed the row, which is then skipped, or None
+    @yield batch - an OplogBatch holding oplogEntry_insert_input dictionaries
+    """
+
+    batch_index = first_batch
+    entries = []
+    entry_identifiers = []
+    batch_size = batch_sizer.batch_size
+    batch_start = end_offset = start_offset
+
+    def make_batch():
+        return OplogBatch(
+            batch_index,
+            entries,
+            entry_identifiers[0],
+            entry_identifiers[-1],
+            end_offset,
+            entry_identifiers,
+            batch_start
+        )
+
+    for serialized_entry, entry_identifier, row_end in serialized_rows:
+        if committed is not None and committed(row_end):
+            # A committed row ends any batch in progress, so no batch spans committed rows
+            if entries:
+                yield make_batch()
+                batch_index += 1
+                entries = []
+                entry_identifiers = []
+            end_offset = row_end
+            continue
+        if not entries:
+            batch_size = batch_sizer.batch_size
+            batch_start = end_offset
+        end_offset = row_end
+        entries.append(serialized_entry)
+        entry_identifiers.append(entry_identifier)
+        if len(entries) >= batch_size:
+            yield make_batch()
+            batch_index += 1
+            entries = []
+            entry_identifiers = []
+    if entries:
+        yield make_batch()
+
+def serialize_oplog_entry(oplog_id, oplog_entry):
+    """
+    serialize_oplog_entry converts a CSV oplog entry into an oplogEntry_insert_input object.
+    Values are sent as GraphQL variables, so no string escaping is required.
+
+    @param oplog_id - the ID of the oplog the entry belongs to
+    @param oplog_entry - an oplog entry dictionary read from the CSV
+    @return dictionary - the oplogEntry_insert_input representation of the entry
+    """
+    return {
+        "oplog": oplog_id,
+        "startDate": oplog_entry["start_date"],
+        "endDate": oplog_entry["end_date"],
+        "sourceIp": oplog_entry["source_ip"],
+        "destIp": oplog_entry["dest_ip"],
+        "tool": oplog_entry["tool"],
+        "userContext": oplog_entry["user_context"],
+        "command": oplog_entry["command"],
+        "description": oplog_entry["description"],
+        "comments": oplog_entry["comments"],
+        "operatorName": oplog_entry["operator_name"]
+    }
 
 def read_json_config():
     """
@@ -363,6 +2826,26 @@ def read_json_config():
 
     return configs
 
+def write_metrics(arguments):
+    """
+    write_metrics writes the instrumentation requested on the command line once the run
+    is over, whether it finished or failed
+
+    @param arguments - the parsed command line options
+    """
+    if not oplog_metrics.METRICS.enabled:
+        return
+    report = oplog_metrics.METRICS.report()
+    if arguments.metrics:
+        oplog_metrics.write_report(arguments.metrics, report)
+        print(f"Metrics written to {arguments.metrics}")
+    elif "memory" in report:
+        print(f"Peak traced memory: {report['memory']['peak_bytes']} bytes")
+        for statistic in report["memory"]["top"]:
+            print(f"{statistic['bytes']:>12} bytes  {statistic['site']}")
+    if arguments.profile and oplog_metrics.METRICS.write_profile(arguments.profile):
+        print(f"Profile written to {arguments.profile}")
+
 def validate_oplog_entry(dictionary):
     """
     validate_oplog_entry takes a dictionary, and performs 
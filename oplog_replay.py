@@ -0,0 +1,251 @@
+import asyncio
+import statistics
+import time
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+# Seconds between progress reports while replaying
+REPORT_INTERVAL = 5.0
+
+# Percentiles reported for insert latencies
+PERCENTILES = (50, 90, 99)
+
+# Class definitions
+@dataclass
+class ReplayConfig:
+    """ReplayConfig objects represent live replay configs"""
+    speedup: float = 60.0
+    rate: float = 50.0
+    burst: int = 50
+    max_batch_size: int = 25
+
+@dataclass
+class ReplayEntry:
+    """ReplayEntry objects hold one serialized oplog entry and the time it was logged"""
+    start_time: float
+    entry: object
+    entry_identifier: str
+
+@dataclass
+class ReplayStats:
+    """
+    ReplayStats objects collect the latencies of a replay: the round trip of every insert
+    mutation, and the end-to-end latency of every entry, from the moment it was due to be
+    sent until Ghostwriter confirmed its insert. End-to-end latencies include time spent
+    waiting for the token bucket or a free connection, so they grow when the server cannot
+    keep up with the replay rate.
+    """
+    entries: int = 0
+    batches: int = 0
+    started: float = field(default_factory=time.monotonic)
+    request_latencies: list = field(default_factory=list)
+    entry_latencies: list = field(default_factory=list)
+
+    def record(self, due_times, sent, done):
+        """
+        record adds the latencies of a committed batch
+
+        @param due_times - the monotonic times each entry of the batch was due
+        @param sent - the monotonic time the batch was sent
+        @param done - the monotonic time its insert was confirmed
+        """
+        self.entries += len(due_times)
+        self.batches += 1
+        self.request_latencies.append(done - sent)
+        self.entry_latencies.extend(done - due for due in due_times)
+
+    def summary(self):
+        """
+        summary reports the throughput and latency percentiles of the replay so far
+
+        @return summary - a dictionary of counters, rates, and latencies in seconds
+        """
+        elapsed = time.monotonic() - self.started
+        return {
+            "entries": self.entries,
+            "batches": self.batches,
+            "elapsed": elapsed,
+            "entries_per_second": self.entries / elapsed if elapsed else 0.0,
+            "request_latency": latency_percentiles(self.request_latencies),
+            "entry_latency": latency_percentiles(self.entry_latencies)
+        }
+
+class TokenBucket:
+    """
+    TokenBucket paces a stream of entries to a steady rate. It holds up to capacity
+    tokens, refilled at rate tokens per second, and every entry sent takes one, so bursts
+    of up to capacity entries go out at once and longer runs average out to rate.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        @param rate - the tokens added per second
+        @param capacity - the most tokens the bucket holds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, tokens=1):
+        """
+        acquire takes tokens from the bucket, waiting until enough have been refilled.
+        A request for more tokens than the bucket holds leaves it in debt, which later
+        requests wait out.
+
+        @param tokens - the number of tokens to take
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+# Function definitions
+async def replay_entries(entries, send_batch, config, concurrency=1):
+    """
+    replay_entries sends entries as if they were being logged live. Each entry is due
+    when its start time comes around again, with time compressed by config.speedup; a
+    speedup of 0 makes every entry due at once. Entries that are due together are
+    coalesced into batches of up to config.max_batch_size, paced by a TokenBucket at
+    config.rate entries per second, and up to concurrency batches are in flight at once.
+
+    @param entries - a list of ReplayEntry objects, in start time order
+    @param send_batch - an async function sending a list of ReplayEntry objects
+    @param config - the ReplayConfig to apply
+    @param concurrency - the maximum number of batches in flight
+    @return stats - the ReplayStats of the replay
+    """
+
+    stats = ReplayStats()
+    bucket = TokenBucket(config.rate, max(config.burst, 1)) if config.rate > 0 else None
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    first_start = entries[0].start_time if entries else 0.0
+    next_report = stats.started + REPORT_INTERVAL
+
+    def due_time(entry):
+        if config.speedup <= 0:
+            return stats.started
+        return stats.started + (entry.start_time - first_start) / config.speedup
+
+    async def send(batch, due_times):
+        try:
+            sent = time.monotonic()
+            await send_batch(batch)
+            stats.record(due_times, sent, time.monotonic())
+        finally:
+            slots.release()
+
+    try:
+        index = 0
+        while index < len(entries):
+            due = due_time(entries[index])
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+            # Coalesce every entry that is already due
+            now = time.monotonic()
+            end = index + 1
+            while (
+                end < len(entries)
+                and end - index < config.max_batch_size
+                and due_time(entries[end]) <= now
+            ):
+                end += 1
+            batch = entries[index:end]
+            index = end
+
+            if bucket:
+                await bucket.acquire(len(batch))
+            await slots.acquire()
+            in_flight.add(asyncio.create_task(send(batch, [due_time(entry) for entry in batch])))
+
+            # Surface the first failed batch instead of replaying past it
+            for task in [task for task in in_flight if task.done()]:
+                in_flight.discard(task)
+                task.result()
+
+            if time.monotonic() >= next_report:
+                print_replay_progress(stats, len(entries))
+                next_report += REPORT_INTERVAL
+
+        while in_flight:
+            await in_flight.pop()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    return stats
+
+def parse_start_time(start_date):
+    """
+    parse_start_time converts an oplog entry's start date to seconds, for ordering and
+    spacing entries. Ghostwriter dates are in UTC, so dates without a time zone are read
+    as UTC, not local time.
+
+    @param start_date - the start date, such as '2024-12-12 17:26:50'
+    @return seconds - the start date as a POSIX timestamp
+    """
+    start_time = datetime.fromisoformat(start_date)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return start_time.timestamp()
+
+def latency_percentiles(latencies):
+    """
+    latency_percentiles summarizes a list of latencies
+
+    @param latencies - a list of latencies, in seconds
+    @return percentiles - a dictionary of the PERCENTILES and the maximum latency, or None
+                          for each if there are no latencies
+    """
+    if not latencies:
+        return {**{f"p{percent}": None for percent in PERCENTILES}, "max": None}
+    if len(latencies) == 1:
+        cuts = latencies * 99
+    else:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {**{f"p{percent}": cuts[percent - 1] for percent in PERCENTILES}, "max": max(latencies)}
+
+def format_latencies(percentiles):
+    """
+    format_latencies formats latency percentiles in milliseconds
+
+    @param percentiles - a dictionary returned by latency_percentiles
+    @return text - the percentiles, such as 'p50 12.0ms, p90 15.1ms, p99 40.2ms, max 51.0ms'
+    """
+    return ", ".join(
+        f"{name} {value * 1000:.1f}ms" if value is not None else f"{name} n/a"
+        for name, value in percentiles.items()
+    )
+
+def print_replay_progress(stats, total):
+    """
+    print_replay_progress reports how far a replay has got
+
+    @param stats - the ReplayStats of the replay
+    @param total - the number of entries being replayed
+    """
+    summary = stats.summary()
+    print(
+        f"Replayed {summary['entries']}/{total} entries "
+        f"({summary['entries_per_second']:.1f}/s): "
+        f"end-to-end {format_latencies(summary['entry_latency'])}"
+    )
+
+def print_replay_summary(stats):
+    """
+    print_replay_summary reports the throughput and latencies of a finished replay
+
+    @param stats - the ReplayStats of the replay
+    """
+    summary = stats.summary()
+    print(
+        f"Replayed {summary['entries']} entries in {summary['batches']} batches over "
+        f"{summary['elapsed']:.1f}s ({summary['entries_per_second']:.1f} entries/s)"
+    )
+    print(f"Insert request latency: {format_latencies(summary['request_latency'])}")
+    print(f"End-to-end entry latency: {format_latencies(summary['entry_latency'])}")
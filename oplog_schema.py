@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import urllib.request
+
+from pathlib import Path
+
+from gql import Client
+from graphql import build_client_schema, get_introspection_query
+from graphql.error.graphql_error import GraphQLError
+
+# Schema modes accepted by create_client
+SCHEMA_CACHE = "cache"
+SCHEMA_FETCH = "fetch"
+SCHEMA_SKIP = "skip"
+
+# Directory holding one cached introspection result per endpoint and role
+SCHEMA_CACHE_DIR = Path(__file__).parent / "config/schema_cache"
+
+# Seconds an introspection query may take
+INTROSPECTION_TIMEOUT = 30
+
+# Class definitions
+class CachedSchemaClient(Client):
+    """
+    CachedSchemaClient is a gql Client that validates documents against an introspection
+    result cached on disk, instead of introspecting the server on every run. When a
+    document fails validation, the cached schema is refreshed once from the server and
+    the document is validated again, so a stale cache never rejects a valid document.
+    """
+
+    def __init__(self, transport, url, cache_key, headers=None):
+        self.url = url
+        self.cache_key = cache_key
+        self.headers = headers
+        super().__init__(
+            transport=transport,
+            introspection=load_introspection(url, cache_key, headers)
+        )
+
+    def validate(self, document):
+        try:
+            super().validate(document)
+        except GraphQLError:
+            cached_fingerprint = schema_fingerprint(self.introspection)
+            introspection = load_introspection(
+                self.url,
+                self.cache_key,
+                self.headers,
+                refresh=True
+            )
+
+            # The server schema has not changed, so the document itself is invalid
+            if schema_fingerprint(introspection) == cached_fingerprint:
+                raise
+
+            print(f"Schema Changed: Refreshed the cached schema for {self.url}")
+            self.introspection = introspection
+            self.schema = build_client_schema(introspection)
+            super().validate(document)
+
+# Function definitions
+def create_client(transport, url, schema_mode, cache_key, headers=None):
+    """
+    create_client builds a gql Client for a Ghostwriter endpoint using one of three schema modes:
+
+    cache - validate documents against an introspection result cached on disk
+    fetch - introspect the server every time the client connects
+    skip - send documents without any client-side validation
+
+    @param transport - the gql transport the client sends requests through
+    @param url - the Ghostwriter GraphQL endpoint
+    @param schema_mode - one of SCHEMA_CACHE, SCHEMA_FETCH, or SCHEMA_SKIP
+    @param cache_key - identifies the role the schema is introspected as, such as a username
+    @param headers - the HTTP headers to send with introspection queries
+    @return client - the gql Client
+    """
+    if schema_mode == SCHEMA_SKIP:
+        return Client(transport=transport)
+    if schema_mode == SCHEMA_FETCH:
+        return Client(transport=transport, fetch_schema_from_transport=True)
+    if schema_mode == SCHEMA_CACHE:
+        return CachedSchemaClient(transport, url, cache_key, headers)
+    raise ValueError(f"Unknown schema mode: {schema_mode}")
+
+async def create_client_async(transport, url, schema_mode, cache_key, headers=None):
+    """
+    create_client_async builds a gql Client like create_client from within an event loop.
+    A cached schema is loaded, and fetched if it is missing, in a worker thread, so the
+    introspection query does not block the loop.
+
+    @param transport - the gql transport the client sends requests through
+    @param url - the Ghostwriter GraphQL endpoint
+    @param schema_mode - one of SCHEMA_CACHE, SCHEMA_FETCH, or SCHEMA_SKIP
+    @param cache_key - identifies the role the schema is introspected as, such as a username
+    @param headers - the HTTP headers to send with introspection queries
+    @return client - the gql Client
+    """
+    return await asyncio.to_thread(create_client, transport, url, schema_mode, cache_key, headers)
+
+async def validate_async(gql_client, document):
+    """
+    validate_async validates a document in a worker thread, before it is first sent. A
+    CachedSchemaClient refreshes a stale schema from the server while validating, so the
+    refresh happens off the event loop, and later validations of the document pass
+    against the refreshed schema. Clients without a schema are not validated.
+
+    @param gql_client - the gql Client that will send the document
+    @param document - the parsed document
+    """
+    if gql_client.schema:
+        await asyncio.to_thread(gql_client.validate, document)
+
+def load_introspection(url, cache_key, headers=None, refresh=False):
+    """
+    load_introspection returns the cached introspection result for an endpoint and role,
+    fetching and caching it first if it is missing, unreadable, or a refresh is requested
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param cache_key - identifies the role the schema is introspected as
+    @param headers - the HTTP headers to send with the introspection query
+    @param refresh - whether to ignore the cached result and fetch a new one
+    @return introspection - the introspection query result
+    """
+    path = schema_cache_path(url, cache_key)
+
+    if not refresh:
+        try:
+            with path.open() as cache_file:
+                cached = json.load(cache_file)
+            if schema_fingerprint(cached["introspection"]) == cached["fingerprint"]:
+                return cached["introspection"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    introspection = fetch_introspection(url, headers)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".tmp")
+    with temporary_path.open("w") as cache_file:
+        json.dump({
+            "url": url,
+            "fingerprint": schema_fingerprint(introspection),
+            "introspection": introspection
+        }, cache_file)
+    temporary_path.replace(path)
+
+    return introspection
+
+def invalidate_schema_cache(url, cache_key):
+    """
+    invalidate_schema_cache removes the cached introspection result for an endpoint and role
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param cache_key - identifies the role the schema is introspected as
+    """
+    schema_cache_path(url, cache_key).unlink(missing_ok=True)
+
+def fetch_introspection(url, headers=None, timeout=INTROSPECTION_TIMEOUT):
+    """
+    fetch_introspection sends an introspection query to a GraphQL endpoint
+
+    @param url - the GraphQL endpoint
+    @param headers - the HTTP headers to send with the query
+    @param timeout - the seconds to wait for the server before raising TimeoutError
+    @return introspection - the introspection query result
+    """
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({"query": get_introspection_query()}).encode("utf-8"),
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        result = json.load(response)
+
+    if "errors" in result:
+        raise GraphQLError(f"Introspection failed: {result['errors']}")
+    return result["data"]
+
+def schema_fingerprint(introspection):
+    """
+    schema_fingerprint hashes an introspection result, so cached schemas can be compared
+
+    @param introspection - the introspection query result
+    @return fingerprint - the SHA-256 hex digest of the result
+    """
+    return hashlib.sha256(
+        json.dumps(introspection, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+def schema_cache_path(url, cache_key):
+    """
+    schema_cache_path returns the cache file for an endpoint and role
+
+    @param url - the Ghostwriter GraphQL endpoint
+    @param cache_key - identifies the role the schema is introspected as
+    @return path - the path of the cache file
+    """
+    digest = hashlib.sha256(f"{url}|{cache_key}".encode("utf-8")).hexdigest()[:16]
+    return SCHEMA_CACHE_DIR / f"{digest}.json"
@@ -0,0 +1,161 @@
+import asyncio
+import gzip
+import json
+import operator
+
+from json.encoder import encode_basestring
+
+import aiohttp
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from graphql import print_ast
+
+# CSV columns sent for every oplog entry, keyed by their oplogEntry_insert_input field
+ENTRY_COLUMNS = (
+    ("startDate", "start_date"),
+    ("endDate", "end_date"),
+    ("sourceIp", "source_ip"),
+    ("destIp", "dest_ip"),
+    ("tool", "tool"),
+    ("userContext", "user_context"),
+    ("command", "command"),
+    ("description", "description"),
+    ("comments", "comments"),
+    ("operatorName", "operator_name")
+)
+
+# Seconds a request may take before it fails, matching gql's default execute_timeout
+EXECUTE_TIMEOUT = 10
+
+# Seconds an idle pooled connection is kept open for reuse
+KEEPALIVE_TIMEOUT = 60
+
+# Compression level of gzip request bodies; low levels trade ratio for client CPU
+COMPRESS_LEVEL = 1
+
+# Class definitions
+class RawGraphQLSession:
+    """
+    RawGraphQLSession sends insert mutations without gql. Every document is printed once
+    and turned into a request body prefix, and the $objects variable is passed as a list
+    of entries already encoded to JSON by compile_entry_encoder, so a request body is built
+    by joining strings instead of validating, printing, and serializing on every request.
+    Requests share a pool of keep-alive connections, and bodies can be gzip compressed.
+
+    execute mirrors the gql session's execute, so the uploaders can use either session.
+    Errors are raised as the same gql transport exceptions, so retries and token refreshes
+    behave the same way.
+    """
+
+    def __init__(self, url, headers=None, concurrency=1, compress=False, timeout=EXECUTE_TIMEOUT):
+        """
+        @param url - the Ghostwriter GraphQL endpoint
+        @param headers - the HTTP headers to send with every request
+        @param concurrency - the maximum number of pooled connections
+        @param compress - whether to gzip request bodies
+        @param timeout - the seconds a request may take before it fails
+        """
+        self.url = url
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        if compress:
+            self.headers["Content-Encoding"] = "gzip"
+        self.concurrency = concurrency
+        self.compress = compress
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.request_prefixes = {}
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def execute(self, document, variable_values=None, extra_args=None):
+        """
+        execute sends a document whose only variable is $objects
+
+        @param document - a parsed GraphQL document
+        @param variable_values - a dictionary holding "objects", a list of JSON-encoded entries
+        @param extra_args - per-request arguments; only "headers" is used
+        @return data - the "data" object of the response
+        """
+        body = (
+            self.request_prefix(document)
+            + ",".join(variable_values["objects"])
+            + "]}}"
+        ).encode("utf-8")
+        headers = self.headers
+        if extra_args and "headers" in extra_args:
+            headers = {**headers, **extra_args["headers"]}
+        if self.compress:
+            body = await asyncio.to_thread(gzip.compress, body, COMPRESS_LEVEL)
+
+        async with self.session.post(self.url, data=body, headers=headers) as response:
+            try:
+                result = await response.json(content_type=None)
+            except ValueError:
+                result = None
+
+            if not isinstance(result, dict) or ("data" not in result and "errors" not in result):
+                if response.status >= 400:
+                    raise TransportServerError(
+                        f"{response.status}, message='{response.reason}', url='{self.url}'",
+                        response.status
+                    )
+                raise TransportServerError(
+                    f"Server did not return a GraphQL result: {await response.text()}",
+                    response.status
+                )
+
+        if result.get("errors"):
+            raise TransportQueryError(
+                str(result["errors"][0]),
+                errors=result["errors"],
+                data=result.get("data")
+            )
+        return result["data"]
+
+    def request_prefix(self, document):
+        """
+        request_prefix returns the start of the request body for a document, up to the
+        opening bracket of the $objects list
+
+        @param document - a parsed GraphQL document
+        @return prefix - the request body prefix
+        """
+        cached = self.request_prefixes.get(id(document))
+        if cached is None:
+            prefix = '{"query":' + json.dumps(print_ast(document)) + ',"variables":{"objects":['
+            # Keep the document alive, so its id is not reused by another document
+            cached = self.request_prefixes[id(document)] = (document, prefix)
+        return cached[1]
+
+# Function definitions
+def compile_entry_encoder(oplog_id, fieldnames):
+    """
+    compile_entry_encoder builds a function encoding a CSV row straight to the JSON text
+    of an oplogEntry_insert_input object, in one pass. Values are escaped with the json
+    module's C string encoder, so the result is always valid JSON.
+
+    @param oplog_id - the ID of the oplog the entries belong to
+    @param fieldnames - the CSV header
+    @return encode - a function from a CSV row, as a list of values, to a JSON object string
+    """
+    missing = [column for _, column in ENTRY_COLUMNS if column not in fieldnames]
+    if missing:
+        raise KeyError(missing[0])
+
+    template = "{" + f'"oplog":{json.dumps(oplog_id)},' + ",".join(
+        f'"{field}":%s' for field, _ in ENTRY_COLUMNS
+    ) + "}"
+    get_values = operator.itemgetter(*(fieldnames.index(column) for _, column in ENTRY_COLUMNS))
+
+    def encode(row):
+        return template % tuple(map(encode_basestring, get_values(row)))
+
+    return encode
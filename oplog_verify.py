@@ -0,0 +1,270 @@
+from collections import Counter
+from dataclasses import dataclass, field
+
+import oplog_dedup
+import oplog_replay
+
+from oplog_transport import ENTRY_COLUMNS
+
+# Checksums are kept modulo 2 ** 64
+CHECKSUM_MASK = (1 << 64) - 1
+
+# Class definitions
+@dataclass
+class VerifyConfig:
+    """VerifyConfig objects represent the settings of a read-back verification"""
+    page_size: int = 1000
+    concurrency: int = 4
+    max_reported: int = 10
+
+@dataclass
+class OplogChecksum:
+    """
+    OplogChecksum objects summarize a set of oplog entries with a row count and one
+    checksum per field of ENTRY_COLUMNS: the sum of the hashes of the field's values.
+    Sums do not depend on the order entries are added in, so a file read front to back
+    and an oplog fetched in concurrent pages can be compared. Python's string hash is
+    seeded per process, so checksums can only be compared within one run.
+    """
+    rows: int = 0
+    fields: list = field(default_factory=lambda: [0] * len(ENTRY_COLUMNS))
+
+    def add(self, values):
+        """
+        add adds one entry to the checksums
+
+        @param values - the entry's values normalized by oplog_dedup.normalize_entry
+        """
+        self.rows += 1
+        for index, value in enumerate(values):
+            self.fields[index] = (self.fields[index] + hash(value)) & CHECKSUM_MASK
+
+    def differing_fields(self, other):
+        """
+        differing_fields compares two sets of checksums
+
+        @param other - the OplogChecksum to compare against
+        @return fields - the API names of the fields whose checksums differ
+        """
+        return [
+            name for (name, _), mine, theirs in zip(ENTRY_COLUMNS, self.fields, other.fields)
+            if mine != theirs
+        ]
+
+class OplogVerifier:
+    """
+    OplogVerifier compares the entries of an oplog against the file they were imported
+    from. The file is read first, and the content hash of every row is counted, as in
+    oplog_dedup. Entries fetched from Ghostwriter are then matched against those counts
+    page by page, as they arrive, so only the hashes of the file are held in memory.
+    Rows left unmatched are missing from the oplog, and entries without a matching row
+    are unexpected. Entries that were changed in transit show up as both. A file imported
+    with --dedup is expected in the oplog once per distinct row.
+    """
+
+    def __init__(self, max_reported=10, distinct=False):
+        """
+        @param max_reported - the most missing rows and unexpected entries kept as examples
+        @param distinct - whether rows repeating an earlier row of the file were skipped by
+                          the import, so each distinct row is expected once
+        """
+        self.max_reported = max_reported
+        self.distinct = distinct
+        self.expected = Counter()
+        self.source = OplogChecksum()
+        self.oplog = OplogChecksum()
+        self.unreadable = 0
+        self.repeated = 0
+        self.unexpected = 0
+        self.unexpected_entries = []
+        self.pages = 0
+        self.page_latencies = []
+        self.fetch_seconds = 0.0
+
+    def add_source_records(self, fieldnames, oplog_records):
+        """
+        add_source_records counts the rows of the oplog file
+
+        @param fieldnames - the field names of the file
+        @param oplog_records - an iterable of (record, end_offset) pairs
+        """
+        get_values = oplog_dedup.compile_record_values(fieldnames)
+        for record, _ in oplog_records:
+            values = get_values(record)
+            if values is None:
+                self.unreadable += 1
+                continue
+            values = oplog_dedup.normalize_entry(values)
+            digest = oplog_dedup.normalized_digest(values)
+            if self.distinct and digest in self.expected:
+                self.repeated += 1
+                continue
+            self.source.add(values)
+            self.expected[digest] += 1
+
+    def add_entries(self, entries):
+        """
+        add_entries matches a page of entries fetched from Ghostwriter against the file
+
+        @param entries - a list of oplogEntry dictionaries, with their IDs
+        """
+        self.pages += 1
+        for entry in entries:
+            values = oplog_dedup.normalize_entry([entry.get(name) for name, _ in ENTRY_COLUMNS])
+            self.oplog.add(values)
+            digest = oplog_dedup.normalized_digest(values)
+            remaining = self.expected.get(digest, 0)
+            if remaining > 1:
+                self.expected[digest] = remaining - 1
+            elif remaining == 1:
+                del self.expected[digest]
+            else:
+                self.unexpected += 1
+                if len(self.unexpected_entries) < self.max_reported:
+                    self.unexpected_entries.append(entry)
+
+    @property
+    def missing(self):
+        """The number of rows of the file not found in the oplog"""
+        return sum(self.expected.values())
+
+    def find_missing_records(self, fieldnames, oplog_records):
+        """
+        find_missing_records reads the file again for examples of the rows missing from
+        the oplog
+
+        @param fieldnames - the field names of the file
+        @param oplog_records - an iterable of (record, end_offset) pairs
+        @return missing - up to max_reported (values, end_offset) pairs, with each row's
+                          values in the order of ENTRY_COLUMNS
+        """
+        remaining = Counter(self.expected)
+        get_values = oplog_dedup.compile_record_values(fieldnames)
+        missing = []
+        for record, end_offset in oplog_records:
+            if len(missing) >= self.max_reported or not remaining:
+                break
+            values = get_values(record)
+            if values is None:
+                continue
+            digest = oplog_dedup.entry_digest(values)
+            if remaining.get(digest, 0) > 0:
+                remaining[digest] -= 1
+                if not remaining[digest]:
+                    del remaining[digest]
+                missing.append((values, end_offset))
+        return missing
+
+    def summary(self):
+        """
+        summary reports the outcome of the verification and the throughput of the fetch
+
+        @return summary - a dictionary of counts, differing fields, and fetch statistics
+        """
+        return {
+            "file_rows": self.source.rows,
+            "unreadable_rows": self.unreadable,
+            "repeated_rows": self.repeated,
+            "oplog_entries": self.oplog.rows,
+            "matched": self.oplog.rows - self.unexpected,
+            "missing": self.missing,
+            "unexpected": self.unexpected,
+            "differing_fields": self.source.differing_fields(self.oplog),
+            "pages": self.pages,
+            "fetch_seconds": self.fetch_seconds,
+            "entries_per_second": (
+                self.oplog.rows / self.fetch_seconds if self.fetch_seconds else 0.0
+            ),
+            "page_latency": oplog_replay.latency_percentiles(self.page_latencies)
+        }
+
+    @property
+    def verified(self):
+        """Whether every row of the file, and nothing else, is in the oplog"""
+        return not self.unreadable and not self.missing and not self.unexpected
+
+# Function definitions
+def pair_mismatches(missing, unexpected_entries):
+    """
+    pair_mismatches matches examples of missing rows with unexpected entries that hold
+    mostly the same values, which are most likely the same entry changed in transit
+
+    @param missing - (values, end_offset) pairs returned by find_missing_records
+    @param unexpected_entries - oplogEntry dictionaries without a matching row
+    @return (pairs, missing, unexpected_entries) - a list of (end_offset, entry, fields)
+                                                   tuples naming the fields that differ,
+                                                   and the examples left unpaired
+    """
+    pairs = []
+    unpaired = list(unexpected_entries)
+    left = []
+    for values, end_offset in missing:
+        normalized = oplog_dedup.normalize_entry(values)
+        best = None
+        for entry in unpaired:
+            entry_values = oplog_dedup.normalize_entry(
+                [entry.get(name) for name, _ in ENTRY_COLUMNS]
+            )
+            fields = [
+                name for (name, _), mine, theirs in zip(ENTRY_COLUMNS, normalized, entry_values)
+                if mine != theirs
+            ]
+            if len(fields) * 2 > len(ENTRY_COLUMNS):
+                continue
+            if best is None or len(fields) < len(best[1]):
+                best = (entry, fields)
+        if best is None:
+            left.append((values, end_offset))
+            continue
+        unpaired.remove(best[0])
+        pairs.append((end_offset, best[0], best[1]))
+    return pairs, left, unpaired
+
+def print_verify_report(verifier, missing=()):
+    """
+    print_verify_report reports the outcome of a verification
+
+    @param verifier - the OplogVerifier that compared the oplog against the file
+    @param missing - examples of missing rows returned by find_missing_records
+    """
+    summary = verifier.summary()
+    print(
+        f"Fetched {summary['oplog_entries']} entries in {summary['pages']} pages over "
+        f"{summary['fetch_seconds']:.1f}s ({summary['entries_per_second']:.1f} entries/s)"
+    )
+    print(f"Page latency: {oplog_replay.format_latencies(summary['page_latency'])}")
+    print(
+        f"File rows: {summary['file_rows']}, oplog entries: {summary['oplog_entries']}, "
+        f"matched: {summary['matched']}, missing: {summary['missing']}, "
+        f"unexpected: {summary['unexpected']}"
+    )
+    if summary["unreadable_rows"]:
+        print(f"Unreadable rows: {summary['unreadable_rows']} rows are missing fields")
+    if summary["repeated_rows"]:
+        print(
+            f"Repeated rows: {summary['repeated_rows']} rows repeat an earlier row, "
+            f"and are expected once"
+        )
+    # Checksums of sets of different sizes differ in every field
+    if summary["differing_fields"] and summary["file_rows"] == summary["oplog_entries"]:
+        print(f"Checksums differ for: {', '.join(summary['differing_fields'])}")
+
+    pairs, missing, unexpected_entries = pair_mismatches(missing, verifier.unexpected_entries)
+    for end_offset, entry, fields in pairs:
+        print(
+            f"Mismatched: entry {entry['id']} differs from the row ending at position "
+            f"{end_offset} in {', '.join(fields)}"
+        )
+    for values, end_offset in missing:
+        row = dict(zip((name for name, _ in ENTRY_COLUMNS), values))
+        print(
+            f"Missing: the row ending at position {end_offset} "
+            f"({row['startDate']}, {row['command']!r})"
+        )
+    for entry in unexpected_entries:
+        print(
+            f"Unexpected: entry {entry['id']} "
+            f"({entry.get('startDate')}, {entry.get('command')!r})"
+        )
+
+    print("Verified: the oplog matches the file" if verifier.verified else "Verification Failed")
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+
+from types import SimpleNamespace
+
+import pytest
+
+import oplog_auth
+import oplog_batching
+import oplog_checkpoint
+import oplog_emulator
+import oplog_generator
+import oplog_populate
+
+from oplog_populate import OplogBatch
+
+ENTRIES = 5000
+
+def make_batch(index, start_offset, end_offset, entries=10):
+    return OplogBatch(
+        index,
+        [{}] * entries,
+        str(index),
+        str(index),
+        end_offset,
+        [str(index)] * entries,
+        start_offset
+    )
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "oplog.csv"
+    oplog_generator.generate_oplog(path, ENTRIES, seed=7)
+    return path
+
+@pytest.fixture
+def emulator():
+    server = oplog_emulator.EmulatorServer(oplog_emulator.EmulatorConfig(require_auth=False))
+    server.start()
+    yield server
+    server.stop()
+
+def test_out_of_order_commits_resume_past_every_committed_range(csv_path):
+    journal = oplog_checkpoint.start_checkpoint(csv_path, 1)
+    journal.record(make_batch(0, 0, 100), 10)
+    journal.record(make_batch(2, 200, 300), 10)
+    journal.record(make_batch(3, 300, 400), 10)
+
+    journal = oplog_checkpoint.load_checkpoint(csv_path)
+    assert journal.end_offset == 100
+    assert journal.next_batch == 4
+    assert journal.rows == 30
+    committed = journal.committed_filter()
+    assert [committed(offset) for offset in (150, 200, 201, 400, 401)] == [
+        False, False, True, True, False
+    ]
+
+    # Filling the gap merges the ranges into one leading run
+    journal.record(make_batch(1, 100, 200), 10)
+    assert journal.end_offset == 400
+    assert journal.committed_filter() is None
+
+def test_torn_journal_line_is_ignored(csv_path):
+    journal = oplog_checkpoint.start_checkpoint(csv_path, 1)
+    journal.record(make_batch(0, 0, 100), 10)
+    with open(journal.path, "a") as journal_file:
+        journal_file.write('{"batch": 1, "first_ent')
+
+    journal = oplog_checkpoint.load_checkpoint(csv_path)
+    assert journal.end_offset == 100
+    assert journal.rows == 10
+
+def test_stale_journal_is_discarded(csv_path):
+    journal = oplog_checkpoint.start_checkpoint(csv_path, 1)
+    journal.record(make_batch(0, 0, 100), 10)
+    stat = csv_path.stat()
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert oplog_checkpoint.load_checkpoint(csv_path) is None
+    assert not journal.path.exists()
+
+def test_legacy_journal_without_start_offsets(csv_path):
+    journal = oplog_checkpoint.start_checkpoint(csv_path, 1)
+    for index, end_offset in enumerate((100, 200)):
+        oplog_checkpoint.write_journal_line(journal.path, {
+            "batch": index,
+            "first_entry": str(index),
+            "last_entry": str(index),
+            "end_offset": end_offset,
+            "rows": 10,
+            "rejected": 0
+        })
+
+    journal = oplog_checkpoint.load_checkpoint(csv_path)
+    assert journal.end_offset == 200
+    assert journal.next_batch == 2
+    assert journal.committed_filter() is None
+
+def test_killed_concurrent_import_resumes_without_duplicates(csv_path, emulator, monkeypatch):
+    credentials = SimpleNamespace(url=emulator.url, username="admin")
+    token_refresher = oplog_auth.TokenRefresher("token", lambda: "token")
+    populate_configs = oplog_populate.PopulateConfig(100, 4, 2, "skip")
+    batching_configs = oplog_batching.BatchingConfig(adaptive=False)
+    insert_oplog_batch_async = oplog_populate.insert_oplog_batch_async
+
+    async def interrupted_insert(gql_session, batch, *args):
+        # Batch 15 hangs and then fails, while the batches after it commit
+        if batch.index == 15:
+            await asyncio.sleep(0.2)
+            raise RuntimeError("killed")
+        return await insert_oplog_batch_async(gql_session, batch, *args)
+
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", interrupted_insert)
+    with pytest.raises(RuntimeError):
+        asyncio.run(oplog_populate.upload_oplog_async(
+            credentials, token_refresher, 1, populate_configs,
+            batching_configs=batching_configs, csv_path=csv_path
+        ))
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", insert_oplog_batch_async)
+
+    journal = oplog_checkpoint.load_checkpoint(csv_path)
+    committed = len(emulator.emulator.tables["oplogEntry"])
+    assert journal.rows == committed
+    assert journal.committed_filter() is not None
+
+    asyncio.run(oplog_populate.upload_oplog_async(
+        credentials, token_refresher, 1, populate_configs, journal,
+        batching_configs=batching_configs, csv_path=csv_path
+    ))
+
+    rows = emulator.emulator.tables["oplogEntry"]
+    assert len(rows) == ENTRIES
+    contents = {json.dumps({**row, "id": None}, sort_keys=True, default=str) for row in rows}
+    assert len(contents) == ENTRIES
+    assert not oplog_checkpoint.journal_path(csv_path).exists()
@@ -0,0 +1,71 @@
+import pytest
+
+import oplog_batching
+import oplog_columnar
+import oplog_populate
+
+from oplog_populate import OPLOG_ENTRY_FIELDS
+
+def read_all(path):
+    columnar_file = oplog_columnar.ColumnarFile(path)
+    try:
+        fieldnames, records = columnar_file.read_records()
+        return fieldnames, list(records)
+    finally:
+        columnar_file.close()
+
+def test_rows_round_trip(tmp_path):
+    path = tmp_path / "oplog.oplogc"
+    # "tool" repeats, so it is dictionary encoded; "command" never does, so it is plain
+    stripes = [
+        [["nmap", f"command {row} ✓"] for row in range(stripe * 10, stripe * 10 + 10)]
+        for stripe in range(3)
+    ]
+    with oplog_columnar.ColumnarWriter(path, ["tool", "command"]) as writer:
+        for rows in stripes:
+            writer.writerows(rows)
+
+    fieldnames, records = read_all(path)
+    assert fieldnames == ["tool", "command"]
+    assert records == [(row, number) for number, row in enumerate(sum(stripes, []), 1)]
+    assert writer.plain_columns == [False, True]
+
+def test_reading_from_a_row_skips_the_rows_before_it(tmp_path):
+    path = tmp_path / "oplog.oplogc"
+    with oplog_columnar.ColumnarWriter(path, ["value"]) as writer:
+        for stripe in range(4):
+            writer.writerows([[str(row)] for row in range(stripe * 5, stripe * 5 + 5)])
+
+    columnar_file = oplog_columnar.ColumnarFile(path)
+    try:
+        _, records = columnar_file.read_records(12)
+        assert [record for record, _ in records] == [[str(row)] for row in range(12, 20)]
+    finally:
+        columnar_file.close()
+
+def test_missing_values_are_not_read_back_as_empty_strings(tmp_path):
+    path = tmp_path / "oplog.oplogc"
+    rows = [["a", f"plain {row}"] for row in range(10)]
+    rows[3] = [None, ""]
+    rows[6] = ["", None]
+    with oplog_columnar.ColumnarWriter(path, ["tool", "command"]) as writer:
+        writer.writerows(rows)
+
+    _, records = read_all(path)
+    assert [record for record, _ in records] == rows
+
+def test_row_with_a_missing_field_fails_validation(tmp_path):
+    path = tmp_path / "oplog.oplogc"
+    row = {field: "x" for field in OPLOG_ENTRY_FIELDS}
+    with oplog_columnar.ColumnarWriter(path, list(row)) as writer:
+        writer.writerows([list(row.values()), [*list(row.values())[:-1], None]])
+
+    oplog_file = oplog_populate.open_oplog_file(path)
+    try:
+        batches = oplog_populate.read_oplog_batches(
+            oplog_file, 1, oplog_batching.BatchSizer(10)
+        )
+        with pytest.raises(oplog_populate.OplogEntryError, match="missing"):
+            list(batches)
+    finally:
+        oplog_file.close()
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+import oplog_populate
+
+from oplog_populate import OplogBatch
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+def make_batches(count):
+    return [OplogBatch(index, [{"index": index}], str(index), str(index), index) for index in range(count)]
+
+async def collect(inserted):
+    return [(batch.index, entry_ids) async for batch, entry_ids in inserted]
+
+def test_results_are_yielded_in_batch_order(monkeypatch):
+    async def insert(gql_session, batch, *args):
+        # Later batches finish first
+        await asyncio.sleep(0.01 * (5 - batch.index % 5))
+        return [batch.index]
+
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", insert)
+    inserted = oplog_populate.insert_oplog_batches_async(None, iterate(make_batches(12)), 4)
+    results = asyncio.run(collect(inserted))
+    assert results == [(index, [index]) for index in range(12)]
+
+def test_failure_behind_a_slow_batch_cancels_the_rest(monkeypatch):
+    started = []
+    cancelled = []
+
+    async def insert(gql_session, batch, *args):
+        started.append(batch.index)
+        try:
+            if batch.index == 0:
+                await asyncio.sleep(5)
+            if batch.index == 1:
+                raise RuntimeError("batch 1 failed")
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(batch.index)
+            raise
+        return [batch.index]
+
+    async def slow_batches():
+        for batch in make_batches(100):
+            yield batch
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", insert)
+    inserted = oplog_populate.insert_oplog_batches_async(None, slow_batches(), 4)
+
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="batch 1 failed"):
+        asyncio.run(collect(inserted))
+
+    # The error surfaces long before the head batch would have finished
+    assert time.monotonic() - start < 1
+    assert 0 in cancelled
+    assert max(started) <= 2
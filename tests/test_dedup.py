@@ -0,0 +1,10 @@
+import oplog_dedup
+
+def test_rows_in_the_oplog_and_repeated_rows_are_counted_apart(tmp_path):
+    dedup_index = oplog_dedup.DedupIndex(tmp_path / "oplog.idx", digests={1, 2})
+
+    skipped = [dedup_index.skip_digest(digest) for digest in (1, 3, 3, 2, 4, 3)]
+
+    assert skipped == [True, False, True, True, False, True]
+    assert dedup_index.skipped == 2
+    assert dedup_index.repeated == 2
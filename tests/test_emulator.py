@@ -0,0 +1,14 @@
+import socket
+
+import pytest
+
+import oplog_emulator
+
+def test_emulator_that_cannot_bind_raises_emulator_error():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        config = oplog_emulator.EmulatorConfig(port=listener.getsockname()[1])
+
+        with pytest.raises(oplog_emulator.EmulatorError, match="address already in use"):
+            oplog_emulator.start_emulator_process(config)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from types import SimpleNamespace
+
+import pytest
+
+import oplog_auth
+import oplog_batching
+import oplog_emulator
+import oplog_follow
+import oplog_generator
+import oplog_populate
+
+ENTRIES = 1000
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "oplog.csv"
+    oplog_generator.generate_oplog(path, ENTRIES, seed=7)
+    return path
+
+@pytest.fixture
+def emulator():
+    server = oplog_emulator.EmulatorServer(oplog_emulator.EmulatorConfig(require_auth=False))
+    server.start()
+    yield server
+    server.stop()
+
+def test_out_of_order_commits_extend_the_committed_run(tmp_path):
+    state = oplog_follow.FollowState(tmp_path / "oplog.csv.follow", 1, end_offset=10)
+    state.commit(200, 300, 10)
+    state.commit(400, 500, 10)
+    assert (state.end_offset, state.ranges) == (10, [(200, 300), (400, 500)])
+    assert state.committed_end == 500
+
+    state.commit(10, 200, 10)
+    assert (state.end_offset, state.ranges) == (300, [(400, 500)])
+
+    state = oplog_follow.load_follow_state(tmp_path / "oplog.csv", 1)
+    assert state.rows == 30
+    committed = state.committed_filter()
+    assert [committed(offset) for offset in (350, 400, 401, 500, 501)] == [
+        False, False, True, True, False
+    ]
+
+def test_failed_head_batch_resumes_without_duplicates(csv_path, emulator, monkeypatch):
+    credentials = SimpleNamespace(url=emulator.url, username="admin")
+    token_refresher = oplog_auth.TokenRefresher("token", lambda: "token")
+    populate_configs = oplog_populate.PopulateConfig(100, 2, 2, "skip")
+    batching_configs = oplog_batching.BatchingConfig(adaptive=False)
+    follow_configs = oplog_follow.FollowConfig(poll_interval=0.1)
+    insert_oplog_batch_async = oplog_populate.insert_oplog_batch_async
+    rows = emulator.emulator.tables["oplogEntry"]
+
+    inserted = []
+
+    async def stalled_insert(gql_session, batch, *args):
+        # Batch 0 stalls while batch 1 commits, and then fails; later batches wait until
+        # they are cancelled, so none of them is left half-sent
+        if batch.index == 0:
+            while 1 not in inserted:
+                await asyncio.sleep(0.01)
+            raise RuntimeError("killed")
+        if batch.index > 1:
+            await asyncio.Event().wait()
+        entry_ids = await insert_oplog_batch_async(gql_session, batch, *args)
+        inserted.append(batch.index)
+        return entry_ids
+
+    def follow():
+        return oplog_populate.upload_oplog_async(
+            credentials, token_refresher, 1, populate_configs,
+            batching_configs=batching_configs, csv_path=csv_path,
+            follow_configs=follow_configs
+        )
+
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", stalled_insert)
+    with pytest.raises(RuntimeError):
+        asyncio.run(follow())
+    monkeypatch.setattr(oplog_populate, "insert_oplog_batch_async", insert_oplog_batch_async)
+
+    state = oplog_follow.load_follow_state(csv_path, 1)
+    assert state.rows == len(rows) == 100
+    assert state.committed_filter() is not None
+
+    async def follow_until_caught_up():
+        follower = asyncio.create_task(follow())
+        for _ in range(500):
+            if len(rows) >= ENTRIES:
+                break
+            await asyncio.sleep(0.01)
+        # Let another poll run, so any rows uploaded twice would show up
+        await asyncio.sleep(0.3)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+
+    asyncio.run(follow_until_caught_up())
+
+    assert len(rows) == ENTRIES
+    contents = {json.dumps({**row, "id": None}, sort_keys=True, default=str) for row in rows}
+    assert len(contents) == ENTRIES
+    state = oplog_follow.load_follow_state(csv_path, 1)
+    assert state.ranges == []
+    assert state.end_offset == csv_path.stat().st_size
@@ -0,0 +1,66 @@
+import csv
+import json
+
+import pytest
+
+import oplog_formats
+import oplog_populate
+
+FIELDNAMES = ["entry_identifier", "command", "comments"]
+
+# Quoted fields holding commas, newlines, and escaped quotes, next to plain ones
+ROWS = [
+    [str(row), f'shell "whoami /{row}"', f"PID {row}, Callback\n{row}" if row % 3 else "none"]
+    for row in range(40)
+]
+
+@pytest.fixture(params=["\n", "\r\n"], ids=["lf", "crlf"])
+def csv_path(request, tmp_path):
+    path = tmp_path / "oplog.csv"
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator=request.param)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(ROWS)
+    return path
+
+@pytest.fixture
+def json_lines_path(tmp_path):
+    path = tmp_path / "oplog.jsonl"
+    with open(path, "w") as json_file:
+        for row in ROWS:
+            json_file.write(json.dumps(dict(zip(FIELDNAMES, row))) + "\n")
+    return path
+
+def split_and_read(path, chunk_bytes, start_position=0):
+    oplog_file = oplog_populate.open_oplog_file(path)
+    try:
+        assert oplog_file.splittable
+        container = oplog_file.format.container
+        ranges = list(oplog_file.split_records(start_position, chunk_bytes))
+    finally:
+        oplog_file.close()
+
+    for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+    assert ranges[-1][1] == path.stat().st_size
+
+    records = []
+    for start, end in ranges:
+        records.extend(oplog_formats.read_record_range(path, container, FIELDNAMES, start, end))
+    return records
+
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 13, 64, 1 << 20])
+def test_csv_ranges_end_on_record_boundaries(csv_path, chunk_bytes):
+    records = split_and_read(csv_path, chunk_bytes)
+    assert [record for record, _ in records] == ROWS
+    assert records[-1][1] == csv_path.stat().st_size
+
+@pytest.mark.parametrize("chunk_bytes", [1, 13, 1 << 20])
+def test_json_lines_ranges_end_on_record_boundaries(json_lines_path, chunk_bytes):
+    records = split_and_read(json_lines_path, chunk_bytes)
+    assert [record for record, _ in records] == ROWS
+
+def test_split_from_a_record_offset(csv_path):
+    records = split_and_read(csv_path, 10)
+    resume_offset = records[9][1]
+    assert [record for record, _ in split_and_read(csv_path, 10, resume_offset)] == ROWS[10:]
@@ -0,0 +1,92 @@
+import json
+import random
+
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import oplog_generator
+
+from oplog_generator import AliasTable
+
+CATALOG_PATH = Path(__file__).resolve().parent.parent / "config/tool_catalog.json"
+
+def table_probabilities(table):
+    # Each slot is drawn with probability 1 / count, and splits it between item and alias
+    count = len(table.items)
+    probabilities = Counter()
+    for index, cutoff in enumerate(table.cutoffs):
+        own = cutoff - index
+        probabilities[table.items[index]] += own / count
+        probabilities[table.aliases[index]] += (1 - own) / count
+    return probabilities
+
+@pytest.mark.parametrize("weights", [
+    [1],
+    [1, 1, 1, 1],
+    [70, 20, 10],
+    [0.001, 5, 0, 1000, 3],
+    [random.Random(seed).random() for seed in range(50)]
+])
+def test_alias_table_matches_its_weights(weights):
+    items = [f"item {index}" for index in range(len(weights))]
+    probabilities = table_probabilities(AliasTable(items, weights))
+    total = sum(weights)
+    for item, weight in zip(items, weights):
+        assert probabilities[item] == pytest.approx(weight / total, abs=1e-12)
+
+def test_alias_table_never_draws_zero_weights():
+    table = AliasTable(["a", "b", "c"], [0, 3, 1])
+    draws = Counter(table.sample(random.Random(1), 40000))
+    assert "a" not in draws
+    assert draws["b"] / 40000 == pytest.approx(0.75, abs=0.01)
+
+def test_alias_table_draws_are_seeded():
+    table = AliasTable(["a", "b", "c"], [1, 2, 3])
+    assert table.sample(random.Random(5), 100) == table.sample(random.Random(5), 100)
+
+def test_sample_catalog_loads():
+    catalog, tool_weights, start_times = oplog_generator.load_tool_catalog(CATALOG_PATH)
+    assert set(catalog) == set(tool_weights)
+    assert len(start_times.hour_weights) == 24
+
+@pytest.mark.parametrize("document, message", [
+    ({"tools": [{"name": "nmap"}]}, "not a valid tool catalog"),
+    ({"tools": [{"name": "nmap", "weight": -1, "commands": [{"command": "nmap"}]}]}, "negative"),
+    ({"tools": [{"name": "nmap", "weight": 0, "commands": [{"command": "nmap"}]}]}, "positive"),
+])
+def test_invalid_catalogs_raise_catalog_error(tmp_path, document, message):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(document))
+    with pytest.raises(oplog_generator.CatalogError, match=message):
+        oplog_generator.load_tool_catalog(path)
+
+def test_seeded_gzip_oplogs_are_byte_identical(tmp_path):
+    first, second = tmp_path / "first.csv.gz", tmp_path / "second.csv.gz"
+    oplog_generator.generate_oplog(first, 200, seed=7)
+    oplog_generator.generate_oplog(second, 200, seed=7)
+    assert first.read_bytes() == second.read_bytes()
+
+def test_bursty_start_times_are_not_clamped_to_the_project():
+    # A project of a few hours starting and ending mid-hour, with sessions far longer
+    # than it, so clamping would pile many start dates onto its bounds
+    project_start, now = 1_000_000_000.5 + 1800, 1_000_000_000.5 + 4 * 3600 + 600
+    start_times = oplog_generator.StartTimeConfig(
+        oplog_generator.BURSTY,
+        session_entries=200,
+        mean_gap=120
+    )
+    pools = SimpleNamespace(
+        start_times=start_times,
+        start_hours=oplog_generator.build_start_hours(start_times, project_start, now),
+        project_start=project_start,
+        now=now
+    )
+    draws = oplog_generator.draw_start_times(random.Random(3), 20000, pools)
+    assert len(draws) == 20000
+    assert all(int(project_start) <= draw <= now for draw in draws)
+    counts = Counter(draws)
+    assert counts[int(project_start)] < 5
+    assert counts[int(now)] < 5
@@ -0,0 +1,34 @@
+import sys
+
+import pytest
+
+import oplog_populate
+
+from oplog_populate import OplogBatch
+
+def make_batch(entries):
+    return OplogBatch(0, [{}] * entries, "a", "b", 0, ["a"] * entries)
+
+def test_contiguous_ids_are_printed_as_a_range(capsys):
+    oplog_populate.print_oplog_batch(make_batch(3), ["7", "8", "9"])
+    assert capsys.readouterr().out == "Batch 0: inserted 3 entries (IDs 7-9)\n"
+
+def test_interleaved_ids_are_printed_as_a_count(capsys):
+    oplog_populate.print_oplog_batch(make_batch(5), ["1", "2", "5", "6", "7"])
+    assert capsys.readouterr().out == "Batch 0: inserted 5 entries\n"
+
+def test_rejected_entries_are_counted(capsys):
+    oplog_populate.print_oplog_batch(make_batch(3), [])
+    assert capsys.readouterr().out == "Batch 0: inserted 0 entries, rejected 3\n"
+
+def test_replay_and_follow_are_mutually_exclusive(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["oplog_populate.py", "--replay", "--follow"])
+    with pytest.raises(SystemExit):
+        oplog_populate.parse_arguments()
+    assert "not allowed with argument" in capsys.readouterr().err
+
+def test_verify_is_rejected_with_follow(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["oplog_populate.py", "--follow", "--verify"])
+    with pytest.raises(SystemExit):
+        oplog_populate.parse_arguments()
+    assert "--verify cannot be used with --follow" in capsys.readouterr().err
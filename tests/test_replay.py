@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+import oplog_replay
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(oplog_replay.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(oplog_replay.asyncio, "sleep", clock.sleep)
+    return clock
+
+def acquire_all(bucket, *tokens):
+    async def acquire():
+        for count in tokens:
+            await bucket.acquire(count)
+    asyncio.run(acquire())
+
+def test_bucket_sends_a_burst_of_capacity_without_waiting(clock):
+    bucket = oplog_replay.TokenBucket(rate=10, capacity=5)
+    acquire_all(bucket, *[1] * 5)
+    assert clock.sleeps == []
+
+def test_bucket_paces_entries_past_the_burst_to_its_rate(clock):
+    bucket = oplog_replay.TokenBucket(rate=10, capacity=5)
+    acquire_all(bucket, *[1] * 8)
+    # Without time passing, each entry past the burst waits for one more refill
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.3])
+
+def test_large_request_leaves_the_bucket_in_debt(clock):
+    bucket = oplog_replay.TokenBucket(rate=10, capacity=5)
+    acquire_all(bucket, 15)
+    assert clock.sleeps == pytest.approx([1.0])
+
+    clock.now += 1.0
+    acquire_all(bucket, 1)
+    assert clock.sleeps == pytest.approx([1.0, 0.1])
+
+def test_refill_stops_at_capacity(clock):
+    bucket = oplog_replay.TokenBucket(rate=10, capacity=5)
+    acquire_all(bucket, 5)
+    clock.now += 60
+    acquire_all(bucket, 5, 1)
+    assert clock.sleeps == pytest.approx([0.1])
+
+def test_start_times_are_spaced_in_utc_across_a_dst_change(monkeypatch):
+    # US clocks sprang forward at 2024-03-10 02:00 local time, 07:00 UTC
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        before = oplog_replay.parse_start_time("2024-03-10 01:30:00")
+        after = oplog_replay.parse_start_time("2024-03-10 03:30:00")
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert after - before == 2 * 3600
+    assert oplog_replay.parse_start_time("2024-03-10 07:00:00+00:00") == pytest.approx(
+        oplog_replay.parse_start_time("2024-03-10 07:00:00")
+    )
@@ -0,0 +1,53 @@
+import asyncio
+import socket
+import threading
+
+from types import SimpleNamespace
+
+import pytest
+
+import oplog_auth
+import oplog_emulator
+import oplog_generator
+import oplog_populate
+import oplog_schema
+
+@pytest.fixture
+def emulator():
+    server = oplog_emulator.EmulatorServer(oplog_emulator.EmulatorConfig(require_auth=False))
+    server.start()
+    yield server
+    server.stop()
+
+def test_introspection_times_out():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        url = f"http://127.0.0.1:{listener.getsockname()[1]}/v1/graphql"
+
+        with pytest.raises(TimeoutError):
+            oplog_schema.fetch_introspection(url, timeout=0.2)
+
+def test_cached_schema_is_fetched_off_the_event_loop(emulator, tmp_path, monkeypatch):
+    monkeypatch.setattr(oplog_schema, "SCHEMA_CACHE_DIR", tmp_path / "schema_cache")
+    fetch_introspection = oplog_schema.fetch_introspection
+    threads = []
+
+    def recording_fetch(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return fetch_introspection(*args, **kwargs)
+
+    monkeypatch.setattr(oplog_schema, "fetch_introspection", recording_fetch)
+    csv_path = tmp_path / "oplog.csv"
+    oplog_generator.generate_oplog(csv_path, 100, seed=5)
+
+    inserted = asyncio.run(oplog_populate.upload_oplog_async(
+        SimpleNamespace(url=emulator.url, username="admin"),
+        oplog_auth.TokenRefresher("token", lambda: "token"),
+        1,
+        oplog_populate.PopulateConfig(50, 2, 2, oplog_schema.SCHEMA_CACHE),
+        csv_path=csv_path
+    ))
+
+    assert inserted == 100
+    assert threads and threading.main_thread() not in threads
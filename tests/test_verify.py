@@ -0,0 +1,117 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+import oplog_auth
+import oplog_batching
+import oplog_dedup
+import oplog_emulator
+import oplog_generator
+import oplog_populate
+import oplog_verify
+
+from oplog_transport import ENTRY_COLUMNS
+
+@pytest.fixture
+def emulator():
+    server = oplog_emulator.EmulatorServer(oplog_emulator.EmulatorConfig(require_auth=False))
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def repeated_csv_path(tmp_path):
+    # 200 generated rows, followed by the first 20 of them again
+    path = tmp_path / "oplog.csv"
+    oplog_generator.generate_oplog(path, 200, seed=3)
+    with open(path, newline="") as oplog_file:
+        lines = oplog_file.readlines()
+    with open(path, "a", newline="") as oplog_file:
+        oplog_file.writelines(lines[1:21])
+    return path
+
+def source_records(rows):
+    fieldnames = [column for _, column in ENTRY_COLUMNS]
+    return fieldnames, ((list(row), index) for index, row in enumerate(rows))
+
+def test_repeated_rows_are_expected_once_when_distinct():
+    names = [name for name, _ in ENTRY_COLUMNS]
+    rows = [["2024-01-01 00:00:00"] + [str(index)] * (len(names) - 1) for index in range(3)]
+    entries = [dict(zip(names, row), id=index) for index, row in enumerate(rows)]
+
+    verifier = oplog_verify.OplogVerifier()
+    verifier.add_source_records(*source_records(rows + rows[:1]))
+    verifier.add_entries(entries)
+    assert verifier.missing == 1
+    assert not verifier.verified
+
+    verifier = oplog_verify.OplogVerifier(distinct=True)
+    verifier.add_source_records(*source_records(rows + rows[:1]))
+    verifier.add_entries(entries)
+    assert verifier.repeated == 1
+    assert verifier.verified
+
+def test_dedup_import_verifies(repeated_csv_path, emulator, tmp_path):
+    credentials = SimpleNamespace(url=emulator.url, username="admin")
+    token_refresher = oplog_auth.TokenRefresher("token", lambda: "token")
+    populate_configs = oplog_populate.PopulateConfig(50, 4, 2, "skip")
+    dedup_index = oplog_dedup.DedupIndex(tmp_path / "oplog.idx")
+
+    inserted = asyncio.run(oplog_populate.upload_oplog_async(
+        credentials,
+        token_refresher,
+        1,
+        populate_configs,
+        csv_path=repeated_csv_path,
+        dedup_index=dedup_index
+    ))
+    assert inserted == 200
+    assert dedup_index.repeated == 20
+
+    assert asyncio.run(oplog_populate.verify_oplog_async(
+        credentials, token_refresher, 1, populate_configs,
+        csv_path=repeated_csv_path, distinct=True
+    ))
+    assert not asyncio.run(oplog_populate.verify_oplog_async(
+        credentials, token_refresher, 1, populate_configs, csv_path=repeated_csv_path
+    ))
+
+def test_page_queries_are_retried(repeated_csv_path, emulator):
+    credentials = SimpleNamespace(url=emulator.url, username="admin")
+    token_refresher = oplog_auth.TokenRefresher("token", lambda: "token")
+    populate_configs = oplog_populate.PopulateConfig(50, 4, 2, "skip")
+    asyncio.run(oplog_populate.upload_oplog_async(
+        credentials, token_refresher, 1, populate_configs, csv_path=repeated_csv_path
+    ))
+
+    emulator.emulator.config.error_rate = 0.3
+    assert asyncio.run(oplog_populate.verify_oplog_async(
+        credentials,
+        token_refresher,
+        1,
+        populate_configs,
+        oplog_verify.VerifyConfig(page_size=20),
+        repeated_csv_path,
+        batching_configs=oplog_batching.BatchingConfig(max_retries=20, backoff=0.01)
+    ))
+    assert emulator.emulator.stats["injected_errors"] > 0
+
+def test_page_query_backoff_starts_over_after_a_success():
+    batch_sizer = oplog_batching.BatchSizer(10, oplog_batching.BatchingConfig(backoff=0.001))
+    calls = []
+
+    class FlakySession:
+        async def execute(self, document, variable_values=None, extra_args=None):
+            calls.append(document)
+            if len(calls) % 2:
+                raise oplog_populate.TransportServerError("Injected error", 503)
+            return {"oplogEntry": []}
+
+    for _ in range(3):
+        asyncio.run(oplog_populate.execute_page_query_async(
+            FlakySession(), "query", {}, batch_sizer=batch_sizer
+        ))
+    assert len(calls) == 6
+    assert batch_sizer.failures == 0